@@ -1,11 +1,9 @@
-from sentence_transformers import SentenceTransformer
+import model_registry
 
-# Load pre-trained semantic model
-model = SentenceTransformer("all-MiniLM-L6-v2")
 
 def generate_embedding(text):
     if not text.strip():
         return None
 
-    embedding = model.encode(text)
+    embedding = model_registry.encode(text)
     return embedding.tolist()
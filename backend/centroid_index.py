@@ -0,0 +1,101 @@
+import threading
+
+import numpy as np
+
+INITIAL_CAPACITY = 64
+
+
+class CentroidIndex:
+    """
+    Normalized centroid matrix kept alongside storage.
+
+    Row i holds the L2-normalized centroid of cluster cluster_ids[i], so the
+    cosine similarity of a file against every cluster is one matrix-vector
+    product. Rows are updated in place when a centroid changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._matrix = None
+        self._rows = 0
+        self.cluster_ids = []   # row -> cluster id (int)
+        self._row_of = {}       # cluster id -> row
+
+    def rebuild(self, centroids):
+        """centroids: {cluster_id: vector}"""
+        with self._lock:
+            self._matrix = None
+            self._rows = 0
+            self.cluster_ids = []
+            self._row_of = {}
+            for cluster_id, centroid in centroids.items():
+                self.update(cluster_id, centroid)
+
+    def update(self, cluster_id, centroid):
+        """Insert or overwrite one cluster's centroid row."""
+        if centroid is None:
+            return
+        vec = np.asarray(centroid, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vec)
+        if norm:
+            vec = vec / norm
+
+        with self._lock:
+            cid = int(cluster_id)
+            row = self._row_of.get(cid)
+            if row is None:
+                if self._matrix is None:
+                    self._matrix = np.empty((INITIAL_CAPACITY, vec.shape[0]), dtype=np.float32)
+                if self._rows == self._matrix.shape[0]:
+                    grown = np.empty((self._rows * 2, self._matrix.shape[1]), dtype=np.float32)
+                    grown[:self._rows] = self._matrix[:self._rows]
+                    self._matrix = grown
+                row = self._rows
+                self._rows += 1
+                self.cluster_ids.append(cid)
+                self._row_of[cid] = row
+            self._matrix[row] = vec
+
+    def remove(self, cluster_id):
+        """Drop a cluster by moving the last row into its slot."""
+        with self._lock:
+            cid = int(cluster_id)
+            row = self._row_of.pop(cid, None)
+            if row is None:
+                return
+            last = self._rows - 1
+            if row != last:
+                self._matrix[row] = self._matrix[last]
+                moved = self.cluster_ids[last]
+                self.cluster_ids[row] = moved
+                self._row_of[moved] = row
+            self.cluster_ids.pop()
+            self._rows -= 1
+
+    def best(self, vector):
+        """Returns (cluster_id, similarity) of the closest centroid, or (None, -1.0)."""
+        cids, sims = self.assign_many(np.asarray(vector, dtype=np.float32).reshape(1, -1))
+        return cids[0], sims[0]
+
+    def assign_many(self, vectors):
+        """
+        Places N vectors at once with a single matrix multiply.
+        Returns (cluster_ids, similarities), one entry per input row.
+        """
+        vecs = np.asarray(vectors, dtype=np.float32)
+        if vecs.ndim == 1:
+            vecs = vecs.reshape(1, -1)
+        norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vecs = vecs / norms
+
+        with self._lock:
+            if not self._rows:
+                return [None] * len(vecs), [-1.0] * len(vecs)
+            sims = vecs @ self._matrix[:self._rows].T
+            best_rows = np.argmax(sims, axis=1)
+            best_sims = sims[np.arange(len(vecs)), best_rows]
+            return [self.cluster_ids[r] for r in best_rows], [float(s) for s in best_sims]
+
+    def __len__(self):
+        return self._rows
@@ -0,0 +1,297 @@
+import threading
+
+import numpy as np
+
+# Compact the matrix once this fraction of rows belongs to removed files
+COMPACT_DEAD_RATIO = 0.25
+INITIAL_CAPACITY = 1024
+
+
+def _normalize_rows(mat):
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+
+class ChunkIndex:
+    """
+    In-memory index of every chunk embedding in storage.
+
+    All chunks live in one contiguous, L2-normalized float32 matrix. Each file
+    owns a contiguous block of rows (a "segment"), so a query is a single
+    matrix-vector product followed by a per-segment max and a top-k selection.
+    Removed files are tombstoned and the matrix is compacted lazily.
+
+    view() returns an immutable ChunkView for lock-free readers. Rows below
+    the current row count are never written in place (appends go past them,
+    growth and compaction allocate new arrays), and the tombstone mask and
+    segment lists are copied before the first in-place change after a
+    view() call, so a view stays valid for as long as a reader holds it.
+    """
+
+    def __init__(self, dim=None):
+        self.dim = dim
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._matrix = None
+        self._rows = 0
+        self._live = np.zeros(0, dtype=bool)
+        self._row_file = np.zeros(0, dtype=np.int32)  # row -> segment id
+        self._seg_starts = []
+        self._seg_files = []    # segment id -> file path (None once removed)
+        self._seg_texts = []    # segment id -> list of chunk texts
+        self._file_seg = {}     # file path -> segment id
+        self._dead_rows = 0
+        self._shared = False    # live/segment lists are referenced by a view
+
+    # -----------------------------
+    # BUILD / MUTATE
+    # -----------------------------
+
+    def rebuild(self, storage):
+        """Rebuild the whole index from the storage dict."""
+        with self._lock:
+            self._reset()
+            for cluster_data in storage.values():
+                for file_path, chunks in cluster_data["files"].items():
+                    self._append(file_path, chunks)
+
+    def add_file(self, file_path, chunks):
+        """Insert (or replace) a file's chunks."""
+        with self._lock:
+            self._remove(file_path)
+            self._append(file_path, chunks)
+            self._maybe_compact()
+
+    def remove_file(self, file_path):
+        with self._lock:
+            removed = self._remove(file_path)
+            self._maybe_compact()
+            return removed
+
+    def move_file(self, old_path, new_path):
+        """Re-key a file after it moved on disk; embeddings are untouched."""
+        with self._lock:
+            seg = self._file_seg.pop(old_path, None)
+            if seg is None:
+                return False
+            self._remove(new_path)
+            self._unshare()
+            self._file_seg[new_path] = seg
+            self._seg_files[seg] = new_path
+            return True
+
+    def _append(self, file_path, chunks):
+        embs = [c["embedding"] for c in chunks if "embedding" in c]
+        if not embs:
+            return
+        block = _normalize_rows(np.asarray(embs, dtype=np.float32))
+        n = block.shape[0]
+
+        if self._matrix is None:
+            self.dim = block.shape[1]
+            self._matrix = np.empty((max(INITIAL_CAPACITY, n), self.dim), dtype=np.float32)
+        self._ensure_capacity(self._rows + n)
+
+        start = self._rows
+        self._matrix[start:start + n] = block
+        seg = len(self._seg_files)
+        self._live[start:start + n] = True
+        self._row_file[start:start + n] = seg
+        self._rows += n
+
+        self._seg_starts.append(start)
+        self._seg_files.append(file_path)
+        self._seg_texts.append([c.get("text", "") for c in chunks if "embedding" in c])
+        self._file_seg[file_path] = seg
+
+    def _ensure_capacity(self, needed):
+        capacity = self._matrix.shape[0]
+        if needed > capacity:
+            new_capacity = max(needed, capacity * 2)
+            grown = np.empty((new_capacity, self.dim), dtype=np.float32)
+            grown[:self._rows] = self._matrix[:self._rows]
+            self._matrix = grown
+        if needed > self._live.shape[0]:
+            size = self._matrix.shape[0]
+            live = np.zeros(size, dtype=bool)
+            live[:self._rows] = self._live[:self._rows]
+            row_file = np.zeros(size, dtype=np.int32)
+            row_file[:self._rows] = self._row_file[:self._rows]
+            self._live, self._row_file = live, row_file
+
+    def _unshare(self):
+        """Copy-on-write: detach the arrays a published view still reads."""
+        if self._shared:
+            self._live = self._live.copy()
+            self._seg_files = list(self._seg_files)
+            self._seg_texts = list(self._seg_texts)
+            self._shared = False
+
+    def _remove(self, file_path):
+        seg = self._file_seg.pop(file_path, None)
+        if seg is None:
+            return False
+        self._unshare()
+        start, end = self._segment_bounds(seg)
+        self._live[start:end] = False
+        self._dead_rows += end - start
+        self._seg_files[seg] = None
+        self._seg_texts[seg] = None
+        return True
+
+    def _segment_bounds(self, seg):
+        start = self._seg_starts[seg]
+        end = self._seg_starts[seg + 1] if seg + 1 < len(self._seg_starts) else self._rows
+        return start, end
+
+    def _maybe_compact(self):
+        if self._dead_rows > COMPACT_DEAD_RATIO * max(self._rows, 1):
+            self._compact()
+
+    def _compact(self):
+        """Drop tombstoned rows and renumber segments."""
+        keep = [seg for seg, f in enumerate(self._seg_files) if f is not None]
+        if not keep:
+            dim = self.dim
+            self._reset()
+            self.dim = dim
+            return
+
+        blocks, starts, files, texts = [], [], [], []
+        rows = 0
+        for seg in keep:
+            start, end = self._segment_bounds(seg)
+            blocks.append(self._matrix[start:end])
+            starts.append(rows)
+            files.append(self._seg_files[seg])
+            texts.append(self._seg_texts[seg])
+            rows += end - start
+
+        packed = np.concatenate(blocks, axis=0)
+        self._matrix = np.empty((max(INITIAL_CAPACITY, rows), self.dim), dtype=np.float32)
+        self._matrix[:rows] = packed
+        self._live = np.zeros(self._matrix.shape[0], dtype=bool)
+        self._live[:rows] = True
+        self._row_file = np.zeros(self._matrix.shape[0], dtype=np.int32)
+        for seg, start in enumerate(starts):
+            end = starts[seg + 1] if seg + 1 < len(starts) else rows
+            self._row_file[start:end] = seg
+
+        self._rows = rows
+        self._seg_starts = starts
+        self._seg_files = files
+        self._seg_texts = texts
+        self._file_seg = {f: seg for seg, f in enumerate(files)}
+        self._dead_rows = 0
+        self._shared = False
+
+    # -----------------------------
+    # QUERY
+    # -----------------------------
+
+    def view(self):
+        """Immutable snapshot of the index for lock-free queries."""
+        with self._lock:
+            self._shared = True
+            return ChunkView(
+                self._matrix, self._rows, self._live, self._row_file,
+                self._seg_starts[:], self._seg_files, self._seg_texts,
+                len(self._seg_files), len(self._file_seg), self._dead_rows
+            )
+
+    def top_chunks(self, query_embedding, top_k=10):
+        return self.view().top_chunks(query_embedding, top_k)
+
+    def search_files(self, query_embedding, top_k=5):
+        return self.view().search_files(query_embedding, top_k)
+
+    def __len__(self):
+        return len(self._file_seg)
+
+
+class ChunkView:
+    """Read-only ChunkIndex state at one point in time (see ChunkIndex.view)."""
+
+    __slots__ = ("_matrix", "_rows", "_live", "_row_file", "_seg_starts",
+                 "_seg_files", "_seg_texts", "_n_segs", "_n_files", "_dead_rows")
+
+    def __init__(self, matrix, rows, live, row_file, seg_starts, seg_files, seg_texts,
+                 n_segs, n_files, dead_rows):
+        self._matrix = matrix
+        self._rows = rows
+        self._live = live
+        self._row_file = row_file
+        self._seg_starts = seg_starts
+        self._seg_files = seg_files
+        self._seg_texts = seg_texts
+        self._n_segs = n_segs
+        self._n_files = n_files
+        self._dead_rows = dead_rows
+
+    def _segment_bounds(self, seg):
+        start = self._seg_starts[seg]
+        end = self._seg_starts[seg + 1] if seg + 1 < self._n_segs else self._rows
+        return start, end
+
+    def _score(self, query_embedding):
+        q = np.asarray(query_embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(q)
+        if norm:
+            q = q / norm
+        scores = self._matrix[:self._rows] @ q
+        scores[~self._live[:self._rows]] = -np.inf
+        return scores
+
+    def top_chunks(self, query_embedding, top_k=10):
+        """
+        Returns [(file_path, chunk_position, similarity, chunk_text)] for the
+        top_k individual chunks, best first.
+        """
+        live = self._rows - self._dead_rows
+        if not live:
+            return []
+
+        scores = self._score(query_embedding)
+        k = min(top_k, live)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        results = []
+        for row in top:
+            seg = int(self._row_file[row])
+            pos = int(row) - self._seg_starts[seg]
+            results.append((self._seg_files[seg], pos, float(scores[row]), self._seg_texts[seg][pos]))
+        return results
+
+    def search_files(self, query_embedding, top_k=5):
+        """
+        Returns [(file_path, similarity, best_chunk_text)] for the top_k files,
+        ranked by their best-matching chunk.
+        """
+        if not self._rows or not self._n_files:
+            return []
+
+        scores = self._score(query_embedding)
+
+        # Per-file max over contiguous segments
+        starts = np.asarray(self._seg_starts, dtype=np.int64)
+        seg_max = np.maximum.reduceat(scores, starts)
+
+        k = min(top_k, self._n_files)
+        top = np.argpartition(-seg_max, k - 1)[:k]
+        top = top[np.argsort(-seg_max[top])]
+
+        results = []
+        for seg in top:
+            if not np.isfinite(seg_max[seg]):
+                continue
+            start, end = self._segment_bounds(seg)
+            best = int(np.argmax(scores[start:end]))
+            results.append((self._seg_files[seg], float(seg_max[seg]), self._seg_texts[seg][best]))
+        return results
+
+    def __len__(self):
+        return self._n_files
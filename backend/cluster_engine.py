@@ -1,18 +1,85 @@
+import functools
+import itertools
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
 import os
 import shutil
-from storage import load_storage, save_storage
-from naming_engine import generate_cluster_label
+from storage import (
+    load_storage, start_compaction, compact_storage, op_log,
+    log_add_file, log_add_tail, log_remove_file, log_move_path, log_relabel, log_centroid
+)
+from naming_engine import PLACEHOLDER_LABEL, is_placeholder, file_snippet, KeywordLabeler
+from labeling_service import LabelingService
+from chunk_index import ChunkIndex
+from section_index import SectionIndex
+from centroid_index import CentroidIndex
+from manifest import manifest
+from path_catalog import PathCatalog
+from snapshot import IndexSnapshot, cluster_view
+from event_bus import (
+    event_bus, FILE_ADDED, FILE_UPDATED, FILE_MOVED, FILE_REMOVED, CLUSTER_CREATED, CLUSTER_RELABELED
+)
+import threading
 import time
+from types import MappingProxyType
 
 SIMILARITY_THRESHOLD = 0.45  # Increased to be more selective
+STABLE_MIN_FILES = 3    # clusters this size with steady keyword labels get an LLM pass
+
+# Incremental folder sync: mutations mark clusters dirty, request_sync coalesces passes
+SYNC_DEBOUNCE = 1.0     # seconds of quiet before a requested sync runs
+SYNC_MAX_DELAY = 5.0    # upper bound on how long a request can be postponed
+dirty_clusters = set()
+dirty_folders = set()
+# Folder each cluster's files were last put in by the engine (folder renames
+# and sync moves). It can lag the label when a rename is skipped, and that
+# must not read as the user renaming the folder.
+applied_folders = {}
+sync_passes = 0         # completed sync_folders passes; files clustered before one started are organized
+
+# Serializes storage mutations between the embedding worker, the sync thread
+# and request handlers. Whoever holds it is the single writer; readers use
+# current_snapshot() and never take it.
+storage_lock = threading.RLock()
+_writer_depth = 0
+
+
+def _with_storage_lock(fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        global _writer_depth
+        with storage_lock:
+            _writer_depth += 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _writer_depth -= 1
+                # Publish once per outermost write, not per nested call;
+                # change events go out after the snapshot that contains them
+                if _writer_depth == 0:
+                    if _snapshot.version != op_log.generation:
+                        _publish()
+                    if _pending_events:
+                        _flush_events()
+    return wrapper
+
+
+_sync_cond = threading.Condition()
+_sync_first_request = None
+_sync_last_request = None
+_sync_root = None
+_sync_thread = None
 
 file_embeddings = {}
 clusters = {}
 
-# 3️⃣ Load storage FIRST
+# Running centroid state: cluster id -> sum of member file means / member count
+cluster_sums = {}
+cluster_counts = {}
+
+# 3️⃣ Load storage FIRST (snapshot + replayed operation log)
 storage = load_storage()
+start_compaction(storage, storage_lock)
+manifest.load()
 # Rebuild clusters and file_embeddings from storage on startup
 # file_embeddings now maps file_path -> mean_embedding (for clustering logic)
 if storage:
@@ -26,99 +93,209 @@ if storage:
                 if embs:
                     file_embeddings[f] = np.mean(embs, axis=0)
 
+        members = [file_embeddings[f] for f in clusters[cid] if f in file_embeddings]
+        if members:
+            cluster_sums[cid] = np.sum(members, axis=0)
+            cluster_counts[cid] = len(members)
+
+# Vectorized chunk index used by /search
+chunk_index = ChunkIndex()
+chunk_index.rebuild(storage)
+
+# Background-embedded tails of long documents, searched section-first
+section_index = SectionIndex()
+section_index.rebuild(storage)
+
+# basename/path -> cluster lookups (root_path is set by the watcher)
+path_catalog = PathCatalog()
+path_catalog.rebuild(storage)
+
+# Local c-TF-IDF labels (default tier; the LLM only refines stable clusters)
+keyword_labeler = KeywordLabeler()
+keyword_labeler.rebuild(storage)
+
+# Normalized centroid matrix used for cluster assignment
+centroid_index = CentroidIndex()
+centroid_index.rebuild({
+    cluster_id: cluster_data.get("centroid")
+    for cluster_id, cluster_data in storage.items()
+    if cluster_data["files"]
+})
+
+# -----------------------------
+# READ SNAPSHOTS
+# -----------------------------
+
+# Read-only per-cluster views, rebuilt only for clusters touched since the last publish
+_cluster_views = {cid: cluster_view(cluster_data) for cid, cluster_data in storage.items()}
+_stale_views = set()
+_pending_events = []
+
+
+def _touch(cluster_id):
+    """Marks a cluster's read view for rebuilding at the next publish."""
+    _stale_views.add(str(cluster_id))
+
+
+def _publish():
+    """Builds the next IndexSnapshot from the writer's state and swaps it in."""
+    global _snapshot
+    try:
+        for cluster_id in _stale_views:
+            if cluster_id in storage:
+                _cluster_views[cluster_id] = cluster_view(storage[cluster_id])
+            else:
+                _cluster_views.pop(cluster_id, None)
+        _stale_views.clear()
+        _snapshot = IndexSnapshot(
+            op_log.generation,
+            chunk_index.view(),
+            section_index.view(),
+            MappingProxyType(dict(_cluster_views))
+        )
+    except Exception as e:
+        print(f"SEFS: Snapshot publish failed: {e}")
+
+
+def _emit(event_type, **data):
+    """Queues a change event; the writer flushes them to the event bus after publishing."""
+    _pending_events.append((event_type, data))
+
+
+def _flush_events():
+    events = list(_pending_events)
+    _pending_events.clear()
+    try:
+        event_bus.publish(events, version=_snapshot.version)
+    except Exception as e:
+        print(f"SEFS: Event publish failed: {e}")
+
+
+def current_snapshot():
+    """The latest published IndexSnapshot. Lock-free; hold on to it for a whole request."""
+    return _snapshot
+
+
+_snapshot = IndexSnapshot(
+    op_log.generation, chunk_index.view(), section_index.view(), MappingProxyType(dict(_cluster_views))
+)
+
+@_with_storage_lock
 def add_file(file_path, chunks_data, metadata, skip_naming=False):
     """
     chunks_data: List of {"text": str, "embedding": list}
     metadata: dict of file metadata
     """
-    global file_embeddings, clusters, storage
-
     file_path = os.path.abspath(file_path)
-    
+    file_mean_emb = _index_file(file_path, chunks_data)
+    if file_mean_emb is None:
+        return
+    _place_file(file_path, chunks_data, metadata, file_mean_emb, skip_naming)
+
+
+@_with_storage_lock
+def add_files_bulk(items, skip_naming=False):
+    """
+    Places many new files at once.
+    items: List of (file_path, chunks_data, metadata)
+    Every file is scored against the current centroids with a single matrix
+    multiply; files that clear the threshold join their cluster directly and
+    the rest go through the regular one-by-one path (which may create clusters).
+    """
+    prepared = []
+    for file_path, chunks_data, metadata in items:
+        file_path = os.path.abspath(file_path)
+        file_mean_emb = _index_file(file_path, chunks_data)
+        if file_mean_emb is not None:
+            prepared.append((file_path, chunks_data, metadata, file_mean_emb))
+    if not prepared:
+        return
+
+    cluster_ids, similarities = centroid_index.assign_many([p[3] for p in prepared])
+    leftovers = []
+    for item, cluster_id, similarity in zip(prepared, cluster_ids, similarities):
+        if cluster_id is not None and similarity >= SIMILARITY_THRESHOLD:
+            _join_cluster(cluster_id, *item, skip_naming=skip_naming)
+        else:
+            leftovers.append(item)
+
+    for file_path, chunks_data, metadata, file_mean_emb in leftovers:
+        _place_file(file_path, chunks_data, metadata, file_mean_emb, skip_naming)
+
+
+def _index_file(file_path, chunks_data):
+    """Caches the file-level embedding and indexes its chunks. Returns the mean embedding."""
     # Calculate file-level embedding (mean of chunks) for clustering
     embs = [np.array(c["embedding"]) for c in chunks_data]
     if not embs:
-        return
+        return None
     file_mean_emb = np.mean(embs, axis=0)
     file_embeddings[file_path] = file_mean_emb
+    chunk_index.add_file(file_path, chunks_data)
 
     # Initialize metadata if not present
     for cid in storage:
         if "metadata" not in storage[cid]:
             storage[cid]["metadata"] = {}
+    return file_mean_emb
 
+
+def _place_file(file_path, chunks_data, metadata, file_mean_emb, skip_naming):
     # FIRST FILE → CREATE FIRST CLUSTER
     if not clusters:
-        label = generate_cluster_label([file_path]) if not skip_naming else "Refining_Label"
-        clusters[0] = [file_path]
-
-        storage["0"] = {
-            "label": label,
-            "centroid": file_mean_emb.tolist(),
-            "files": {
-                file_path: chunks_data
-            },
-            "metadata": {
-                file_path: metadata
-            }
-        }
-
-        save_storage(storage)
+        _create_cluster(0, file_path, chunks_data, metadata, file_mean_emb, skip_naming)
         return
 
-    # CHECK EXISTING CLUSTERS
-    best_similarity = -1
-    best_cluster_id = -1
-
-    for cluster_id, files in clusters.items():
-        # Get cluster centroid
-        cluster_centroid = np.array(storage[str(cluster_id)]["centroid"])
-        
-        similarity = cosine_similarity(
-            [file_mean_emb],
-            [cluster_centroid]
-        )[0][0]
-
-        print(f"Similarity with cluster {cluster_id} ({storage[str(cluster_id)]['label']}) = {similarity}")
-
-        if similarity > best_similarity:
-            best_similarity = similarity
-            best_cluster_id = cluster_id
-
-    if best_similarity >= SIMILARITY_THRESHOLD:
-        cluster_id = best_cluster_id
-        clusters[cluster_id].append(file_path)
-
-        # 🔥 ADD FILE TO STORAGE
-        storage[str(cluster_id)]["files"][file_path] = chunks_data
-        storage[str(cluster_id)]["metadata"][file_path] = metadata
-
-        # 🔥 UPDATE CENTROID (Average of all file centroids in cluster)
-        all_file_embs = []
-        for f in storage[str(cluster_id)]["files"]:
-            f_chunks = storage[str(cluster_id)]["files"][f]
-            f_embs = [np.array(c["embedding"]) for c in f_chunks]
-            if f_embs:
-                all_file_embs.append(np.mean(f_embs, axis=0))
-        
-        if all_file_embs:
-            centroid = np.mean(all_file_embs, axis=0)
-            storage[str(cluster_id)]["centroid"] = centroid.tolist()
-
-        # Optional: Refresh label if cluster grows
-        if len(storage[str(cluster_id)]["files"]) % 5 == 0:
-            storage[str(cluster_id)]["label"] = generate_cluster_label(list(storage[str(cluster_id)]["files"].keys()))
-
-        save_storage(storage)
+    # CHECK EXISTING CLUSTERS (one matrix-vector product over all centroids)
+    best_cluster_id, best_similarity = centroid_index.best(file_mean_emb)
+    if best_cluster_id is not None:
+        print(f"Best cluster {best_cluster_id} ({storage[str(best_cluster_id)]['label']}) similarity = {best_similarity:.3f}")
+
+    if best_cluster_id is not None and best_similarity >= SIMILARITY_THRESHOLD:
+        _join_cluster(best_cluster_id, file_path, chunks_data, metadata, file_mean_emb, skip_naming=skip_naming)
         return
 
     # NO MATCH → CREATE NEW CLUSTER
-    new_cluster_id = len(storage)
-    label = generate_cluster_label([file_path]) if not skip_naming else "Refining_Label"
-    clusters[new_cluster_id] = [file_path]
+    _create_cluster(len(storage), file_path, chunks_data, metadata, file_mean_emb, skip_naming)
+
+
+def _join_cluster(cluster_id, file_path, chunks_data, metadata, file_mean_emb, skip_naming=False):
+    clusters[cluster_id].append(file_path)
+
+    # 🔥 ADD FILE TO STORAGE
+    storage[str(cluster_id)]["files"][file_path] = chunks_data
+    storage[str(cluster_id)]["metadata"][file_path] = metadata
+
+    # 🔥 UPDATE CENTROID (running mean of member file embeddings, O(dim))
+    _centroid_add(cluster_id, file_mean_emb)
+    path_catalog.add(file_path, str(cluster_id))
+    keyword_labeler.add_file(cluster_id, file_path, [c.get("text", "") for c in chunks_data])
+    mark_dirty(cluster_id)
+    _touch(cluster_id)
+    _emit(FILE_ADDED, file=file_path, cluster_id=str(cluster_id))
+
+    _log_new_file(str(cluster_id), file_path, chunks_data, metadata)
+
+    # Optional: Refresh label if cluster grows
+    if not skip_naming and len(storage[str(cluster_id)]["files"]) % 5 == 0:
+        if storage[str(cluster_id)].get("label_source") == "llm":
+            label_service.request(cluster_id)
+        else:
+            _refresh_keyword_label(str(cluster_id))
+
 
-    storage[str(new_cluster_id)] = {
+def _create_cluster(cluster_id, file_path, chunks_data, metadata, file_mean_emb, skip_naming=False):
+    keyword_labeler.add_file(cluster_id, file_path, [c.get("text", "") for c in chunks_data])
+    label = keyword_labeler.label(cluster_id) if not skip_naming else None
+    source = "keywords" if label else None
+    label = label or PLACEHOLDER_LABEL
+    clusters[cluster_id] = [file_path]
+    cluster_sums[cluster_id] = file_mean_emb.copy()
+    cluster_counts[cluster_id] = 1
+
+    storage[str(cluster_id)] = {
         "label": label,
+        "label_source": source,
         "centroid": file_mean_emb.tolist(),
         "files": {
             file_path: chunks_data
@@ -127,149 +304,601 @@ def add_file(file_path, chunks_data, metadata, skip_naming=False):
             file_path: metadata
         }
     }
+    centroid_index.update(cluster_id, file_mean_emb)
+    path_catalog.add(file_path, str(cluster_id))
+    mark_dirty(cluster_id)
+    _touch(cluster_id)
+    _emit(CLUSTER_CREATED, cluster_id=str(cluster_id), label=label, label_source=source)
+    _emit(FILE_ADDED, file=file_path, cluster_id=str(cluster_id))
+
+    _log_new_file(str(cluster_id), file_path, chunks_data, metadata, label=label, label_source=source)
+
+
+def _centroid_add(cluster_id, file_emb):
+    cid = int(cluster_id)
+    if cid in cluster_sums:
+        cluster_sums[cid] = cluster_sums[cid] + file_emb
+    else:
+        cluster_sums[cid] = np.array(file_emb, dtype=float)
+    cluster_counts[cid] = cluster_counts.get(cid, 0) + 1
+    centroid = cluster_sums[cid] / cluster_counts[cid]
+    storage[str(cid)]["centroid"] = centroid.tolist()
+    centroid_index.update(cid, centroid)
+
+
+def _centroid_remove(cluster_id, file_emb):
+    """Returns True if the stored centroid changed."""
+    cid = int(cluster_id)
+    if cluster_counts.get(cid, 0) <= 0:
+        return False
+    cluster_counts[cid] -= 1
+    cluster_sums[cid] = cluster_sums[cid] - file_emb
+    if cluster_counts[cid] == 0:
+        # Keep the last centroid for an empty cluster; reset the running sum and
+        # stop assigning new files to it
+        cluster_sums[cid] = np.zeros_like(cluster_sums[cid])
+        centroid_index.remove(cid)
+        return False
+    centroid = cluster_sums[cid] / cluster_counts[cid]
+    storage[str(cid)]["centroid"] = centroid.tolist()
+    centroid_index.update(cid, centroid)
+    return True
+
+
+@_with_storage_lock
+def verify_centroids(tolerance=1e-4, repair=True):
+    """
+    Recomputes every centroid from the raw chunk embeddings and compares it
+    with the running sums. Returns {cluster_id: max_abs_drift} for clusters
+    over tolerance; with repair=True their running state is reset.
+    """
+    drifted = {}
+    for cluster_id, cluster_data in storage.items():
+        cid = int(cluster_id)
+        means = []
+        for chunks in cluster_data["files"].values():
+            embs = [np.array(c["embedding"]) for c in chunks if "embedding" in c]
+            if embs:
+                means.append(np.mean(embs, axis=0))
+        if not means:
+            continue
+
+        exact = np.mean(means, axis=0)
+        count = cluster_counts.get(cid, 0)
+        if count:
+            drift = float(np.max(np.abs(cluster_sums[cid] / count - exact)))
+        else:
+            drift = float("inf")
+        if count != len(means) or drift > tolerance:
+            drifted[cluster_id] = drift
+            if repair:
+                print(f"SEFS: Repairing centroid drift for cluster {cluster_id} ({drift:.2e})")
+                cluster_sums[cid] = np.sum(means, axis=0)
+                cluster_counts[cid] = len(means)
+                cluster_data["centroid"] = exact.tolist()
+                centroid_index.update(cid, exact)
+                _touch(cluster_id)
+                log_centroid(cluster_id, cluster_data["centroid"])
+    return drifted
+
+
+def _log_new_file(cluster_id, file_path, chunks_data, metadata, label=None, label_source=None):
+    """Append the records for a file insert (plus centroid/label changes) to the storage log."""
+    log_add_file(cluster_id, file_path, chunks_data, metadata)
+    log_centroid(cluster_id, storage[cluster_id]["centroid"])
+    if label is not None:
+        log_relabel(cluster_id, label, label_source)
+
+
+@_with_storage_lock
+def remove_file(file_path):
+    """
+    Drop a file from storage and the in-memory indexes, and log the removal.
+    Returns the cluster id it was removed from, or None if it was not indexed.
+    """
+    file_path = os.path.abspath(file_path)
+    cluster_id = _drop_file(file_path)
+    if cluster_id is not None:
+        manifest.forget(file_path)
+        _emit(FILE_REMOVED, file=file_path, cluster_id=cluster_id)
+    return cluster_id
 
-    save_storage(storage)
 
+@_with_storage_lock
+def replace_file(file_path, chunks_data, metadata, fingerprint=None):
+    """
+    Re-indexes a file whose content changed as one write, so readers see the
+    old or the new version but never neither. Subscribers get a single
+    file_updated event for a file that was indexed (file_added otherwise),
+    and the manifest entry is replaced rather than forgotten and re-recorded.
+    """
+    file_path = os.path.abspath(file_path)
+    old_cluster_id = _drop_file(file_path)
+    first_event = len(_pending_events)
+    add_file(file_path, chunks_data, metadata)
+
+    if find_cluster_id(file_path) is None:
+        # Nothing left to index (no chunks): the replacement is a removal
+        manifest.forget(file_path)
+        if old_cluster_id is not None:
+            _emit(FILE_REMOVED, file=file_path, cluster_id=old_cluster_id)
+        return
+    if fingerprint is not None:
+        manifest.record(file_path, fingerprint)
+    if old_cluster_id is None:
+        return
+    for i in range(first_event, len(_pending_events)):
+        event_type, data = _pending_events[i]
+        if event_type == FILE_ADDED and data["file"] == file_path:
+            _pending_events[i] = (FILE_UPDATED, {**data, "old_cluster_id": old_cluster_id})
+
+
+def _drop_file(file_path):
+    """Removes an indexed file from storage and the in-memory indexes and logs it. Returns its cluster id."""
+    cluster_id = find_cluster_id(file_path)
+    if cluster_id is None:
+        return None
+
+    cluster_data = storage[cluster_id]
+    cluster_data["files"].pop(file_path)
+    cluster_data.get("tails", {}).pop(file_path, None)
+    if "metadata" in cluster_data and file_path in cluster_data["metadata"]:
+        cluster_data["metadata"].pop(file_path)
+    if int(cluster_id) in clusters and file_path in clusters[int(cluster_id)]:
+        clusters[int(cluster_id)].remove(file_path)
+    file_emb = file_embeddings.pop(file_path, None)
+    chunk_index.remove_file(file_path)
+    section_index.remove_file(file_path)
+    path_catalog.remove(file_path)
+    keyword_labeler.remove_file(file_path)
+    _touch(cluster_id)
+    log_remove_file(file_path)
+    with _sync_cond:
+        dirty_folders.add(os.path.dirname(file_path))
+    if file_emb is not None and _centroid_remove(cluster_id, file_emb):
+        log_centroid(cluster_id, cluster_data["centroid"])
+    return cluster_id
+
+
+def compact_now():
+    """Folds the storage log into a snapshot now; False if one is already running."""
+    return compact_storage(storage, storage_lock)
+
+
+def find_cluster_id(file_path):
+    """Returns the storage key of the cluster holding file_path, or None."""
+    cluster_id = path_catalog.cluster_of(file_path)
+    if cluster_id is not None and file_path in storage.get(cluster_id, {}).get("files", {}):
+        return cluster_id
+    return None
+
+
+def _move_path(cluster_data, old_path, new_path):
+    """Re-key a file inside its cluster after it moved on disk."""
+    cluster_id = path_catalog.cluster_of(old_path)
+    _touch(cluster_id)
+    _emit(FILE_MOVED, file=new_path, old_file=old_path, cluster_id=cluster_id)
+    cluster_data["files"][new_path] = cluster_data["files"].pop(old_path)
+    if old_path in cluster_data.get("tails", {}):
+        cluster_data["tails"][new_path] = cluster_data["tails"].pop(old_path)
+    if old_path in cluster_data.get("metadata", {}):
+        cluster_data["metadata"][new_path] = cluster_data["metadata"].pop(old_path)
+    if old_path in file_embeddings:
+        file_embeddings[new_path] = file_embeddings.pop(old_path)
+    for files in clusters.values():
+        if old_path in files:
+            files[files.index(old_path)] = new_path
+            break
+    chunk_index.move_file(old_path, new_path)
+    section_index.move_file(old_path, new_path)
+    path_catalog.move(old_path, new_path)
+    keyword_labeler.move_file(old_path, new_path)
+    manifest.move(old_path, new_path)
+    log_move_path(old_path, new_path)
+
+
+@_with_storage_lock
+def head_texts(file_path):
+    """Chunk texts embedded at ingest for a file, or None if it is not indexed."""
+    cluster_id = find_cluster_id(file_path)
+    if cluster_id is None:
+        return None
+    return [c.get("text", "") for c in storage[cluster_id]["files"][file_path]]
+
+
+@_with_storage_lock
+def needs_tail(file_path):
+    """True for an indexed file that was truncated at ingest and has no tail yet."""
+    cluster_id = find_cluster_id(file_path)
+    if cluster_id is None:
+        return False
+    cluster_data = storage[cluster_id]
+    return (
+        cluster_data.get("metadata", {}).get(file_path, {}).get("truncated", False) and
+        file_path not in cluster_data.get("tails", {})
+    )
+
+
+@_with_storage_lock
+def add_tail(file_path, expected_head, chunks_data):
+    """
+    Attaches the background-embedded remainder of a long document.
+    Dropped (returns False) if the file was removed or re-indexed with
+    different head chunks in the meantime. Tails are searchable only; they
+    do not affect the file's cluster placement.
+    """
+    cluster_id = find_cluster_id(file_path)
+    if cluster_id is None or not chunks_data:
+        return False
+    cluster_data = storage[cluster_id]
+    head = cluster_data["files"][file_path]
+    if [c.get("text", "") for c in head] != expected_head:
+        return False
+
+    cluster_data.setdefault("tails", {})[file_path] = chunks_data
+    section_index.add_file(file_path, len(head), chunks_data)
+    _touch(cluster_id)
+    log_add_tail(cluster_id, file_path, chunks_data)
+    return True
+
+
+@_with_storage_lock
+def rename_file(old_path, new_path):
+    """
+    Re-key an indexed file that was moved on disk. Returns True if it was indexed.
+    The cluster is queued for the next sync pass, which moves the file back
+    into its folder or adopts a manual folder rename as the label.
+    """
+    cluster_id = find_cluster_id(old_path)
+    if cluster_id is None:
+        return False
+    _move_path(storage[cluster_id], old_path, new_path)
+    mark_dirty(cluster_id)
+    with _sync_cond:
+        dirty_folders.add(os.path.dirname(old_path))
+    if path_catalog.root_path:
+        request_sync(path_catalog.root_path)
+    return True
 
-def _heal_paths(root_path):
-    """Reconcile storage paths with physical file locations if they go missing."""
-    global storage
+
+def mark_dirty(cluster_id):
+    """Flags a cluster for the next incremental sync_folders pass."""
+    with _sync_cond:
+        dirty_clusters.add(str(cluster_id))
+
+
+def _heal_paths(root_path, cluster_ids=None):
+    """
+    Reconcile storage paths with physical file locations if they go missing.
+    Only the given clusters are checked (all when None), and the tree is only
+    walked if one of their files is actually missing.
+    """
     changed = False
-    
-    # Map filenames to their actual locations on disk
+    cluster_ids = list(storage.keys()) if cluster_ids is None else cluster_ids
+
+    missing = [
+        (cluster_id, old_path)
+        for cluster_id in cluster_ids if cluster_id in storage
+        for old_path in storage[cluster_id]["files"]
+        if not os.path.exists(old_path)
+    ]
+    if not missing:
+        return False
+
+    # Map filenames to their actual locations on disk (basenames may repeat)
     physical_map = {}
     for root, _, files in os.walk(root_path):
         for f in files:
             if not f.startswith("."):
-                physical_map[f] = os.path.join(root, f)
+                physical_map.setdefault(f, []).append(os.path.abspath(os.path.join(root, f)))
+
+    for cluster_id, old_path in missing:
+        filename = os.path.basename(old_path)
+        # Only adopt a copy that no other indexed entry already owns
+        candidates = [p for p in physical_map.get(filename, ()) if find_cluster_id(p) is None]
+        if candidates:
+            new_path = candidates[0]
+            print(f"SEFS: Healing path for {filename}: {old_path} -> {new_path}")
+            _move_path(storage[cluster_id], old_path, new_path)
+            changed = True
 
-    for cluster_id, cluster_data in storage.items():
-        updates = {}
-        for old_path in list(cluster_data["files"].keys()):
-            if not os.path.exists(old_path):
-                filename = os.path.basename(old_path)
-                if filename in physical_map:
-                    new_path = physical_map[filename]
-                    print(f"SEFS: Healing path for {filename}: {old_path} -> {new_path}")
-                    updates[old_path] = new_path
-                    changed = True
-        
-        for old, new in updates.items():
-            emb = cluster_data["files"].pop(old)
-            cluster_data["files"][new] = emb
-            
-    if changed:
-        save_storage(storage)
     return changed
 
-def sync_folders(root_path):
+
+def _folder_names():
+    """
+    Final folder name per cluster, computed once per pass.
+    Labels shared by several clusters get the cluster id appended.
+    """
+    label_owners = {}
+    for cluster_id, cluster_data in storage.items():
+        label_owners.setdefault(cluster_data.get("label"), []).append(cluster_id)
+
+    names = {}
+    for cluster_id, cluster_data in storage.items():
+        label = cluster_data.get("label") or f"cluster_{cluster_id}"
+        if len(label_owners.get(cluster_data.get("label"), ())) > 1:
+            label = f"{label}_{cluster_id}"
+        names[cluster_id] = label
+    return names
+
+
+def _refresh_label(cluster_id, cluster_data, root_path):
+    """Manual-rename detection; clusters still on a placeholder label are queued for naming."""
+    # 1. Detect Manual Rename: If files moved to a different folder manually
+    # Find actual current folder by looking at first file
+    existing_file = next((f for f in cluster_data["files"] if os.path.exists(f)), None)
+    if existing_file:
+        actual_parent = os.path.basename(os.path.dirname(existing_file))
+        stored_label = cluster_data.get("label", "")
+
+        # If disk folder != stored label AND it's not a generic name or the folder
+        # the engine itself last used, assume manual override
+        if (actual_parent != stored_label and
+            actual_parent != applied_folders.get(cluster_id) and
+            actual_parent != os.path.basename(os.path.normpath(root_path)) and
+            not actual_parent.startswith(PLACEHOLDER_LABEL) and 
+            not actual_parent.startswith("cluster_") and
+            not actual_parent.startswith(f"{stored_label}_")):
+            print(f"SEFS: Detected manual rename for cluster {cluster_id}: {stored_label} -> {actual_parent}")
+            cluster_data["label"] = actual_parent
+            cluster_data["label_source"] = "manual"
+            _touch(cluster_id)
+            _emit(CLUSTER_RELABELED, cluster_id=cluster_id, label=actual_parent, label_source="manual")
+            log_relabel(cluster_id, actual_parent, "manual")
+            applied_folders[cluster_id] = actual_parent
+            return # Skip refinement if manually renamed
+
+    # 2. BACKFILL OR REFRESH FALLBACK LABELS (local keywords; never blocks the sync pass)
+    _refresh_keyword_label(cluster_id)
+
+
+def _refresh_keyword_label(cluster_id):
+    """
+    Recomputes the keyword label of a cluster that has no LLM or manual
+    label. A cluster whose top terms hold steady is handed to the labeling
+    service for an LLM refinement.
+    """
+    cluster_data = storage[cluster_id]
+    if cluster_data.get("label_source") in ("llm", "manual") and not is_placeholder(cluster_data.get("label")):
+        return
+    label = keyword_labeler.label(cluster_id)
+    if label is None:
+        return
+    if label != cluster_data.get("label"):
+        _set_label(cluster_id, label, "keywords")
+    elif len(cluster_data["files"]) >= STABLE_MIN_FILES:
+        label_service.request(cluster_id)
+
+
+def _label_snapshot(cluster_id):
+    """Labeling service input: snippets from stored chunks plus the label, or None if the cluster is gone."""
+    with storage_lock:
+        cluster_data = storage.get(str(cluster_id))
+        if cluster_data is None:
+            return None
+        samples = [
+            (file_path, file_snippet(file_path, chunks))
+            for file_path, chunks in itertools.islice(cluster_data["files"].items(), 3)
+        ]
+        return samples, cluster_data.get("label", "")
+
+
+@_with_storage_lock
+def _apply_label(cluster_id, new_label, expected_label):
+    """
+    Stores a label produced by the labeling service. Dropped if the label
+    changed while the job was running (e.g. the user renamed the folder).
+    """
+    cluster_id = str(cluster_id)
+    cluster_data = storage.get(cluster_id)
+    if cluster_data is None or cluster_data.get("label", "") != expected_label:
+        return
+    if not new_label or is_placeholder(new_label):
+        return
+    _set_label(cluster_id, new_label, "llm")
+
+
+def _set_label(cluster_id, new_label, source):
+    """Relabels a cluster, logs it and renames its folder to match."""
+    cluster_data = storage[cluster_id]
+    _touch(cluster_id)
+    if new_label == cluster_data.get("label"):
+        if cluster_data.get("label_source") != source:
+            cluster_data["label_source"] = source
+            log_relabel(cluster_id, new_label, source)
+            _emit(CLUSTER_RELABELED, cluster_id=cluster_id, label=new_label, label_source=source)
+        return
+
+    root_path = path_catalog.root_path
+    old_name = _folder_names()[cluster_id]
+    cluster_data["label"] = new_label
+    cluster_data["label_source"] = source
+    log_relabel(cluster_id, new_label, source)
+    _emit(CLUSTER_RELABELED, cluster_id=cluster_id, label=new_label, label_source=source)
+    mark_dirty(cluster_id)
+    if not root_path:
+        return
+
+    # Rename folder if it already exists
+    old_folder = os.path.join(root_path, old_name)
+    new_name = _folder_names()[cluster_id]
+    new_folder = os.path.join(root_path, new_name)
+    renamed = False
+    if old_name != new_name and os.path.isdir(old_folder) and not os.path.exists(new_folder):
+        print(f"SEFS: Renaming folder {old_name} -> {new_name}")
+        try:
+            os.rename(old_folder, new_folder)
+        except OSError as e:
+            print(f"Move Error: {e}")
+        else:
+            renamed = True
+            applied_folders[cluster_id] = new_name
+            # Everything inside moved with the folder, including files of other
+            # clusters that had not been sorted out yet; re-key them all
+            prefix = old_folder + os.sep
+            for cid, data in storage.items():
+                moved = [p for p in data["files"] if p.startswith(prefix)]
+                for old_path in moved:
+                    _move_path(data, old_path, os.path.join(new_folder, old_path[len(prefix):]))
+                if moved and cid != cluster_id:
+                    mark_dirty(cid)
+    if not renamed:
+        # The files stay where they are until the next sync moves them
+        applied_folders.setdefault(cluster_id, old_name)
+    request_sync(root_path)
+
+
+# Background cluster naming (LLM calls never run on the ingest or sync path)
+label_service = LabelingService(_label_snapshot, _apply_label)
+
+
+def plan_sync(root_path, cluster_ids):
+    """
+    Computes the minimal set of moves for the given clusters.
+    Returns [(cluster_id, source, destination)] for files not already in
+    their cluster's folder. A destination that is taken on disk or by an
+    earlier move of the plan gets a numbered name ("notes (2).txt").
+    """
+    names = _folder_names()
+    plan = []
+    planned = set()
+    for cluster_id in cluster_ids:
+        cluster_data = storage.get(cluster_id)
+        if cluster_data is None:
+            continue
+        cluster_folder = os.path.join(root_path, names[cluster_id])
+        for file_path in cluster_data["files"]:
+            destination = os.path.join(cluster_folder, os.path.basename(file_path))
+            if os.path.abspath(file_path) != os.path.abspath(destination) and os.path.exists(file_path):
+                destination = _free_destination(destination, planned)
+                planned.add(destination)
+                plan.append((cluster_id, file_path, destination))
+    return plan
+
+
+def _free_destination(destination, planned):
+    """First of name, "name (2)", "name (3)", ... not on disk and not already planned."""
+    stem, ext = os.path.splitext(destination)
+    candidate, n = destination, 2
+    while candidate in planned or os.path.lexists(candidate):
+        candidate = f"{stem} ({n}){ext}"
+        n += 1
+    return candidate
+
+
+def _move_on_disk(source, destination):
+    """os.rename when source and target share a filesystem, shutil.move otherwise."""
+    dest_dir = os.path.dirname(destination)
+    os.makedirs(dest_dir, exist_ok=True)
+    if os.stat(source).st_dev == os.stat(dest_dir).st_dev:
+        os.rename(source, destination)
+    else:
+        shutil.move(source, destination)
+
+
+def _prune_empty(folders, root_path):
+    root_path = os.path.abspath(root_path)
+    for folder in folders:
+        folder = os.path.abspath(folder)
+        if folder == root_path or os.path.dirname(folder) != root_path:
+            continue
+        if os.path.isdir(folder) and not os.listdir(folder):
+            print(f"SEFS: Pruning empty folder: {os.path.basename(folder)}")
+            try:
+                os.rmdir(folder)
+            except Exception:
+                pass
+
+
+@_with_storage_lock
+def sync_folders(root_path, full=False):
     """
     Create semantic folders and move files accordingly.
     Storage is the source of truth for labels.
+    Only clusters marked dirty since the last pass are planned, unless full=True.
     """
+    global sync_passes
+    try:
+        _sync_pass(root_path, full)
+    finally:
+        sync_passes += 1
+
+
+def _sync_pass(root_path, full):
+    with _sync_cond:
+        if full:
+            targets = list(storage.keys())
+            dirty_clusters.clear()
+        else:
+            targets = [c for c in dirty_clusters if c in storage]
+            dirty_clusters.clear()
+        touched_folders = set(dirty_folders)
+        dirty_folders.clear()
+
+    if not targets and not touched_folders:
+        return
+
     # 0. Heal paths first so we know where files really are
-    _heal_paths(root_path)
+    _heal_paths(root_path, None if full else targets)
 
-    for cluster_id, cluster_data in storage.items():
-        # 1. Detect Manual Rename: If files moved to a different folder manually
-        # Find actual current folder by looking at first file
-        existing_files = [f for f in cluster_data["files"].keys() if os.path.exists(f)]
-        if existing_files:
-            actual_parent = os.path.basename(os.path.dirname(existing_files[0]))
-            stored_label = cluster_data.get("label", "")
-            
-            # If disk folder != stored label AND it's not a generic name, assume manual override
-            if (actual_parent != stored_label and 
-                actual_parent != "root_files" and
-                not actual_parent.startswith("Refining_Label") and 
-                not actual_parent.startswith("cluster_")):
-                print(f"SEFS: Detected manual rename for cluster {cluster_id}: {stored_label} -> {actual_parent}")
-                cluster_data["label"] = actual_parent
-                save_storage(storage)
-                continue # Skip refinement if manually renamed
-
-        # 2. BACKFILL OR REFRESH FALLBACK LABELS
-        current_label = cluster_data.get("label", "")
-        is_fallback = (
-            not current_label or 
-            current_label in ("New_Cluster", "Uncategorized", "Miscellaneous") or 
-            current_label.startswith("Refining_Label") or 
-            current_label.startswith("cluster_")
-        )
-        
-        if is_fallback:
-            print(f"SEFS: Refining semantic label for cluster {cluster_id}...")
-            files = list(cluster_data["files"].keys())
-            
-            # Simple retry with backoff for 429
-            new_label = None
-            for attempt in range(3):
-                new_label = generate_cluster_label(files)
-                if "429" not in str(new_label) and new_label != "Refining_Label":
-                    break
-                
-                wait_time = (attempt + 1) * 20  # increased backoff
-                print(f"SEFS: Rate limited, waiting {wait_time}s to retry cluster {cluster_id}...")
-                time.sleep(wait_time)
-
-            # Mandatory small delay between DIFFERENT clusters to avoid hitting burst limits
-            time.sleep(2)
-
-            if new_label and new_label != current_label and not new_label.startswith("Refining_Label"):
-                # Rename folder if it already exists
-                old_folder = os.path.join(root_path, current_label) if current_label else None
-                cluster_data["label"] = new_label
-                
-                if old_folder and os.path.exists(old_folder):
-                    new_folder = os.path.join(root_path, new_label)
-                    if not os.path.exists(new_folder):
-                        print(f"SEFS: Renaming folder {current_label} -> {new_label}")
-                        os.rename(old_folder, new_folder)
-
-        label = cluster_data.get("label", f"cluster_{cluster_id}")
-        
-        # Ensure unique folder name even if labels collide
-        cluster_folder = os.path.join(root_path, label)
-        
-        # If this folder is already used by a DIFFERENT cluster, append ID
-        used_folders = {c_data.get("label"): c_id for c_id, c_data in storage.items() if c_id != cluster_id}
-        if label in used_folders:
-             label = f"{label}_{cluster_id}"
-             cluster_folder = os.path.join(root_path, label)
-
-        os.makedirs(cluster_folder, exist_ok=True)
-
-        updates = {}
-        for file_path, embedding_list in cluster_data["files"].items():
-            if not os.path.exists(file_path):
-                continue
-                
-            filename = os.path.basename(file_path)
-            destination = os.path.join(cluster_folder, filename)
-
-            # Move if not already in the correct folder
-            if os.path.abspath(file_path) != os.path.abspath(destination):
-                print(f"SEFS: Organizing {filename} -> {label}")
-                try:
-                    shutil.move(file_path, destination)
-                    updates[file_path] = destination
-                except Exception as e:
-                    print(f"Move Error: {e}")
-
-        # Update storage with new paths
-        for old_path, new_path in updates.items():
-            emb = cluster_data["files"].pop(old_path)
-            cluster_data["files"][new_path] = emb
-    
-    save_storage(storage)
+    for cluster_id in targets:
+        _refresh_label(cluster_id, storage[cluster_id], root_path)
+
+    for cluster_id, source, destination in plan_sync(root_path, targets):
+        print(f"SEFS: Organizing {os.path.basename(source)} -> {os.path.basename(os.path.dirname(destination))}")
+        try:
+            _move_on_disk(source, destination)
+        except Exception as e:
+            print(f"Move Error: {e}")
+            continue
+        touched_folders.add(os.path.dirname(source))
+        _move_path(storage[cluster_id], source, destination)
+        applied_folders[cluster_id] = os.path.basename(os.path.dirname(destination))
+
+    # Moves are individually logged; make them durable once per pass
+    op_log.sync()
 
     # 3. Prune empty folders to keep root clean
-    for item in os.listdir(root_path):
-        item_path = os.path.join(root_path, item)
-        if os.path.isdir(item_path):
-            if not os.listdir(item_path):
-                print(f"SEFS: Pruning empty folder: {item}")
-                try:
-                    os.rmdir(item_path)
-                except Exception:
-                    pass
+    if full:
+        touched_folders.update(os.path.join(root_path, item) for item in os.listdir(root_path))
+    _prune_empty(touched_folders, root_path)
+
+
+def request_sync(root_path):
+    """
+    Schedules an incremental sync_folders pass. Requests arriving within
+    SYNC_DEBOUNCE seconds of each other are coalesced into one pass, which
+    runs at most SYNC_MAX_DELAY seconds after the first of them.
+    """
+    global _sync_first_request, _sync_last_request, _sync_root, _sync_thread
+    with _sync_cond:
+        now = time.monotonic()
+        if _sync_first_request is None:
+            _sync_first_request = now
+        _sync_last_request = now
+        _sync_root = root_path
+        if _sync_thread is None:
+            _sync_thread = threading.Thread(target=_sync_loop, daemon=True)
+            _sync_thread.start()
+        _sync_cond.notify()
+
+
+def _sync_loop():
+    global _sync_first_request, _sync_last_request
+    while True:
+        with _sync_cond:
+            while _sync_first_request is None:
+                _sync_cond.wait()
+            while True:
+                due = min(_sync_last_request + SYNC_DEBOUNCE, _sync_first_request + SYNC_MAX_DELAY)
+                remaining = due - time.monotonic()
+                if remaining <= 0:
+                    break
+                _sync_cond.wait(remaining)
+            _sync_first_request = _sync_last_request = None
+            root_path = _sync_root
+        try:
+            sync_folders(root_path)
+        except Exception as e:
+            print(f"SEFS: Folder sync error: {e}")
@@ -0,0 +1,107 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from embed_queue import encode_cached
+from extractor import split_chunks
+from text_cache import text_cache
+
+# Embed past the per-file head of long documents in the background
+FULL_COVERAGE = os.getenv("SEFS_FULL_COVERAGE", "1") != "0"
+MAX_TOTAL_CHUNKS = int(os.getenv("SEFS_MAX_TOTAL_CHUNKS", "2000"))   # per file, head included
+TAIL_BATCH = 32         # chunks per encode call, so ingest can cut in between batches
+IDLE_POLL = 0.5         # seconds between idle checks while ingest is busy
+
+
+class CoverageWorker:
+    """
+    Low-priority worker that completes long documents.
+
+    Files truncated at ingest are queued here. The worker only runs while
+    is_busy() is False (nothing waiting in the ingest pipeline), re-reads
+    the full text, embeds the chunks past the head in small batches and
+    attaches them to the file as a searchable tail.
+    """
+
+    def __init__(self, is_busy, cache, max_total_chunks=MAX_TOTAL_CHUNKS):
+        self.is_busy = is_busy
+        self.cache = cache
+        self.max_total_chunks = max_total_chunks
+        self._queue = OrderedDict()     # path -> None, oldest first
+        self._cond = threading.Condition()
+        self._worker = None
+
+        # Counters
+        self.completed = 0
+        self.chunks = 0
+
+    def submit(self, file_path):
+        if not FULL_COVERAGE:
+            return
+        with self._cond:
+            self._queue[file_path] = None
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, daemon=True)
+                self._worker.start()
+            self._cond.notify()
+
+    def submit_pending(self, storage):
+        """Queues every truncated file that has no tail yet (used at startup)."""
+        from cluster_engine import needs_tail
+        for cluster_data in list(storage.values()):
+            for file_path in list(cluster_data.get("metadata", {})):
+                if needs_tail(file_path):
+                    self.submit(file_path)
+
+    def stats(self):
+        return {
+            "enabled": FULL_COVERAGE,
+            "pending": len(self._queue),
+            "completed": self.completed,
+            "chunks": self.chunks
+        }
+
+    def _wait_idle(self):
+        while self.is_busy():
+            time.sleep(IDLE_POLL)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                file_path, _ = self._queue.popitem(last=False)
+            try:
+                self._wait_idle()
+                self._complete(file_path)
+            except Exception as e:
+                print(f"SEFS: Coverage error for {file_path}: {e}")
+
+    def _complete(self, file_path):
+        from cluster_engine import head_texts, needs_tail, add_tail
+
+        if not needs_tail(file_path):
+            return
+        head = head_texts(file_path)
+        text = text_cache.get_text(file_path)
+        chunks = split_chunks(text, max_chunks=self.max_total_chunks) if text else []
+        if chunks[:len(head)] != head:
+            return  # changed on disk since it was indexed; the re-index will queue it again
+        tail = chunks[len(head):]
+        if not tail:
+            return
+
+        chunks_data = []
+        for start in range(0, len(tail), TAIL_BATCH):
+            self._wait_idle()
+            batch = tail[start:start + TAIL_BATCH]
+            embeddings = encode_cached(batch, self.cache, batch_size=TAIL_BATCH)
+            chunks_data.extend(
+                {"text": t, "embedding": emb.tolist()} for t, emb in zip(batch, embeddings)
+            )
+
+        if add_tail(file_path, head, chunks_data):
+            self.completed += 1
+            self.chunks += len(chunks_data)
+            print(f"SEFS: Embedded {len(chunks_data)} more chunks of {os.path.basename(file_path)}")
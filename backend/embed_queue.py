@@ -0,0 +1,289 @@
+import hashlib
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+import numpy as np
+
+import model_registry
+
+# Knobs for cross-file micro-batching
+MAX_BATCH_SIZE = int(os.getenv("SEFS_EMBED_BATCH_SIZE", "64"))      # chunks per encode call
+MAX_WAIT_MS = int(os.getenv("SEFS_EMBED_MAX_WAIT_MS", "50"))        # how long to wait for a batch to fill
+CACHE_SIZE = int(os.getenv("SEFS_EMBED_CACHE_SIZE", "100000"))      # chunk embeddings kept for reuse
+
+
+LATENCY_SAMPLES = 1024  # recent jobs kept for latency percentiles
+
+
+class QueueFullError(Exception):
+    """Raised by submit() when a bounded queue is at capacity."""
+
+
+def chunk_key(text):
+    return hashlib.blake2b(text.encode("utf-8", "ignore"), digest_size=16).digest()
+
+
+class ChunkEmbeddingCache:
+    """
+    LRU map of chunk content hash -> embedding.
+    With content-defined chunking an edited file mostly produces chunks we
+    have already embedded, so only genuinely new text reaches the model.
+    """
+
+    def __init__(self, max_entries=CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, text):
+        key = chunk_key(text)
+        with self._lock:
+            emb = self._entries.get(key)
+            if emb is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return emb
+
+    def put(self, text, embedding):
+        key = chunk_key(text)
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def seed(self, storage):
+        """Pre-populates the cache with every chunk already in storage."""
+        for cluster_data in storage.values():
+            for chunks in cluster_data["files"].values():
+                for chunk in chunks:
+                    if "embedding" in chunk:
+                        self.put(chunk.get("text", ""), chunk["embedding"])
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def encode_cached(texts, cache, encode_fn=None, **kwargs):
+    """Synchronous encode that only sends cache misses to the model (used by bulk indexing)."""
+    encode_fn = encode_fn or model_registry.encode
+    cached = [cache.get(t) for t in texts]
+    missing = [t for t, emb in zip(texts, cached) if emb is None]
+    fresh = iter(encode_fn(missing, **kwargs) if missing else [])
+    out = []
+    for text, emb in zip(texts, cached):
+        if emb is None:
+            emb = next(fresh)
+            cache.put(text, emb)
+        out.append(np.asarray(emb, dtype=np.float32))
+    return np.vstack(out) if out else np.zeros((0, 0), dtype=np.float32)
+
+
+class _Job:
+    __slots__ = ("texts", "cached", "callback", "future", "submitted")
+
+    def __init__(self, texts, cached, callback):
+        self.texts = texts      # texts that still need encoding
+        self.cached = cached    # per original chunk: cached embedding or None
+        self.callback = callback
+        self.future = Future()
+        self.submitted = time.monotonic()
+
+
+class EmbeddingQueue:
+    """
+    Collects chunks from many pending files and encodes them together.
+
+    submit() returns a Future that resolves to the embeddings for that job
+    once its batch has been encoded. A batch closes when it holds
+    max_batch_size chunks or max_wait_ms has passed since its first job.
+    Optional per-job callbacks run on the worker thread, followed by
+    after_batch once every job in the batch has been handled.
+    With max_pending, submit() raises QueueFullError instead of queueing
+    more than that many jobs (backpressure for request handlers).
+    """
+
+    def __init__(self, encode_fn=None, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS,
+                 after_batch=None, cache=None, max_pending=0):
+        self.encode_fn = encode_fn or model_registry.encode
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.after_batch = after_batch
+        self.cache = cache
+        self.max_pending = max_pending
+
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._carry = None  # job that did not fit in the previous batch
+        self._worker = None
+        self._start_lock = threading.Lock()
+
+        # Counters
+        self.batches = 0
+        self.chunks = 0
+        self.jobs = 0
+        self.rejected = 0
+        self._fill_total = 0.0
+
+    def submit(self, texts, callback=None):
+        """
+        texts: list of chunk strings for one file
+        callback: optional fn(embeddings) run on the worker thread
+        Chunks found in the cache are not re-encoded; a job without a
+        callback that is fully cached resolves immediately.
+        """
+        texts = list(texts)
+        cached = [self.cache.get(t) for t in texts] if self.cache is not None else [None] * len(texts)
+        missing = [t for t, emb in zip(texts, cached) if emb is None]
+        job = _Job(missing, cached, callback)
+        if texts and not missing and callback is None:
+            job.future.set_result(self._merge(job, []))
+            return job.future
+        self._ensure_worker()
+        try:
+            self._queue.put(job, block=not self.max_pending)
+        except queue.Full:
+            self.rejected += 1
+            raise QueueFullError(f"{self.max_pending} jobs already waiting")
+        return job.future
+
+    def encode(self, texts):
+        """Blocking convenience wrapper around submit()."""
+        return self.submit(texts).result()
+
+    def pending(self):
+        return self._queue.qsize() + (1 if self._carry is not None else 0)
+
+    def latency_ms(self, percentile):
+        """Submit-to-result latency of recent jobs, in milliseconds."""
+        samples = sorted(self._latencies)
+        if not samples:
+            return 0.0
+        index = min(len(samples) - 1, int(round(percentile / 100.0 * (len(samples) - 1))))
+        return round(samples[index] * 1000.0, 2)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "chunks": self.chunks,
+            "jobs": self.jobs,
+            "pending_jobs": self.pending(),
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "avg_batch_size": round(self.chunks / self.batches, 2) if self.batches else 0.0,
+            "fill_ratio": round(self._fill_total / self.batches, 3) if self.batches else 0.0,
+            "rejected": self.rejected,
+            "p50_ms": self.latency_ms(50),
+            "p99_ms": self.latency_ms(99),
+            "cache_entries": len(self.cache) if self.cache is not None else 0,
+            "cache_hits": self.cache.hits if self.cache is not None else 0,
+            "cache_misses": self.cache.misses if self.cache is not None else 0
+        }
+
+    def _merge(self, job, fresh):
+        """Interleaves freshly encoded vectors with cached ones, in chunk order."""
+        fresh_iter = iter(fresh)
+        merged = []
+        text_iter = iter(job.texts)
+        for emb in job.cached:
+            if emb is None:
+                emb = next(fresh_iter)
+                if self.cache is not None:
+                    self.cache.put(next(text_iter), emb)
+            merged.append(np.asarray(emb, dtype=np.float32))
+        return np.vstack(merged) if merged else np.zeros((0, 0), dtype=np.float32)
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._start_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, daemon=True)
+                self._worker.start()
+
+    def _collect(self):
+        """
+        Blocks for the first job, then gathers more until the batch is full or
+        the wait expires. Jobs are never split; a job that would overflow the
+        batch is carried over to the next one.
+        """
+        if self._carry is not None:
+            first, self._carry = self._carry, None
+        else:
+            first = self._queue.get()
+        batch = [first]
+        size = len(first.texts)
+        deadline = time.monotonic() + self.max_wait_ms / 1000.0
+
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                job = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if size + len(job.texts) > self.max_batch_size:
+                self._carry = job
+                break
+            batch.append(job)
+            size += len(job.texts)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [t for job in batch for t in job.texts]
+
+            try:
+                embeddings = self.encode_fn(texts) if texts else []
+            except Exception as e:
+                print(f"SEFS: Embedding batch failed: {e}")
+                for job in batch:
+                    job.future.set_exception(e)
+                continue
+
+            if texts:
+                self.batches += 1
+                self.chunks += len(texts)
+                self._fill_total += min(1.0, len(texts) / self.max_batch_size)
+            self.jobs += len(batch)
+
+            # Split vectors back out to the originating jobs
+            offset = 0
+            for job in batch:
+                n = len(job.texts)
+                fresh = embeddings[offset:offset + n]
+                offset += n
+                try:
+                    job_embeddings = self._merge(job, fresh)
+                    if job.callback:
+                        job.callback(job_embeddings)
+                    self._latencies.append(time.monotonic() - job.submitted)
+                    job.future.set_result(job_embeddings)
+                except Exception as e:
+                    print(f"SEFS: Embedding callback failed: {e}")
+                    job.future.set_exception(e)
+
+            if self.after_batch:
+                try:
+                    self.after_batch()
+                except Exception as e:
+                    print(f"SEFS: Post-batch hook failed: {e}")
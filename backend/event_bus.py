@@ -0,0 +1,124 @@
+import asyncio
+import os
+import threading
+import uuid
+from collections import deque
+
+REPLAY_SIZE = int(os.getenv("SEFS_EVENT_REPLAY", "1024"))            # events kept for resuming clients
+SUBSCRIBER_QUEUE = int(os.getenv("SEFS_EVENT_QUEUE", "256"))         # undelivered events before a client is dropped
+
+# Event types
+FILE_ADDED = "file_added"
+FILE_UPDATED = "file_updated"     # re-indexed in place; carries old_cluster_id
+FILE_MOVED = "file_moved"
+FILE_REMOVED = "file_removed"
+CLUSTER_CREATED = "cluster_created"
+CLUSTER_RELABELED = "cluster_relabeled"
+
+
+class Subscription:
+    """
+    One subscriber's event queue, owned by its event loop. Events are handed
+    over with call_soon_threadsafe; once more than max_pending are waiting
+    the subscriber is dropped (get() returns None) instead of buffering
+    without bound or slowing down the publisher.
+    """
+
+    def __init__(self, loop, max_pending):
+        self.loop = loop
+        self.max_pending = max_pending
+        self.dropped = False
+        self.hello = None
+        self._queue = asyncio.Queue()
+
+    def _offer(self, event):
+        if self.dropped:
+            return
+        if self._queue.qsize() >= self.max_pending:
+            self.dropped = True
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self._queue.put_nowait(None)
+            return
+        self._queue.put_nowait(event)
+
+    async def get(self):
+        """Next event, or None once this subscriber has been dropped."""
+        return await self._queue.get()
+
+
+class EventBus:
+    """
+    In-process feed of index changes.
+
+    Events are numbered by a global sequence and kept in a bounded replay
+    buffer, so a reconnecting client can resume after the last seq it saw.
+    A client that is too far behind (or talks to a restarted server, see
+    instance) gets a single "resync" event and should refetch /clusters.
+    """
+
+    def __init__(self, replay_size=REPLAY_SIZE, max_pending=SUBSCRIBER_QUEUE):
+        self.instance = uuid.uuid4().hex[:8]
+        self.max_pending = max_pending
+        self._replay = deque(maxlen=replay_size)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self.seq = 0
+
+        # Counters
+        self.published = 0
+        self.dropped = 0
+
+    def publish(self, events, version=None):
+        """events: [(type, data)]. Safe to call from any thread."""
+        with self._lock:
+            for event_type, data in events:
+                self.seq += 1
+                event = {"seq": self.seq, "type": event_type, "version": version, **data}
+                self._replay.append(event)
+                for sub in self._subscribers:
+                    try:
+                        sub.loop.call_soon_threadsafe(sub._offer, event)
+                    except RuntimeError:
+                        pass    # loop already closed; the endpoint unsubscribes it
+            self.published += len(events)
+
+    def subscribe(self, loop, since=None, instance=None):
+        """
+        Registers a subscriber on loop. With since, events after that seq are
+        queued first (or a resync event if they are no longer buffered).
+        sub.hello is the greeting to send before any event.
+        """
+        sub = Subscription(loop, self.max_pending)
+        with self._lock:
+            sub.hello = {"type": "hello", "seq": self.seq, "instance": self.instance}
+            if since is not None:
+                oldest = self._replay[0]["seq"] if self._replay else self.seq + 1
+                if instance != self.instance or since > self.seq or since < oldest - 1:
+                    sub._queue.put_nowait({"seq": self.seq, "type": "resync"})
+                else:
+                    for event in self._replay:
+                        if event["seq"] > since:
+                            sub._queue.put_nowait(event)
+                    sub.max_pending += sub._queue.qsize()  # the replay itself never drops a client
+            self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+            if sub.dropped:
+                self.dropped += 1
+
+    def stats(self):
+        return {
+            "seq": self.seq,
+            "subscribers": len(self._subscribers),
+            "buffered": len(self._replay),
+            "published": self.published,
+            "dropped": self.dropped
+        }
+
+
+# Shared instance: cluster_engine publishes, the /ws endpoint subscribes
+event_bus = EventBus()
@@ -1,5 +1,19 @@
 import fitz  # PyMuPDF
 import os
+import random
+
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 100
+MAX_CHUNKS_PER_FILE = 20
+
+# "cdc" (content-defined boundaries, edits only change nearby chunks) or "fixed"
+CHUNKING_MODE = os.getenv("SEFS_CHUNKING", "cdc")
+CDC_MIN_SIZE = 300
+CDC_MAX_SIZE = 800
+
+# Gear table for the rolling hash; fixed seed so boundaries are stable across runs
+_GEAR = [random.Random(0x5EF5 + i).getrandbits(64) for i in range(256)]
+_MASK64 = (1 << 64) - 1
 
 def chunk_text(text, chunk_size=500, overlap=100):
     """
@@ -17,10 +31,159 @@ def chunk_text(text, chunk_size=500, overlap=100):
         
     return chunks
 
-def extract_metadata(file_path):
+def chunk_text_cdc(text, min_size=CDC_MIN_SIZE, avg_size=CHUNK_SIZE, max_size=CDC_MAX_SIZE, max_chunks=None):
+    """
+    Content-defined chunking with a gear rolling hash.
+    A boundary is cut where the hash of the preceding characters hits a mask,
+    so inserting text near the top of a document only changes the chunks
+    around the edit; later chunks keep their exact text (and embeddings).
+    """
+    if not text:
+        return []
+
+    bits = max(1, (avg_size - min_size).bit_length() - 1)
+    mask = ((1 << bits) - 1) << (64 - bits)  # test the high bits, they mix best
+
+    chunks = []
+    start = 0
+    h = 0
+    n = len(text)
+    i = start
+    while i < n:
+        h = ((h << 1) + _GEAR[ord(text[i]) & 0xFF]) & _MASK64
+        i += 1
+        size = i - start
+        if size < min_size:
+            continue
+        if (h & mask) == 0 or size >= max_size:
+            chunks.append(text[start:i])
+            if max_chunks and len(chunks) >= max_chunks:
+                return chunks
+            start = i
+            h = 0
+
+    if start < n:
+        chunks.append(text[start:])
+    return chunks
+
+
+def split_chunks(text, max_chunks=None):
+    """Chunks text using the configured CHUNKING_MODE."""
+    if CHUNKING_MODE == "cdc":
+        return chunk_text_cdc(text, max_chunks=max_chunks)
+    chunks = chunk_text(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP)
+    return chunks[:max_chunks] if max_chunks else chunks
+
+
+TXT_BLOCK_CHARS = 64 * 1024    # TXT files are streamed in blocks of this size
+
+
+def chunk_char_budget(max_chunks):
+    """Characters of text that are enough to produce max_chunks complete chunks."""
+    if CHUNKING_MODE == "cdc":
+        return max_chunks * CDC_MAX_SIZE
+    return max_chunks * (CHUNK_SIZE - CHUNK_OVERLAP) + CHUNK_OVERLAP
+
+
+def iter_pages(file_path, info=None):
+    """
+    Yields a document's text one page at a time (fixed-size blocks for TXT),
+    opening it once. If info is a dict, PDF page count and title are stored
+    in it before the first page is yielded.
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext == ".pdf":
+        doc = fitz.open(file_path)
+        try:
+            if info is not None:
+                info["pages"] = len(doc)
+                info["title"] = (doc.metadata or {}).get("title") or os.path.basename(file_path)
+            for page in doc:
+                yield page.get_text()
+        finally:
+            doc.close()
+    elif ext == ".txt":
+        with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+            for block in iter(lambda: f.read(TXT_BLOCK_CHARS), ""):
+                yield block
+
+
+def extract_document(file_path, char_budget=None):
+    """
+    Reads a TXT or PDF in a single pass and returns (text, metadata).
+    With char_budget, reading stops once that much text is in hand; the
+    word count is then extrapolated from what was read and flagged with
+    metadata["words_estimated"].
+    """
+    try:
+        stats = os.stat(file_path)
+        ext = os.path.splitext(file_path)[1].lower()
+        if ext not in (".txt", ".pdf"):
+            return "", {}
+
+        info = {}
+        pages = iter_pages(file_path, info)
+        parts = []
+        read_pages = 0      # blocks consumed, blank ones included
+        chars = 0
+        words = 0
+        last_char = ""
+        stopped = False
+        for text in pages:
+            read_pages += 1
+            if not text:
+                continue
+            parts.append(text)
+            chars += len(text)
+            page_words = len(text.split())
+            # A word cut across two blocks is one word
+            if page_words and last_char and not last_char.isspace() and not text[0].isspace():
+                page_words -= 1
+            words += page_words
+            last_char = text[-1]
+            if char_budget and chars >= char_budget:
+                stopped = True
+                break
+
+        if stopped:
+            if "pages" in info:
+                stopped = read_pages < info["pages"]
+            else:
+                stopped = next(pages, None) is not None
+        pages.close()
+
+        metadata = {
+            "size": stats.st_size,
+            "created": stats.st_ctime,
+            "filename": os.path.basename(file_path),
+            "type": ext[1:]
+        }
+        if ext == ".pdf":
+            metadata["pages"] = info.get("pages", 0)
+            metadata["title"] = info.get("title") or os.path.basename(file_path)
+
+        if stopped and chars:
+            # Extrapolate from the pages (PDF) or bytes (TXT) read so far
+            if ext == ".pdf" and read_pages:
+                words = round(words * info["pages"] / read_pages)
+            else:
+                words = round(words * stats.st_size / chars)
+            metadata["words_estimated"] = True
+        metadata["words"] = words
+
+        return "".join(parts), metadata
+    except Exception as e:
+        print(f"Extraction Error for {file_path}: {e}")
+        return "", {}
+
+
+def extract_metadata(file_path, content=None):
     """
     Extracts metadata for TXT and PDF files.
+    When the full text is already known, only the PDF header is read.
     """
+    if content is None:
+        return extract_document(file_path)[1]
     try:
         stats = os.stat(file_path)
         metadata = {
@@ -31,24 +194,14 @@ def extract_metadata(file_path):
 
         ext = os.path.splitext(file_path)[1].lower()
         if ext == ".txt":
-            content = extract_txt(file_path)
             metadata["type"] = "txt"
-            metadata["words"] = len(content.split()) if content else 0
         elif ext == ".pdf":
             doc = fitz.open(file_path)
             metadata["type"] = "pdf"
             metadata["pages"] = len(doc)
-            
-            # Extract basic title if exists
-            metadata["title"] = doc.metadata.get("title") or os.path.basename(file_path)
-            
-            # Word count summary
-            total_words = 0
-            for page in doc:
-                total_words += len(page.get_text().split())
-            metadata["words"] = total_words
+            metadata["title"] = (doc.metadata or {}).get("title") or os.path.basename(file_path)
             doc.close()
-        
+        metadata["words"] = len(content.split())
         return metadata
     except Exception as e:
         print(f"Metadata Extraction Error for {file_path}: {e}")
@@ -58,15 +211,7 @@ def extract_text(file_path):
     try:
         if not os.path.exists(file_path):
             return ""
-            
-        ext = os.path.splitext(file_path)[1].lower()
-
-        if ext == ".txt":
-            return extract_txt(file_path) or ""
-        elif ext == ".pdf":
-            return extract_pdf(file_path) or ""
-        else:
-            return ""
+        return extract_document(file_path)[0]
     except Exception:
         return ""
 
@@ -82,12 +227,40 @@ def extract_txt(path):
 
 def extract_pdf(path):
     try:
-        doc = fitz.open(path)
-        text = ""
-        for page in doc:
-            text += page.get_text()
-        doc.close()
-        return text
+        return "".join(iter_pages(path))
     except Exception as e:
         print(f"Error reading pdf {path}: {e}")
         return None
+
+
+def prepare_file(file_path, max_chunks=MAX_CHUNKS_PER_FILE, content=None):
+    """
+    Extracts, chunks and collects metadata for one file.
+    The document is read once and only as far as the chunk budget needs;
+    pass content to reuse text that was already extracted.
+    Returns (chunks, metadata); chunks is empty if the file has no text.
+    Kept at module level so it can run in a process pool.
+    """
+    if content is None:
+        # Read one chunk past the limit so truncation is detectable
+        content, metadata = extract_document(file_path, chunk_char_budget(max_chunks + 1))
+    else:
+        metadata = None
+    if not content:
+        return [], {}
+
+    # Feature 1: Semantic Chunking (stops one past the limit so truncation is detectable)
+    chunks = split_chunks(content, max_chunks=max_chunks + 1)
+
+    # Feature 6: Limit chunks per file (the rest can be embedded later, see coverage.py)
+    truncated = len(chunks) > max_chunks
+    if truncated:
+        print(f"SEFS: Truncating {file_path} to {max_chunks} chunks")
+        chunks = chunks[:max_chunks]
+
+    # Feature 3: Metadata extraction (same pass unless the text came from a cache)
+    if metadata is None:
+        metadata = extract_metadata(file_path, content) if chunks else {}
+    if truncated and metadata:
+        metadata["truncated"] = True
+    return chunks, metadata
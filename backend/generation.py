@@ -0,0 +1,110 @@
+import os
+import re
+import threading
+import time
+
+GEN_MODEL = "gemini-2.5-flash"
+
+GENERATION_CONFIG = {
+    "max_output_tokens": 1024,
+    "temperature": 0.1,
+}
+
+
+def build_answer_prompt(context, question):
+    return f"""
+You are an AI assistant for document-based question answering.
+
+Rules:
+- Use ONLY the provided context
+- If answer not present → say "Information not found in knowledge base"
+- Be concise and factual
+
+Context:
+{context}
+
+Question:
+{question}
+
+Answer:
+"""
+
+
+class GeminiGenerationClient:
+    """Answer generation through one shared genai client."""
+
+    def __init__(self, api_key=None, model=GEN_MODEL):
+        from google import genai
+        self.model = model
+        self._client = genai.Client(api_key=api_key or os.getenv("GOOGLE_API_KEY"))
+
+    def generate(self, prompt, config=GENERATION_CONFIG):
+        response = self._client.models.generate_content(
+            model=self.model,
+            contents=prompt,
+            config=config
+        )
+        return response.text.strip() if response and response.text else ""
+
+    def stream(self, prompt, config=GENERATION_CONFIG):
+        """Yields answer text as the model produces it."""
+        for chunk in self._client.models.generate_content_stream(
+            model=self.model,
+            contents=prompt,
+            config=config
+        ):
+            if chunk and chunk.text:
+                yield chunk.text
+
+
+class FakeStreamingClient:
+    """
+    Local stand-in for tests and offline use: answers with the opening words
+    of the context, one word per token, optionally pausing between tokens.
+    """
+
+    def __init__(self, words=40, delay=0.0):
+        self.words = words
+        self.delay = delay
+
+    def _answer(self, prompt):
+        context = prompt.split("Context:", 1)[-1].split("Question:", 1)[0]
+        context = re.sub(r"\[File: [^\]]*\]", " ", context)
+        words = context.split()[:self.words]
+        return " ".join(words) if words else "Information not found in knowledge base"
+
+    def generate(self, prompt, config=None):
+        return self._answer(prompt)
+
+    def stream(self, prompt, config=None):
+        for i, word in enumerate(self._answer(prompt).split(" ")):
+            if self.delay:
+                time.sleep(self.delay)
+            yield word if i == 0 else " " + word
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_generation_client():
+    """
+    Shared answer generator, created once. SEFS_GEN_CLIENT picks it:
+    "gemini" (default) or "fake".
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                if os.getenv("SEFS_GEN_CLIENT", "gemini").lower() == "fake":
+                    _client = FakeStreamingClient()
+                else:
+                    _client = GeminiGenerationClient()
+    return _client
+
+
+def set_generation_client(client):
+    """Swaps the answer generator (anything with generate(prompt) and stream(prompt))."""
+    global _client
+    with _client_lock:
+        _client = client
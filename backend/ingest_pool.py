@@ -0,0 +1,186 @@
+import itertools
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+INGEST_WORKERS = int(os.getenv("SEFS_INGEST_WORKERS", "4"))          # extraction threads
+INGEST_QUEUE_SIZE = int(os.getenv("SEFS_INGEST_QUEUE", "256"))       # files waiting for a worker
+INGEST_MAX_INFLIGHT = int(os.getenv("SEFS_INGEST_INFLIGHT", "64"))   # files extracted but not yet clustered
+MAX_JOBS = 256          # finished jobs kept for status queries
+
+# Per-file stages: queued -> extracting -> embedding -> clustering -> organizing -> done,
+# or one of the other final stages
+FINAL_STAGES = ("done", "skipped", "failed", "rejected")
+
+
+class IngestJob:
+    """One upload request: its files and the stage each has reached."""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.created = time.time()
+        self.files = []
+        self._lock = threading.Lock()
+
+    def add(self, filename, path=None, stage="queued", error=None):
+        with self._lock:
+            self.files.append({
+                "filename": filename, "path": path, "stage": stage, "error": error, "sync_mark": None
+            })
+            return len(self.files) - 1
+
+    def set_stage(self, index, stage, error=None, sync_mark=None):
+        with self._lock:
+            entry = self.files[index]
+            if error is not None and entry["error"] is None:
+                entry["error"] = error
+            if entry["stage"] == "failed":
+                return  # a failure is final
+            entry["stage"] = stage
+            if sync_mark is not None:
+                entry["sync_mark"] = sync_mark
+
+    def status(self, sync_passes):
+        """
+        Report for the job-status endpoint. A file waiting in "organizing"
+        is done once a folder sync pass has completed after it was clustered.
+        """
+        with self._lock:
+            files = []
+            for entry in self.files:
+                stage = entry["stage"]
+                if stage == "organizing" and sync_passes > entry["sync_mark"]:
+                    stage = "done"
+                files.append({
+                    "filename": entry["filename"],
+                    "path": entry["path"],
+                    "stage": stage,
+                    "error": entry["error"]
+                })
+        counts = {}
+        for entry in files:
+            counts[entry["stage"]] = counts.get(entry["stage"], 0) + 1
+        finished = all(entry["stage"] in FINAL_STAGES for entry in files)
+        return {
+            "job_id": self.job_id,
+            "state": "finished" if finished else "running",
+            "created": self.created,
+            "counts": counts,
+            "files": files
+        }
+
+
+class IngestPool:
+    """
+    Bounded ingest pipeline for uploads.
+
+    Files wait in a queue of at most max_queued entries for one of a fixed
+    number of worker threads. Callers reserve a slot before writing an
+    upload to disk, so a full queue is refused before any bytes are stored.
+    A worker only extracts and chunks a file; embedding and clustering
+    continue on the embedding queue, with at most max_inflight files
+    between the two so a burst cannot pile up unbounded chunks.
+    """
+
+    def __init__(self, handler, sync_passes, release, workers=INGEST_WORKERS,
+                 max_queued=INGEST_QUEUE_SIZE, max_inflight=INGEST_MAX_INFLIGHT):
+        self.handler = handler              # FileHandler
+        self.sync_passes = sync_passes      # () -> completed folder sync passes
+        self.release = release              # (path) -> None, once a file is fully handed over
+        self.workers = workers
+        self.max_queued = max_queued
+        self._queue = queue.Queue()
+        self._slots = threading.BoundedSemaphore(max_queued)
+        self._inflight = threading.BoundedSemaphore(max_inflight)
+        self._jobs = OrderedDict()
+        self._jobs_lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._threads = []
+        self._start_lock = threading.Lock()
+
+        # Counters
+        self.processed = 0
+        self.rejected = 0
+
+    def create_job(self):
+        job = IngestJob(f"{int(time.time())}-{next(self._ids)}")
+        with self._jobs_lock:
+            self._jobs[job.job_id] = job
+            while len(self._jobs) > MAX_JOBS:
+                self._jobs.popitem(last=False)
+        return job
+
+    def get_job(self, job_id):
+        return self._jobs.get(job_id)
+
+    def reserve(self):
+        """Claims a queue slot for one file; False when the queue is at its limit."""
+        if self._slots.acquire(blocking=False):
+            return True
+        self.rejected += 1
+        return False
+
+    def cancel(self):
+        """Returns a reserved slot that will not be submitted."""
+        self._slots.release()
+
+    def submit(self, job, index):
+        """Queues one file of a job into a slot taken with reserve()."""
+        self._ensure_workers()
+        self._queue.put((job, index))
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize(),
+            "max_queued": self.max_queued,
+            "processed": self.processed,
+            "rejected": self.rejected,
+            "jobs": len(self._jobs)
+        }
+
+    def _ensure_workers(self):
+        with self._start_lock:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._run, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _run(self):
+        while True:
+            job, index = self._queue.get()
+            self._slots.release()
+            path = job.files[index]["path"]
+            self._inflight.acquire()
+            try:
+                self._process(job, index, path)
+            except Exception as e:
+                print(f"SEFS: Ingest error for {path}: {e}")
+                job.set_stage(index, "failed", error=str(e))
+                self._finished(path)
+
+    def _process(self, job, index, path):
+        def progress(stage):
+            if stage == "organizing":
+                job.set_stage(index, stage, sync_mark=self.sync_passes())
+            else:
+                job.set_stage(index, stage)
+
+        future = self.handler.submit_file(path, progress=progress)
+        if future is None:
+            job.set_stage(index, "skipped")
+            self._finished(path)
+            return
+
+        def done(f):
+            if f.exception() is not None:
+                job.set_stage(index, "failed", error=str(f.exception()))
+            self._finished(path)
+        future.add_done_callback(done)
+
+    def _finished(self, path):
+        self.processed += 1
+        self._inflight.release()
+        self.release(path)
@@ -0,0 +1,176 @@
+import heapq
+import os
+import threading
+import time
+
+from naming_engine import build_label_prompt, clean_label, get_label_client, RateLimitError
+
+# Requests per minute allowed to the label backend, and how many may burst
+LABEL_RATE_PER_MIN = float(os.getenv("SEFS_LABEL_RATE", "10"))
+LABEL_BURST = int(os.getenv("SEFS_LABEL_BURST", "2"))
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 5.0      # seconds before the first retry, doubled on each attempt
+BACKOFF_MAX = 300.0
+
+
+class TokenBucket:
+    """Blocking token bucket: `rate` tokens per second, holding at most `capacity`."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class LabelingService:
+    """
+    Names clusters off the ingest path.
+
+    request(cluster_id) queues a label job; a cluster has at most one job
+    queued (a request for a cluster that is being labeled right now runs
+    once more afterwards). A single worker thread turns jobs into label
+    calls, paced by a token bucket, with exponential backoff on failures. Finished labels are
+    handed to apply_fn(cluster_id, label, expected_label), which decides
+    whether the label still applies and renames the folder.
+
+    snapshot_fn(cluster_id) returns ([(file_path, snippet)], current_label)
+    or None if the cluster is gone.
+    """
+
+    def __init__(self, snapshot_fn, apply_fn, client=None,
+                 rate_per_min=LABEL_RATE_PER_MIN, burst=LABEL_BURST):
+        self.snapshot_fn = snapshot_fn
+        self.apply_fn = apply_fn
+        self.client = client
+        self.bucket = TokenBucket(rate_per_min / 60.0, burst)
+
+        self._cond = threading.Condition()
+        self._heap = []         # (due, seq, cluster_id, attempt)
+        self._pending = set()   # cluster ids with a queued or running job
+        self._running = None    # cluster id the worker is labeling
+        self._rerun = set()     # requested again while running
+        self._seq = 0
+        self._worker = None
+
+        # Counters
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+
+    def request(self, cluster_id):
+        """Queues a label job unless one is already pending for this cluster."""
+        cluster_id = str(cluster_id)
+        with self._cond:
+            if cluster_id in self._pending:
+                if cluster_id != self._running:
+                    return False
+                self._rerun.add(cluster_id)
+                return True
+            self._pending.add(cluster_id)
+            self._push(cluster_id, 0, 0.0)
+        self._ensure_worker()
+        return True
+
+    def pending(self):
+        return len(self._pending)
+
+    def stats(self):
+        return {
+            "pending": self.pending(),
+            "completed": self.completed,
+            "failed": self.failed,
+            "retries": self.retries
+        }
+
+    def _push(self, cluster_id, attempt, delay):
+        self._seq += 1
+        heapq.heappush(self._heap, (time.monotonic() + delay, self._seq, cluster_id, attempt))
+        self._cond.notify()
+
+    def _ensure_worker(self):
+        with self._cond:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, daemon=True)
+                self._worker.start()
+
+    def _next_job(self):
+        with self._cond:
+            while True:
+                if self._heap:
+                    wait = self._heap[0][0] - time.monotonic()
+                    if wait <= 0:
+                        _, _, cluster_id, attempt = heapq.heappop(self._heap)
+                        self._running = cluster_id
+                        return cluster_id, attempt
+                    self._cond.wait(wait)
+                else:
+                    self._cond.wait()
+
+    def _run(self):
+        while True:
+            cluster_id, attempt = self._next_job()
+            try:
+                if self._label(cluster_id, attempt):
+                    continue  # retry scheduled
+            except Exception as e:
+                print(f"SEFS: Labeling error for cluster {cluster_id}: {e}")
+            self._done(cluster_id)
+
+    def _done(self, cluster_id):
+        with self._cond:
+            self._running = None
+            if cluster_id in self._rerun:
+                self._rerun.discard(cluster_id)
+                self._push(cluster_id, 0, 0.0)
+            else:
+                self._pending.discard(cluster_id)
+
+    def _label(self, cluster_id, attempt):
+        """Returns True when the job was rescheduled for a retry."""
+        snapshot = self.snapshot_fn(cluster_id)
+        if snapshot is None or not snapshot[0]:
+            return False
+        samples, expected_label = snapshot
+
+        client = self.client or get_label_client()
+        if client is None:
+            return False  # no LLM tier configured; keyword labels stand
+        self.bucket.acquire()
+        try:
+            label = clean_label(client.generate(build_label_prompt(samples)))
+        except Exception as e:
+            if attempt + 1 >= MAX_ATTEMPTS:
+                print(f"SEFS: Giving up on label for cluster {cluster_id}: {e}")
+                self.failed += 1
+                return False
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt))
+            kind = "Rate limited" if isinstance(e, RateLimitError) else "Label call failed"
+            print(f"SEFS: {kind}, retrying cluster {cluster_id} in {delay:.0f}s...")
+            self.retries += 1
+            with self._cond:
+                self._running = None
+                self._rerun.discard(cluster_id)
+                self._push(cluster_id, attempt + 1, delay)
+            return True
+
+        print(f"SEFS: AI named cluster {cluster_id} -> {label}")
+        self.apply_fn(cluster_id, label, expected_label)
+        self.completed += 1
+        return False
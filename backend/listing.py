@@ -0,0 +1,154 @@
+import base64
+import json
+import os
+
+from storage import to_jsonable
+
+# Projections: "full" is the raw storage layout (chunk text and embeddings
+# included), the others carry labels, counts and file names only
+CLUSTER_FIELDS = ("full", "summary", "labels")
+FILE_FIELDS = ("full", "names")
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Raises ValueError for a cursor this module did not produce."""
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def _valid_key(listing, key):
+    if listing == "clusters":
+        return isinstance(key, int)
+    return (isinstance(key, list) and len(key) == 2 and
+            isinstance(key[0], int) and isinstance(key[1], str))
+
+
+def validate(listing, fields="full", cursor=None, limit=0, **filters):
+    """
+    Raises ValueError for parameters list_clusters / list_files would reject,
+    so callers can refuse a request before answering it from a cache.
+    """
+    choices = CLUSTER_FIELDS if listing == "clusters" else FILE_FIELDS
+    if fields not in choices:
+        raise ValueError(f"fields must be one of {', '.join(choices)}")
+    if limit < 0:
+        raise ValueError("limit must not be negative")
+    if cursor and not _valid_key(listing, decode_cursor(cursor)):
+        raise ValueError("Invalid cursor")
+
+
+def file_type(file_path, metadata):
+    return metadata.get("type") or os.path.splitext(file_path)[1].lstrip(".").lower()
+
+
+def _cluster_ids(clusters, cluster_filter):
+    ids = sorted(clusters, key=int)
+    if cluster_filter:
+        wanted = set(cluster_filter.split(","))
+        ids = [cid for cid in ids if cid in wanted]
+    return ids
+
+
+def _matching_files(cluster_data, kind):
+    metadata_map = cluster_data.get("metadata", {})
+    files = sorted(cluster_data["files"])
+    if kind:
+        files = [f for f in files if file_type(f, metadata_map.get(f, {})) == kind]
+    return files
+
+
+def _page(keys, cursor, limit):
+    """Slices sorted keys after the cursor position; returns (keys, next_cursor)."""
+    if cursor:
+        after = decode_cursor(cursor)
+        try:
+            keys = [k for k in keys if k > after]
+        except TypeError:
+            raise ValueError("Invalid cursor")
+    if not limit:
+        return keys, None
+    limit = min(limit, MAX_PAGE_SIZE)
+    page = keys[:limit]
+    return page, encode_cursor(page[-1]) if len(keys) > limit else None
+
+
+def _paged(items, next_cursor, limit):
+    """Unpaginated requests keep the plain response shape."""
+    if not limit:
+        return items
+    return {"items": items, "next_cursor": next_cursor}
+
+
+def list_clusters(snapshot, fields="full", cluster=None, kind=None, cursor=None, limit=0):
+    """
+    Clusters of a snapshot, ordered by id. With a file type (kind) only matching
+    files are listed (and counted), and clusters without any are skipped.
+    """
+    validate("clusters", fields, cursor, limit)
+
+    clusters = snapshot.clusters
+    ids = _cluster_ids(clusters, cluster)
+    selected = {}
+    for cid in ids:
+        files = _matching_files(clusters[cid], kind)
+        if kind and not files:
+            continue
+        selected[cid] = files
+    keys, next_cursor = _page([int(cid) for cid in selected], cursor, limit)
+
+    out = {}
+    for key in keys:
+        cid = str(key)
+        cluster_data, files = clusters[cid], selected[cid]
+        if fields == "full":
+            view = dict(cluster_data)
+            if kind:
+                view["files"] = {f: cluster_data["files"][f] for f in files}
+            out[cid] = to_jsonable({cid: view})[cid]
+        elif fields == "summary":
+            out[cid] = {
+                "label": cluster_data["label"],
+                "label_source": cluster_data["label_source"],
+                "file_count": len(files),
+                "files": {f: len(cluster_data["files"][f]) for f in files}
+            }
+        else:
+            out[cid] = {
+                "label": cluster_data["label"],
+                "label_source": cluster_data["label_source"],
+                "file_count": len(files)
+            }
+    return _paged(out, next_cursor, limit)
+
+
+def list_files(snapshot, fields="full", cluster=None, kind=None, cursor=None, limit=0):
+    """Files of a snapshot ordered by (cluster id, path), with their cluster and metadata."""
+    validate("files", fields, cursor, limit)
+
+    clusters = snapshot.clusters
+    keys = [
+        [int(cid), file_path]
+        for cid in _cluster_ids(clusters, cluster)
+        for file_path in _matching_files(clusters[cid], kind)
+    ]
+    keys, next_cursor = _page(keys, cursor, limit)
+
+    items = []
+    for key, file_path in keys:
+        cid = str(key)
+        entry = {
+            "file": file_path,
+            "cluster_id": cid,
+            "cluster_label": clusters[cid]["label"]
+        }
+        if fields == "full":
+            entry["metadata"] = clusters[cid]["metadata"].get(file_path, {})
+        items.append(entry)
+    return _paged(items, next_cursor, limit)
@@ -1,31 +1,69 @@
-from fastapi import FastAPI, WebSocket, UploadFile, File
+from fastapi import FastAPI, WebSocket, UploadFile, File, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse, Response
+from starlette.concurrency import iterate_in_threadpool
+import gzip
+import json
+import uuid
 import asyncio
 import threading
 import os
 import shutil
+from typing import List
 
-from watcher import start_watching, index_existing_files, FileHandler
-from cluster_engine import storage
-from extractor import extract_text
+from watcher import (
+    start_watching, index_existing_files, embedding_queue, indexing_progress, coverage_worker,
+    ingest_pool, claim_path, release_path
+)
+from cluster_engine import current_snapshot, path_catalog, label_service
+import listing
+from text_cache import text_cache
+from event_bus import event_bus
+from embed_queue import EmbeddingQueue, ChunkEmbeddingCache, QueueFullError
+from query_cache import ResultCache, QUERY_CACHE_SIZE, ANSWER_CACHE_SIZE
+import retrieval
 
 from pydantic import BaseModel
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+import model_registry
 
-from google import genai
+from generation import build_answer_prompt, get_generation_client
 
 # -----------------------------
 # MODEL SETUP
 # -----------------------------
 
-embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
+# Shared embedding model, loaded lazily in the background (see model_registry)
+model_registry.warm_up()
+
+# Query encoding: concurrent requests share one encode call per short window
+QUERY_BATCH_SIZE = int(os.getenv("SEFS_QUERY_BATCH_SIZE", "32"))
+QUERY_MAX_WAIT_MS = int(os.getenv("SEFS_QUERY_MAX_WAIT_MS", "5"))
+QUERY_QUEUE_SIZE = int(os.getenv("SEFS_QUERY_QUEUE_SIZE", "256"))   # beyond this, requests get a 503
+
+# Repeated queries skip the model (embeddings) and the scan (results, per index snapshot)
+query_embedding_cache = ChunkEmbeddingCache(max_entries=QUERY_CACHE_SIZE)
+result_cache = ResultCache()
 
-client = genai.Client(
-    api_key=os.getenv("GOOGLE_API_KEY")
+query_queue = EmbeddingQueue(
+    max_batch_size=QUERY_BATCH_SIZE,
+    max_wait_ms=QUERY_MAX_WAIT_MS,
+    max_pending=QUERY_QUEUE_SIZE,
+    cache=query_embedding_cache
 )
 
-GEN_MODEL = "gemini-2.5-flash"
+
+async def encode_query(text):
+    """Encodes one query through the micro-batching queue without blocking the event loop."""
+    embeddings = await asyncio.wrap_future(query_queue.submit([text]))
+    return embeddings[0]
+
+
+def busy_response(payload):
+    return JSONResponse(status_code=503, content={**payload, "error": "Server busy, retry shortly"})
+
+# Answer generation (pluggable, see generation.py) and answers keyed by retrieved chunks
+answer_cache = ResultCache(max_entries=ANSWER_CACHE_SIZE)
 
 # -----------------------------
 # PATH CONFIG
@@ -39,19 +77,17 @@ ROOT_FOLDER = os.path.join(os.path.dirname(__file__), "root_files")
 
 def read_file_content(file_path):
     try:
-        # If only filename stored → search inside root_files
+        # If only filename stored → look it up in the path catalog
         if not os.path.exists(file_path):
-            found = False
-            for root, _, files in os.walk(ROOT_FOLDER):
-                if os.path.basename(file_path) in files:
-                    file_path = os.path.join(root, os.path.basename(file_path))
-                    found = True
-                    break
-            if not found:
+            matches = path_catalog.lookup(os.path.basename(file_path))
+            if not matches:
                 print("FILE NOT FOUND IN ROOT:", file_path)
                 return ""
+            if len(matches) > 1:
+                print(f"AMBIGUOUS FILE NAME: {file_path} matches {len(matches)} files, using {matches[0]}")
+            file_path = matches[0]
 
-        content = extract_text(file_path)
+        content = text_cache.get_text(file_path)
         if content:
             print(f"READ FILE: {file_path} LEN: {len(content)}")
             return content.strip()
@@ -61,6 +97,28 @@ def read_file_content(file_path):
         print("FILE READ ERROR:", file_path, e)
         return ""
 
+
+def resolve_file(filename, path=None):
+    """
+    Finds a file under ROOT_FOLDER by basename.
+    Returns (abs_path, error). When several files share the basename the
+    caller must pass the full path to choose one.
+    """
+    matches = path_catalog.lookup(filename)
+    if path:
+        abs_path = os.path.abspath(path)
+        if abs_path in matches:
+            return abs_path, None
+        return None, {"error": f"File '{path}' not found"}
+    if not matches:
+        return None, {"error": f"File '{filename}' not found"}
+    if len(matches) > 1:
+        return None, {
+            "error": f"Multiple files named '{filename}'; pass ?path= to choose one",
+            "matches": matches
+        }
+    return matches[0], None
+
 # -----------------------------
 # FASTAPI SETUP
 # -----------------------------
@@ -78,58 +136,189 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-connected_clients = []
-
 @app.get("/")
 def read_root():
     return {"message": "SEFS Backend Running"}
 
+# Change feed: idle connections get a ping this often (also detects dead clients),
+# and a send that cannot complete in time drops the client
+WS_PING_INTERVAL = 30
+WS_SEND_TIMEOUT = 10
+
+
 @app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
+async def websocket_endpoint(websocket: WebSocket, since: int = None, instance: str = None):
+    """
+    Streams index change events (see event_bus.py), starting with a hello
+    that carries the current seq and server instance. To resume after a
+    reconnect pass ?since=<last seq>&instance=<instance>; a "resync" event
+    means the gap is gone and the client should refetch /clusters.
+    """
     await websocket.accept()
-    connected_clients.append(websocket)
+    subscription = event_bus.subscribe(asyncio.get_running_loop(), since=since, instance=instance)
     print("Client connected")
 
     try:
+        await websocket.send_json(subscription.hello)
         while True:
-            await asyncio.sleep(1)
-    except:
-        connected_clients.remove(websocket)
+            try:
+                event = await asyncio.wait_for(subscription.get(), timeout=WS_PING_INTERVAL)
+            except asyncio.TimeoutError:
+                await asyncio.wait_for(
+                    websocket.send_json({"type": "ping", "seq": event_bus.seq}), timeout=WS_SEND_TIMEOUT
+                )
+                continue
+            if event is None:
+                # Fell too far behind; the client reconnects with ?since= and replays
+                await websocket.close(code=1013, reason="Client too slow, resume with since")
+                break
+            await asyncio.wait_for(websocket.send_json(event), timeout=WS_SEND_TIMEOUT)
+    except Exception:
+        pass
+    finally:
+        event_bus.unsubscribe(subscription)
         print("Client disconnected")
 
 @app.get("/status")
 def system_status():
+    snapshot = current_snapshot()
     return {
         "status": "running",
-        "clusters": len(storage),
-        "files": sum(len(c["files"]) for c in storage.values())
+        "model_ready": model_registry.is_ready(),
+        "index_version": snapshot.version,
+        "clusters": len(snapshot.clusters),
+        "files": snapshot.file_count(),
+        "embedding_queue": embedding_queue.stats(),
+        "query_encoder": query_queue.stats(),
+        "query_cache": {
+            "embeddings": query_embedding_cache.stats(),
+            "results": result_cache.stats(),
+            "answers": answer_cache.stats(),
+            "listings": listing_cache.stats()
+        },
+        "labeling": label_service.stats(),
+        "text_cache": text_cache.stats(),
+        "coverage": coverage_worker.stats(),
+        "ingest": ingest_pool.stats(),
+        "events": event_bus.stats(),
+        "indexing": indexing_progress
     }
 
+# Listing responses: serialized and gzipped once per index snapshot, ETag-validated
+LISTING_CACHE_SIZE = 64
+GZIP_MIN_BYTES = 1024
+# Snapshot versions restart at every boot, so ETags carry a per-process id
+INSTANCE_ID = uuid.uuid4().hex[:8]
+listing_cache = ResultCache(max_entries=LISTING_CACHE_SIZE)
+
+
+def listing_response(request, name, build, **params):
+    """
+    JSON response for a polled listing endpoint. Invalid parameters get a
+    400 first; then an If-None-Match match on the current snapshot's ETag
+    returns 304 without building anything; otherwise the body is built,
+    serialized and compressed once per (params, snapshot version) and
+    reused from listing_cache.
+    """
+    try:
+        listing.validate(name, **params)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+    snapshot = current_snapshot()
+    etag = f'W/"{INSTANCE_ID}-{snapshot.version}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip() for tag in if_none_match.split(",")) or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+
+    key = tuple(sorted(params.items()))
+    body = listing_cache.get(name, key, snapshot.version)
+    if body is None:
+        try:
+            raw = json.dumps(build(snapshot, **params), separators=(",", ":")).encode()
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"error": str(e)})
+        body = (raw, gzip.compress(raw, compresslevel=5) if len(raw) >= GZIP_MIN_BYTES else None)
+        listing_cache.put(name, key, snapshot.version, body)
+
+    raw, compressed = body
+    if compressed is not None and "gzip" in request.headers.get("accept-encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+        return Response(compressed, media_type="application/json", headers=headers)
+    return Response(raw, media_type="application/json", headers=headers)
+
+
 @app.get("/clusters")
-def get_clusters():
-    return storage
+def get_clusters(request: Request, fields: str = "full", cluster: str = None, type: str = None,
+                 cursor: str = None, limit: int = 0):
+    """
+    Clusters by id. fields=summary drops embeddings and chunk text (files map
+    to chunk counts), fields=labels keeps only labels and file counts.
+    Filter with ?cluster=<id>[,<id>...] and ?type=pdf|txt; pass ?limit= to
+    page through {"items", "next_cursor"} with ?cursor=.
+    """
+    return listing_response(
+        request, "clusters", listing.list_clusters,
+        fields=fields, cluster=cluster, kind=type, cursor=cursor, limit=limit
+    )
 
 @app.get("/files")
-def list_files_with_metadata():
+def list_files_with_metadata(request: Request, fields: str = "full", cluster: str = None, type: str = None,
+                             cursor: str = None, limit: int = 0):
     """
     Returns list of files with metadata + cluster id.
+    fields=names drops the metadata; filters and paging as for /clusters.
     """
-    all_files = []
-    for cluster_id, cluster_data in storage.items():
-        metadata_map = cluster_data.get("metadata", {})
-        for file_path in cluster_data["files"]:
-            all_files.append({
-                "file": file_path,
-                "cluster_id": cluster_id,
-                "cluster_label": cluster_data.get("label", "Unknown"),
-                "metadata": metadata_map.get(file_path, {})
-            })
-    return all_files
+    return listing_response(
+        request, "files", listing.list_files,
+        fields=fields, cluster=cluster, kind=type, cursor=cursor, limit=limit
+    )
 
 # -----------------------------
 # UPLOAD ENDPOINT
 # -----------------------------
 
+# Uploads are copied to disk in blocks and processed by the shared ingest pool
+UPLOAD_BLOCK_SIZE = 1024 * 1024
+ALLOWED_EXTENSIONS = {".txt", ".pdf"}
+
+
+def unsupported_type(filename):
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in ALLOWED_EXTENSIONS:
+        return f"Unsupported file type: {ext}. Only .txt and .pdf are allowed."
+    return None
+
+
+def queue_full_response(payload):
+    return JSONResponse(status_code=429, content={**payload, "error": "Ingest queue full, retry shortly"})
+
+
+async def ingest_upload(job, file, dest_path):
+    """
+    Streams one upload to dest_path in UPLOAD_BLOCK_SIZE blocks and queues
+    it on the ingest pool, into a slot the caller has reserved. The watcher
+    ignores the path until the pool is done with it.
+    """
+    abs_path = os.path.abspath(dest_path)
+    claim_path(abs_path)
+    try:
+        with open(abs_path, "wb") as f:
+            while True:
+                block = await file.read(UPLOAD_BLOCK_SIZE)
+                if not block:
+                    break
+                f.write(block)
+    except Exception:
+        ingest_pool.cancel()
+        release_path(abs_path)
+        raise
+    index = job.add(os.path.basename(abs_path), abs_path)
+    ingest_pool.submit(job, index)
+    return abs_path
+
+
 @app.post("/upload")
 async def upload_file(file: UploadFile = File(...)):
     """
@@ -138,74 +327,100 @@ async def upload_file(file: UploadFile = File(...)):
     """
     try:
         # Validate file type
-        allowed_extensions = {".txt", ".pdf"}
-        ext = os.path.splitext(file.filename)[1].lower()
-        if ext not in allowed_extensions:
-            return {"error": f"Unsupported file type: {ext}. Only .txt and .pdf are allowed."}
+        error = unsupported_type(file.filename)
+        if error:
+            return {"error": error}
+        if not ingest_pool.reserve():
+            return queue_full_response({})
 
-        # Save file to root_files/
-        dest_path = os.path.join(ROOT_FOLDER, file.filename)
-        with open(dest_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        # Save file to root_files/ and queue it
+        job = ingest_pool.create_job()
+        dest_path = await ingest_upload(job, file, os.path.join(ROOT_FOLDER, os.path.basename(file.filename)))
 
         print(f"UPLOAD: Saved {file.filename} to {dest_path}")
 
-        # Process in background thread (extract, embed, cluster, sync)
-        handler = FileHandler()
-        thread = threading.Thread(target=handler.process_file, args=(dest_path,), daemon=True)
-        thread.start()
-
-        return {"status": "success", "filename": file.filename, "path": dest_path}
+        return {"status": "success", "filename": file.filename, "path": dest_path, "job_id": job.job_id}
 
     except Exception as e:
         print(f"UPLOAD ERROR: {e}")
         return {"error": str(e)}
 
+@app.post("/upload/batch")
+async def upload_batch(files: List[UploadFile] = File(...)):
+    """
+    Accepts many files in one request. Each is streamed to root_files/ and
+    queued on the ingest pool; unsupported files are rejected individually.
+    Returns 429 with nothing stored when the queue is already full; files
+    arriving after it fills up are marked "rejected". Returns the job
+    status (202); follow it at /upload/jobs/{job_id}.
+    """
+    if not ingest_pool.reserve():
+        return queue_full_response({"job_id": None})
+
+    job = ingest_pool.create_job()
+    reserved = True
+    for file in files:
+        filename = os.path.basename(file.filename or "")
+        error = unsupported_type(filename)
+        if error:
+            job.add(filename, stage="rejected", error=error)
+            continue
+        if not reserved and not ingest_pool.reserve():
+            job.add(filename, stage="rejected", error="Ingest queue full")
+            continue
+        reserved = False
+        try:
+            await ingest_upload(job, file, os.path.join(ROOT_FOLDER, filename))
+        except Exception as e:
+            print(f"UPLOAD ERROR: {e}")
+            job.add(filename, stage="failed", error=str(e))
+    if reserved:
+        ingest_pool.cancel()
+
+    print(f"UPLOAD: Batch {job.job_id} with {len(files)} files")
+    return JSONResponse(status_code=202, content=job.status(ingest_pool.sync_passes()))
+
+@app.get("/upload/jobs/{job_id}")
+def upload_job_status(job_id: str):
+    """Per-file progress of an upload: queued, extracting, embedding, clustering, organizing, done."""
+    job = ingest_pool.get_job(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Job not found"})
+    return job.status(ingest_pool.sync_passes())
+
 # -----------------------------
 # DELETE ENDPOINT
 # -----------------------------
 
 @app.delete("/files/{filename}")
-async def delete_file(filename: str):
+def delete_file(filename: str, path: str = None):
     """
     Deletes a file by filename from disk and storage.
-    Searches recursively in root_files/ since files may be in cluster subfolders.
+    Files may live in any cluster subfolder; pass ?path= when the name is not unique.
+    A plain def: FastAPI runs it in the threadpool, so waiting for storage_lock
+    (held through whole sync passes) never blocks the event loop.
     """
     try:
-        # Find the file recursively in root_files
-        file_path = None
-        for root, _, files in os.walk(ROOT_FOLDER):
-            if filename in files:
-                file_path = os.path.join(root, filename)
-                break
-
-        if not file_path:
-            return {"error": f"File '{filename}' not found"}
-
-        abs_path = os.path.abspath(file_path)
+        abs_path, error = resolve_file(filename, path)
+        if error:
+            return error
 
         # Remove from storage
-        removed = False
-        for cluster_id, cluster_data in storage.items():
-            if abs_path in cluster_data["files"]:
-                cluster_data["files"].pop(abs_path)
-                if "metadata" in cluster_data and abs_path in cluster_data["metadata"]:
-                    cluster_data["metadata"].pop(abs_path)
-                removed = True
-                print(f"DELETE: Removed {filename} from cluster {cluster_id}")
-                break
+        from cluster_engine import remove_file
+        cluster_id = remove_file(abs_path)
+        removed = cluster_id is not None
+        if removed:
+            print(f"DELETE: Removed {filename} from cluster {cluster_id}")
 
         # Delete physical file
         if os.path.exists(abs_path):
             os.remove(abs_path)
             print(f"DELETE: Removed file from disk: {abs_path}")
 
-        # Save and sync
+        # Removal is already logged; schedule a folder sync
         if removed:
-            from cluster_engine import save_storage, sync_folders
-            save_storage(storage)
-            sync_folders(ROOT_FOLDER)
+            from cluster_engine import request_sync
+            request_sync(ROOT_FOLDER)
 
         return {"status": "success", "filename": filename, "removed_from_index": removed}
 
@@ -218,52 +433,37 @@ async def delete_file(filename: str):
 # -----------------------------
 
 @app.put("/files/{filename}")
-async def update_file(filename: str, file: UploadFile = File(...)):
+async def update_file(filename: str, file: UploadFile = File(...), path: str = None):
     """
     Replaces an existing file with a new upload and re-processes it.
-    The file is found by its original name, replaced on disk,
-    then re-embedded and re-clustered.
+    The file is found by its original name (or ?path= when the name is not
+    unique), replaced on disk, then re-embedded and re-clustered.
     """
     try:
         # Validate file type
-        allowed_extensions = {".txt", ".pdf"}
-        ext = os.path.splitext(file.filename)[1].lower()
-        if ext not in allowed_extensions:
-            return {"error": f"Unsupported file type: {ext}. Only .txt and .pdf are allowed."}
-
-        # Find the existing file recursively
-        existing_path = None
-        for root, _, files in os.walk(ROOT_FOLDER):
-            if filename in files:
-                existing_path = os.path.join(root, filename)
-                break
-
-        if not existing_path:
-            return {"error": f"File '{filename}' not found"}
-
-        abs_path = os.path.abspath(existing_path)
-
-        # Remove old entry from storage (it will be re-added by process_file)
-        for cluster_data in storage.values():
-            if abs_path in cluster_data["files"]:
-                cluster_data["files"].pop(abs_path)
-                if "metadata" in cluster_data and abs_path in cluster_data["metadata"]:
-                    cluster_data["metadata"].pop(abs_path)
-                break
-
-        # Overwrite the file on disk
-        with open(abs_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        error = unsupported_type(file.filename)
+        if error:
+            return {"error": error}
+
+        # Catalog lookups may walk the tree and remove_file waits for
+        # storage_lock; keep both off the event loop
+        abs_path, error = await run_in_threadpool(resolve_file, filename, path)
+        if error:
+            return error
+        if not ingest_pool.reserve():
+            return queue_full_response({})
+
+        # Remove old entry from storage (the ingest pool re-adds it)
+        from cluster_engine import remove_file
+        await run_in_threadpool(remove_file, abs_path)
+
+        # Overwrite the file on disk and re-process it (extract, embed, cluster, sync)
+        job = ingest_pool.create_job()
+        await ingest_upload(job, file, abs_path)
 
         print(f"UPDATE: Replaced {filename} at {abs_path}")
 
-        # Re-process in background thread (extract, embed, cluster, sync)
-        handler = FileHandler()
-        thread = threading.Thread(target=handler.process_file, args=(abs_path,), daemon=True)
-        thread.start()
-
-        return {"status": "success", "filename": filename, "path": abs_path}
+        return {"status": "success", "filename": filename, "path": abs_path, "job_id": job.job_id}
 
     except Exception as e:
         print(f"UPDATE ERROR: {e}")
@@ -274,36 +474,18 @@ async def update_file(filename: str, file: UploadFile = File(...)):
 # -----------------------------
 
 @app.post("/search")
-def search_files(request: SearchRequest):
+async def search_files(request: SearchRequest):
     try:
-        query_embedding = embedding_model.encode(request.query)
-        results = []
-
-        for cluster_id, cluster_data in storage.items():
-            for file_path, chunks in cluster_data["files"].items():
-                # Search against chunks (Feature 1)
-                max_sim = -1.0
-                best_chunk = ""
-                
-                for chunk in chunks:
-                    sim = cosine_similarity(
-                        [query_embedding],
-                        [chunk["embedding"]]
-                    )[0][0]
-                    
-                    if sim > max_sim:
-                        max_sim = sim
-                        best_chunk = chunk["text"]
-
-                results.append({
-                    "file": file_path,
-                    "similarity": float(max_sim),
-                    "snippet": best_chunk[:200] + "...",
-                    "cluster_label": cluster_data.get("label", cluster_id)
-                })
-
-        results.sort(key=lambda x: x["similarity"], reverse=True)
-        return {"results": results[:5]}
+        # One snapshot per request: the result is computed on, and cached under, its version
+        snapshot = current_snapshot()
+        results = result_cache.get("search", request.query, snapshot.version)
+        if results is None:
+            query_embedding = await encode_query(request.query)
+            results = await run_in_threadpool(retrieval.search_files, query_embedding, snapshot=snapshot)
+            result_cache.put("search", request.query, snapshot.version, results)
+        return {"results": results}
+    except QueueFullError:
+        return busy_response({"results": []})
     except Exception as e:
         print("SEARCH ERROR:", e)
         return {"results": [], "error": str(e)}
@@ -312,116 +494,143 @@ def search_files(request: SearchRequest):
 # RAG QA ENDPOINT
 # -----------------------------
 
+NO_DOCUMENTS_ANSWER = "No relevant documents found in knowledge base."
+
+
+async def retrieve_for_question(question):
+    """Top chunks for a question, reused while the index is unchanged."""
+    snapshot = current_snapshot()
+    top_chunks = result_cache.get("chunks", question, snapshot.version)
+    if top_chunks is None:
+        query_embedding = await encode_query(question)
+        top_chunks = await run_in_threadpool(
+            retrieval.retrieve_chunks, query_embedding, top_k=retrieval.TOP_K_CHUNKS, snapshot=snapshot
+        )
+        result_cache.put("chunks", question, snapshot.version, top_chunks)
+    return top_chunks
+
+
+def ai_error_message(e):
+    # Robust Error Handling (Feature 5)
+    if "429" in str(e):
+        return "API Rate limit exceeded."
+    return "AI service encountered an error."
+
+
 @app.post("/ask")
-def rag_answer(request: SearchRequest):
+async def rag_answer(request: SearchRequest):
     try:
-        query_embedding = embedding_model.encode(request.query)
-        all_chunks = []
-
-        for cluster_id, cluster_data in storage.items():
-            for file_path, chunks in cluster_data["files"].items():
-                for chunk in chunks:
-                    similarity = cosine_similarity(
-                        [query_embedding],
-                        [chunk["embedding"]]
-                    )[0][0]
-                    
-                    all_chunks.append({
-                        "file": file_path,
-                        "text": chunk["text"],
-                        "similarity": similarity
-                    })
-
-        # Sort by similarity and take top N (Feature 2)
-        all_chunks.sort(key=lambda x: x["similarity"], reverse=True)
-        top_chunks = all_chunks[:10]  # Take top 10 chunks to filter down
+        # Top-k retrieval over the chunk index (Feature 2)
+        top_chunks = await retrieve_for_question(request.query)
 
         if not top_chunks:
             return {
-                "answer": "No relevant documents found in knowledge base.",
+                "answer": NO_DOCUMENTS_ANSWER,
                 "sources": [],
                 "confidence": 0.0
             }
 
         # CALCULATE CONFIDENCE (Feature 4: average similarity of retrieved chunks)
-        # We'll take the top 3 chunks for confidence Calculation
-        confidence = sum(c["similarity"] for c in top_chunks[:3]) / min(3, len(top_chunks))
+        confidence = retrieval.confidence(top_chunks, n=3)
 
         # SMART CONTEXT BUILDER (Feature 2)
-        MAX_CONTEXT_CHARS = 4000
-        context_parts = []
-        chars_used = 0
-        sources = set()
-        seen_chunks = set()
-
-        for chunk in top_chunks:
-            # deduplicate (Feature 2)
-            if chunk["text"] in seen_chunks:
-                continue
-            seen_chunks.add(chunk["text"])
-
-            header = f"[File: {os.path.basename(chunk['file'])}]\n"
-            content = f"{chunk['text']}\n\n"
-            
-            if chars_used + len(header) + len(content) > MAX_CONTEXT_CHARS:
-                break
-                
-            context_parts.append(header + content)
-            chars_used += len(header) + len(content)
-            sources.add(chunk["file"])
-
-        context = "".join(context_parts)
-
-        prompt = f"""
-You are an AI assistant for document-based question answering.
-
-Rules:
-- Use ONLY the provided context
-- If answer not present → say "Information not found in knowledge base"
-- Be concise and factual
-
-Context:
-{context}
-
-Question:
-{request.query}
-
-Answer:
-"""
-
-        # Gemini Generation
-        config = {
-            "max_output_tokens": 1024,
-            "temperature": 0.1,
-        }
-
-        response = client.models.generate_content(
-            model=GEN_MODEL,
-            contents=prompt,
-            config=config
-        )
-
-        answer = response.text.strip() if response and response.text else "AI returned an empty response."
+        context, sources = retrieval.build_context(top_chunks)
+
+        # Same question over the same chunks -> same answer
+        answer_key = retrieval.retrieval_key(top_chunks)
+        answer = answer_cache.get("answer", request.query, answer_key)
+        if answer is None:
+            prompt = build_answer_prompt(context, request.query)
+            answer = await run_in_threadpool(get_generation_client().generate, prompt)
+            if answer:
+                answer_cache.put("answer", request.query, answer_key, answer)
+            else:
+                answer = "AI returned an empty response."
 
         return {
             "answer": answer,
-            "sources": list(sources),
+            "sources": sources,
             "confidence": float(confidence)
         }
 
+    except QueueFullError:
+        return busy_response({"answer": "Server busy, retry shortly", "sources": [], "confidence": 0.0})
     except Exception as e:
         print("RAG ERROR:", e)
-        # Robust Error Handling (Feature 5)
-        error_msg = "AI service encountered an error."
-        if "429" in str(e):
-            error_msg = "API Rate limit exceeded."
         return {
-            "answer": error_msg,
+            "answer": ai_error_message(e),
             "sources": [],
             "confidence": 0.0,
             "error": str(e)
         }
 
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/ask/stream")
+async def rag_answer_stream(request: SearchRequest):
+    """
+    Server-sent events variant of /ask: a "sources" event as soon as
+    retrieval is done, then "token" events as the answer is generated,
+    then "done" with the full answer (or "error").
+    Any failure after the request is accepted, retrieval included, ends the
+    stream with an "error" event.
+    """
+    retrieval_error = None
+    try:
+        top_chunks = await retrieve_for_question(request.query)
+    except QueueFullError:
+        return busy_response({"answer": "Server busy, retry shortly", "sources": [], "confidence": 0.0})
+    except Exception as e:
+        top_chunks, retrieval_error = None, e
+
+    async def answer_events():
+        if retrieval_error is not None:
+            raise retrieval_error
+        if not top_chunks:
+            yield sse_event("sources", {"sources": [], "confidence": 0.0, "cached": False})
+            yield sse_event("token", {"text": NO_DOCUMENTS_ANSWER})
+            yield sse_event("done", {"answer": NO_DOCUMENTS_ANSWER})
+            return
+
+        confidence = retrieval.confidence(top_chunks, n=3)
+        context, sources = retrieval.build_context(top_chunks)
+        answer_key = retrieval.retrieval_key(top_chunks)
+        cached = answer_cache.get("answer", request.query, answer_key)
+
+        yield sse_event("sources", {"sources": sources, "confidence": float(confidence), "cached": cached is not None})
+        if cached is not None:
+            yield sse_event("token", {"text": cached})
+            yield sse_event("done", {"answer": cached})
+            return
+
+        parts = []
+        prompt = build_answer_prompt(context, request.query)
+        async for text in iterate_in_threadpool(get_generation_client().stream(prompt)):
+            parts.append(text)
+            yield sse_event("token", {"text": text})
+
+        answer = "".join(parts).strip()
+        if answer:
+            answer_cache.put("answer", request.query, answer_key, answer)
+        yield sse_event("done", {"answer": answer or "AI returned an empty response."})
+
+    async def events():
+        try:
+            async for event in answer_events():
+                yield event
+        except Exception as e:
+            print("RAG STREAM ERROR:", e)
+            yield sse_event("error", {"error": str(e), "answer": ai_error_message(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # -----------------------------
 # WATCHER THREAD
 # -----------------------------
@@ -432,4 +641,6 @@ def run_watcher():
     print("Watching for new files...")
     start_watching(ROOT_FOLDER)
 
-threading.Thread(target=run_watcher, daemon=True).start()
+# SEFS_WATCHER=0 serves the API without indexing or watching root_files (used by tests)
+if os.getenv("SEFS_WATCHER", "1") != "0":
+    threading.Thread(target=run_watcher, daemon=True).start()
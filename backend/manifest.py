@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+# Persistent content fingerprints, stored next to the embeddings sidecar
+MANIFEST_FILE = "embeddings.manifest.json"
+FLUSH_INTERVAL = 2.0   # seconds between background saves
+HASH_BLOCK = 1 << 20
+
+
+def content_hash(path):
+    """Streaming blake2b digest of a file's bytes."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def fingerprint(path, st=None, with_hash=True):
+    st = st or os.stat(path)
+    entry = {
+        "size": st.st_size,
+        "mtime": st.st_mtime,
+        "inode": st.st_ino
+    }
+    if with_hash:
+        entry["hash"] = content_hash(path)
+    return entry
+
+
+def prepare_with_fingerprint(path):
+    """Process-pool entry point: extraction plus the file's fingerprint."""
+    from extractor import prepare_file
+    st = os.stat(path)
+    chunks, metadata = prepare_file(path)
+    return chunks, metadata, fingerprint(path, st)
+
+
+class Manifest:
+    """
+    path -> {size, mtime, inode, hash} for every indexed file.
+    Lets a restart skip files that have not changed and recognize files that
+    were moved (same content hash, new path) without re-embedding them.
+    """
+
+    def __init__(self, path=MANIFEST_FILE):
+        self.path = path
+        self.entries = {}
+        self._by_hash = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._dirty = False
+        self._flusher = None
+
+    def load(self):
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"SEFS: Ignoring unreadable manifest: {e}")
+                self.entries = {}
+        self._by_hash = {}
+        for path, entry in self.entries.items():
+            self._by_hash.setdefault(entry.get("hash"), set()).add(path)
+        return self
+
+    def get(self, path):
+        return self.entries.get(path)
+
+    def is_unchanged(self, path, st):
+        """Cheap check against the stored stat fields (no hashing)."""
+        entry = self.entries.get(path)
+        return bool(entry) and (
+            entry["size"] == st.st_size and
+            entry["mtime"] == st.st_mtime and
+            entry["inode"] == st.st_ino
+        )
+
+    def record(self, path, entry):
+        with self._lock:
+            self._forget(path)
+            self.entries[path] = entry
+            self._by_hash.setdefault(entry.get("hash"), set()).add(path)
+            self._mark_dirty()
+
+    def forget(self, path):
+        with self._lock:
+            if self._forget(path):
+                self._mark_dirty()
+
+    def move(self, old_path, new_path):
+        with self._lock:
+            entry = self.entries.get(old_path)
+            if entry is None:
+                return
+            self._forget(old_path)
+            self.entries[new_path] = entry
+            self._by_hash.setdefault(entry.get("hash"), set()).add(new_path)
+            self._mark_dirty()
+
+    def find_moved(self, file_hash):
+        """Returns a recorded path with this hash whose file no longer exists, or None."""
+        with self._lock:
+            paths = list(self._by_hash.get(file_hash, ()))
+        for path in paths:
+            if not os.path.exists(path):
+                return path
+        return None
+
+    def flush(self):
+        # One writer at a time, so the shared .tmp file is never interleaved and
+        # a later flush always replaces the file with a later snapshot
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                snapshot = json.dumps(self.entries, separators=(",", ":"))
+                self._dirty = False
+            try:
+                tmp = self.path + ".tmp"
+                with open(tmp, "w") as f:
+                    f.write(snapshot)
+                os.replace(tmp, self.path)
+            except Exception:
+                with self._lock:
+                    self._dirty = True
+                raise
+
+    def _forget(self, path):
+        entry = self.entries.pop(path, None)
+        if entry is None:
+            return False
+        paths = self._by_hash.get(entry.get("hash"))
+        if paths:
+            paths.discard(path)
+        return True
+
+    def _mark_dirty(self):
+        self._dirty = True
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"SEFS: Manifest flush failed: {e}")
+
+
+# Loaded by cluster_engine at startup (kept lazy so pool workers skip it)
+manifest = Manifest()
@@ -0,0 +1,48 @@
+import os
+import threading
+
+MODEL_NAME = os.getenv("SEFS_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+
+# Explicit torch intra-op threads; several SEFS instances may share a host
+TORCH_THREADS = int(os.getenv("SEFS_TORCH_THREADS", "0")) or max(1, (os.cpu_count() or 2) // 2)
+
+_model = None
+_lock = threading.Lock()
+_ready = threading.Event()
+
+
+def get_model():
+    """
+    Returns the process-wide SentenceTransformer, loading it on first use.
+    Every caller shares this one instance.
+    """
+    global _model
+    if _model is not None:
+        return _model
+
+    with _lock:
+        if _model is None:
+            import torch
+            from sentence_transformers import SentenceTransformer
+
+            torch.set_num_threads(TORCH_THREADS)
+            print(f"SEFS: Loading embedding model {MODEL_NAME} ({TORCH_THREADS} threads)...")
+            _model = SentenceTransformer(MODEL_NAME)
+            _ready.set()
+            print("SEFS: Embedding model ready")
+    return _model
+
+
+def encode(texts, **kwargs):
+    return get_model().encode(texts, **kwargs)
+
+
+def is_ready():
+    return _ready.is_set()
+
+
+def warm_up():
+    """Loads the model on a background thread so the server can answer immediately."""
+    thread = threading.Thread(target=get_model, daemon=True)
+    thread.start()
+    return thread
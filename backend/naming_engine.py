@@ -1,33 +1,52 @@
+import heapq
+import math
 import os
-from google import genai
-from extractor import extract_text
+import re
+import threading
+from collections import Counter
+from text_cache import text_cache
 
-def generate_cluster_label(files):
+GEN_MODEL = "gemini-3-flash-preview"
+
+# Label used while a cluster waits for the labeling service
+PLACEHOLDER_LABEL = "Refining_Label"
+SNIPPET_CHARS = 500
+
+
+def is_placeholder(label):
+    return (
+        not label or
+        label in ("New_Cluster", "Uncategorized", "Miscellaneous") or
+        label.startswith(PLACEHOLDER_LABEL) or
+        label.startswith("cluster_")
+    )
+
+
+def file_snippet(file_path, chunks=None, limit=SNIPPET_CHARS):
     """
-    Generates a concise semantic label for a group of files.
+    Opening text of a file: from its stored chunks when given, otherwise
+    from the extracted-text cache (the document is only parsed on a miss).
     """
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        print("Naming Error: GOOGLE_API_KEY not found in environment.")
-        return "Uncategorized"
+    if chunks:
+        text = ""
+        for chunk in chunks:
+            text += chunk.get("text", "")
+            if len(text) >= limit:
+                break
+        return text[:limit]
+    return text_cache.get_text(file_path)[:limit]
 
-    client = genai.Client(api_key=api_key)
-    GEN_MODEL = "gemini-3-flash-preview"
 
-    if not files:
-        return "Empty_Cluster"
-
-    # Gather snippets from the first few files for context
+def build_label_prompt(samples):
+    """Prompt from (file_path, snippet) pairs for the first few files of a cluster."""
     context_samples = []
-    for file_path in files[:3]:
+    for file_path, snippet in samples[:3]:
         name = os.path.basename(file_path)
-        content = extract_text(file_path)
-        snippet = (content[:500] if content else "no content")
-        context_samples.append(f"File: {name}\nContent Snippet: {snippet}")
+        context_samples.append(f"File: {name}\nContent Snippet: {snippet or 'no content'}")
 
     context_str = "\n\n".join(context_samples)
 
-    prompt = f"""
+    return f"""
 Analyze these files and provide a SINGLE, CONCISE semantic folder name (1-3 words, underscores instead of spaces).
 Avoid generic names like "Documents" or "Files" if possible. Be specific to the content.
 
@@ -37,20 +56,229 @@ Files:
 Semantic Folder Name:
 """
 
+
+def clean_label(text):
+    label = text.strip().replace(" ", "_").replace("/", "-")
+    label = "".join(c for c in label if c.isalnum() or c in ("_", "-"))
+    return label or "Miscellaneous"
+
+
+# -----------------------------
+# LOCAL KEYWORD LABELS (c-TF-IDF)
+# -----------------------------
+
+KEYWORD_TERMS = 3           # terms joined into a keyword label
+MIN_TERM_LENGTH = 3
+MAX_TERM_LENGTH = 30
+
+_TOKEN_RE = re.compile(r"[a-z][a-z0-9]+")
+
+STOPWORDS = frozenset(
+    "about above after again against all also although among and any are around because been "
+    "before being below between both but can could did does doing done down during each either "
+    "else etc even ever every for from further get gets had has have having her here hers him "
+    "his how however into its itself just least less like made make many may might more most "
+    "much must near need neither never new next nor not now off often once one only onto other "
+    "our ours out over own per perhaps rather same see shall she should since some still such "
+    "than that the their theirs them then there these they this those though through thus too "
+    "under until upon use used using very via was way well were what whatever when where "
+    "whether which while who whom whose why will with within without would yet you your yours "
+    "file files page pages document content http https www com".split()
+)
+
+
+def tokenize(text):
+    return [
+        w for w in _TOKEN_RE.findall(text.lower())
+        if MIN_TERM_LENGTH <= len(w) <= MAX_TERM_LENGTH and w not in STOPWORDS
+    ]
+
+
+class KeywordLabeler:
+    """
+    Class-based TF-IDF over the chunk texts stored per cluster.
+
+    Each cluster is treated as one document. A term's weight in a cluster is
+    tf(t, c) * log(1 + A / f(t)), where f(t) is its frequency across all
+    clusters and A the average number of terms per cluster. Counts are kept
+    per file, so files joining or leaving a cluster update the statistics
+    without rescanning the corpus.
+    """
+
+    def __init__(self, n_terms=KEYWORD_TERMS):
+        self.n_terms = n_terms
+        self._lock = threading.RLock()
+        self._file_terms = {}       # path -> Counter
+        self._file_cluster = {}     # path -> cluster id
+        self._cluster_terms = {}    # cluster id -> Counter
+        self._corpus_terms = Counter()
+        self._total_terms = 0
+
+    def rebuild(self, storage):
+        with self._lock:
+            self._file_terms = {}
+            self._file_cluster = {}
+            self._cluster_terms = {}
+            self._corpus_terms = Counter()
+            self._total_terms = 0
+            for cluster_id, cluster_data in storage.items():
+                for file_path, chunks in cluster_data["files"].items():
+                    self.add_file(cluster_id, file_path, [c.get("text", "") for c in chunks])
+
+    def add_file(self, cluster_id, file_path, texts):
+        counts = Counter()
+        for text in texts:
+            counts.update(tokenize(text))
+        cluster_id = str(cluster_id)
+        with self._lock:
+            self.remove_file(file_path)
+            self._file_terms[file_path] = counts
+            self._file_cluster[file_path] = cluster_id
+            self._cluster_terms.setdefault(cluster_id, Counter()).update(counts)
+            self._corpus_terms.update(counts)
+            self._total_terms += sum(counts.values())
+
+    def remove_file(self, file_path):
+        with self._lock:
+            counts = self._file_terms.pop(file_path, None)
+            if counts is None:
+                return
+            cluster_id = self._file_cluster.pop(file_path)
+            cluster_terms = self._cluster_terms.get(cluster_id)
+            if cluster_terms is not None:
+                cluster_terms.subtract(counts)
+                for term in counts:
+                    if cluster_terms[term] <= 0:
+                        del cluster_terms[term]
+                if not cluster_terms:
+                    del self._cluster_terms[cluster_id]
+            self._corpus_terms.subtract(counts)
+            for term in counts:
+                if self._corpus_terms[term] <= 0:
+                    del self._corpus_terms[term]
+            self._total_terms -= sum(counts.values())
+
+    def move_file(self, old_path, new_path):
+        with self._lock:
+            if old_path in self._file_terms:
+                self._file_terms[new_path] = self._file_terms.pop(old_path)
+                self._file_cluster[new_path] = self._file_cluster.pop(old_path)
+
+    def top_terms(self, cluster_id, n=None):
+        n = n or self.n_terms
+        with self._lock:
+            cluster_terms = self._cluster_terms.get(str(cluster_id))
+            if not cluster_terms or not self._cluster_terms:
+                return []
+            avg_terms = self._total_terms / len(self._cluster_terms)
+            corpus_terms = self._corpus_terms
+            best = heapq.nsmallest(n, (
+                (-count * math.log(1 + avg_terms / corpus_terms[term]), term)
+                for term, count in cluster_terms.items()
+            ))
+        return [term for _, term in best]
+
+    def label(self, cluster_id):
+        """Underscore-joined top terms, e.g. "Invoice_Tax_Vendor", or None."""
+        terms = self.top_terms(cluster_id)
+        return "_".join(t.capitalize() for t in terms) if terms else None
+
+
+# -----------------------------
+# LLM LABELS
+# -----------------------------
+
+class RateLimitError(Exception):
+    """The label backend asked us to slow down (HTTP 429 / RESOURCE_EXHAUSTED)."""
+
+
+class GeminiLabelClient:
+    """Label backend using one genai client for the lifetime of the process."""
+
+    def __init__(self, api_key=None, model=GEN_MODEL):
+        from google import genai
+        self.model = model
+        self._client = genai.Client(api_key=api_key or os.getenv("GOOGLE_API_KEY"))
+
+    def generate(self, prompt):
+        try:
+            response = self._client.models.generate_content(
+                model=self.model,
+                contents=prompt,
+                config={"temperature": 0.1}
+            )
+        except Exception as e:
+            if "429" in str(e) or "RESOURCE_EXHAUSTED" in str(e):
+                raise RateLimitError(str(e)) from e
+            raise
+        if not response or not response.text:
+            raise ValueError("AI returned empty response")
+        return response.text
+
+
+class StubLabelClient:
+    """
+    Offline label backend: names a cluster after the most frequent words in
+    its prompt snippets. Deterministic, so it is also handy for testing.
+    """
+
+    def generate(self, prompt):
+        words = tokenize(prompt.split("Files:", 1)[-1].replace("Snippet:", ""))
+        top = [w for w, _ in Counter(words).most_common(2)]
+        return "_".join(w.capitalize() for w in top) or "Miscellaneous"
+
+
+_client = None
+_client_resolved = False
+_client_lock = threading.Lock()
+
+
+def get_label_client():
+    """
+    Shared LLM label backend, created once. SEFS_LABEL_CLIENT picks it
+    ("gemini" by default, "stub" for offline use, "none" to disable).
+    Returns None when no LLM tier is available; keyword labels stay as-is.
+    """
+    global _client, _client_resolved
+    if not _client_resolved:
+        with _client_lock:
+            if not _client_resolved:
+                kind = os.getenv("SEFS_LABEL_CLIENT", "gemini").lower()
+                if kind == "stub":
+                    _client = StubLabelClient()
+                elif kind == "gemini" and os.getenv("GOOGLE_API_KEY"):
+                    _client = GeminiLabelClient()
+                elif kind == "gemini":
+                    print("Naming Error: GOOGLE_API_KEY not found in environment, using keyword labels only.")
+                _client_resolved = True
+    return _client
+
+
+def set_label_client(client):
+    """Swaps the label backend (anything with generate(prompt) -> str)."""
+    global _client, _client_resolved
+    with _client_lock:
+        _client = client
+        _client_resolved = True
+
+
+def generate_cluster_label(files, client=None):
+    """
+    Generates a concise semantic label for a group of files.
+    Blocking; the cluster engine goes through labeling_service instead.
+    """
+    if not files:
+        return "Empty_Cluster"
+
+    client = client or get_label_client()
+    if client is None:
+        return PLACEHOLDER_LABEL
     try:
-        response = client.models.generate_content(
-            model=GEN_MODEL,
-            contents=prompt,
-            config={"temperature": 0.1}
-        )
-        if response and response.text:
-            label = response.text.strip().replace(" ", "_").replace("/", "-")
-            label = "".join(c for c in label if c.isalnum() or c in ("_", "-"))
-            print(f"SEFS: AI named cluster -> {label}")
-            return label or "Miscellaneous"
-        else:
-            print("Naming Error: AI returned empty response.")
+        samples = [(f, file_snippet(f)) for f in files[:3]]
+        label = clean_label(client.generate(build_label_prompt(samples)))
+        print(f"SEFS: AI named cluster -> {label}")
+        return label
     except Exception as e:
         print(f"Naming Error for {files[0]}: {e}")
-    
-    return "Refining_Label"
+
+    return PLACEHOLDER_LABEL
@@ -0,0 +1,84 @@
+import os
+import threading
+
+
+class PathCatalog:
+    """
+    In-memory catalog of indexed files: basename -> paths, path -> (cluster id, inode).
+
+    Answers "where is this file" and "which cluster owns it" in O(1). Basenames
+    are not unique across clusters, so lookups return every match. A
+    filesystem scan is only done when a basename is not in the catalog.
+    """
+
+    def __init__(self, root_path=None):
+        self.root_path = root_path
+        self._lock = threading.RLock()
+        self._by_name = {}
+        self._by_path = {}
+
+    def rebuild(self, storage):
+        with self._lock:
+            self._by_name = {}
+            self._by_path = {}
+            for cluster_id, cluster_data in storage.items():
+                for file_path in cluster_data["files"]:
+                    self.add(file_path, cluster_id)
+
+    def add(self, file_path, cluster_id=None):
+        try:
+            inode = os.stat(file_path).st_ino
+        except OSError:
+            inode = None
+        with self._lock:
+            self._by_path[file_path] = {"cluster": cluster_id, "inode": inode}
+            self._by_name.setdefault(os.path.basename(file_path), set()).add(file_path)
+
+    def remove(self, file_path):
+        with self._lock:
+            if self._by_path.pop(file_path, None) is None:
+                return False
+            name = os.path.basename(file_path)
+            paths = self._by_name.get(name)
+            if paths:
+                paths.discard(file_path)
+                if not paths:
+                    del self._by_name[name]
+            return True
+
+    def move(self, old_path, new_path):
+        with self._lock:
+            entry = self._by_path.get(old_path)
+            cluster_id = entry["cluster"] if entry else None
+            self.remove(old_path)
+            self.add(new_path, cluster_id)
+
+    def cluster_of(self, file_path):
+        entry = self._by_path.get(file_path)
+        return entry["cluster"] if entry else None
+
+    def inode_of(self, file_path):
+        entry = self._by_path.get(file_path)
+        return entry["inode"] if entry else None
+
+    def lookup(self, filename):
+        """
+        Returns every known path with this basename, sorted.
+        Falls back to scanning root_path when the catalog has no match; files
+        found that way are added without a cluster.
+        """
+        with self._lock:
+            paths = sorted(p for p in self._by_name.get(filename, ()) if os.path.exists(p))
+        if paths or not self.root_path:
+            return paths
+
+        found = []
+        for root, _, files in os.walk(self.root_path):
+            if filename in files:
+                found.append(os.path.abspath(os.path.join(root, filename)))
+        for path in found:
+            self.add(path)
+        return sorted(found)
+
+    def __len__(self):
+        return len(self._by_path)
@@ -0,0 +1,54 @@
+import os
+import threading
+from collections import OrderedDict
+
+QUERY_CACHE_SIZE = int(os.getenv("SEFS_QUERY_CACHE_SIZE", "1024"))     # query embeddings
+RESULT_CACHE_SIZE = int(os.getenv("SEFS_RESULT_CACHE_SIZE", "512"))    # search/retrieval results
+ANSWER_CACHE_SIZE = int(os.getenv("SEFS_ANSWER_CACHE_SIZE", "256"))    # generated /ask answers
+
+
+class ResultCache:
+    """
+    LRU of (kind, query, version) -> result.
+
+    The version is whatever the result depends on: the index snapshot
+    version for search results (a new one is published after every storage
+    mutation), or the retrieved chunks for generated answers. A lookup can only return a
+    result computed against the current version; entries for older
+    versions are never hit again and age out of the LRU.
+    """
+
+    def __init__(self, max_entries=RESULT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, kind, query, version):
+        key = (kind, query, version)
+        with self._lock:
+            result = self._entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, kind, query, version, result):
+        key = (kind, query, version)
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0
+        }
@@ -0,0 +1,111 @@
+import os
+
+from embed_queue import chunk_key
+from cluster_engine import current_snapshot
+
+MAX_CONTEXT_CHARS = 4000
+TOP_K_CHUNKS = 10
+TOP_K_FILES = 5
+
+
+def search_files(query_embedding, top_k=TOP_K_FILES, snapshot=None):
+    """
+    Ranks files by their best-matching chunk (head chunks, plus the tail
+    sections of long documents that match best).
+    Snippets and labels are only built for the returned winners.
+    Reads one IndexSnapshot (the current one unless given) without locking.
+    """
+    snapshot = snapshot or current_snapshot()
+    hits = (
+        snapshot.chunks.search_files(query_embedding, top_k=top_k) +
+        snapshot.sections.search_files(query_embedding, top_k=top_k)
+    )
+    best = {}
+    for hit in hits:
+        if hit[0] not in best or hit[1] > best[hit[0]][1]:
+            best[hit[0]] = hit
+    ranked = sorted(best.values(), key=lambda hit: -hit[1])[:top_k]
+
+    results = []
+    for file_path, similarity, best_chunk in ranked:
+        cluster_id = snapshot.cluster_of(file_path)
+        cluster_data = snapshot.clusters.get(cluster_id, {})
+        results.append({
+            "file": file_path,
+            "similarity": similarity,
+            "snippet": best_chunk[:200] + "...",
+            "cluster_label": cluster_data.get("label", cluster_id)
+        })
+    return results
+
+
+def retrieve_chunks(query_embedding, top_k=TOP_K_CHUNKS, snapshot=None):
+    """
+    Returns the top_k chunks as dicts, best first.
+    Each chunk is identified by (file, position) in "chunk_id".
+    Tail chunks of long documents come from their best sections only.
+    """
+    snapshot = snapshot or current_snapshot()
+    hits = (
+        snapshot.chunks.top_chunks(query_embedding, top_k=top_k) +
+        snapshot.sections.top_chunks(query_embedding, top_k=top_k)
+    )
+    hits.sort(key=lambda hit: -hit[2])
+    return [
+        {
+            "chunk_id": (file_path, pos),
+            "file": file_path,
+            "text": text,
+            "similarity": similarity
+        }
+        for file_path, pos, similarity, text in hits[:top_k]
+    ]
+
+
+def retrieval_key(chunks):
+    """
+    Identity of a retrieval result: chunk ids plus a digest of each chunk's
+    text, so anything keyed on it goes stale as soon as a chunk changes.
+    """
+    return tuple(
+        (chunk["file"], chunk["chunk_id"][1], chunk_key(chunk["text"]))
+        for chunk in chunks
+    )
+
+
+def confidence(chunks, n=3):
+    """Average similarity of the best n retrieved chunks."""
+    if not chunks:
+        return 0.0
+    top = chunks[:n]
+    return sum(c["similarity"] for c in top) / len(top)
+
+
+def build_context(chunks, max_chars=MAX_CONTEXT_CHARS):
+    """
+    Deduplicates chunks by text and packs them into a prompt context
+    until max_chars is reached.
+    Returns (context, sources) where sources lists files in first-use order.
+    """
+    context_parts = []
+    chars_used = 0
+    sources = []
+    seen_chunks = set()
+
+    for chunk in chunks:
+        if chunk["text"] in seen_chunks:
+            continue
+        seen_chunks.add(chunk["text"])
+
+        header = f"[File: {os.path.basename(chunk['file'])}]\n"
+        content = f"{chunk['text']}\n\n"
+
+        if chars_used + len(header) + len(content) > max_chars:
+            break
+
+        context_parts.append(header + content)
+        chars_used += len(header) + len(content)
+        if chunk["file"] not in sources:
+            sources.append(chunk["file"])
+
+    return "".join(context_parts), sources
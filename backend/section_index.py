@@ -0,0 +1,225 @@
+import os
+import threading
+
+import numpy as np
+
+from chunk_index import _normalize_rows, COMPACT_DEAD_RATIO, INITIAL_CAPACITY
+
+# Tail chunks per section summary vector, and sections expanded per query
+SECTION_CHUNKS = int(os.getenv("SEFS_SECTION_CHUNKS", "16"))
+TOP_SECTIONS = 4
+
+
+class SectionIndex:
+    """
+    Chunks past the per-file head of long documents, grouped into sections.
+
+    Every SECTION_CHUNKS consecutive tail chunks of a file are summarized by
+    the normalized mean of their vectors. A query scores the section
+    summaries first and only scores the individual chunks of the best
+    sections, so long documents add sections, not chunks, to every scan.
+
+    Summaries are computed once per file when it is added and appended to
+    one matrix; removed files are tombstoned (compacted lazily) and moves
+    only re-key their rows, so a change costs the sections of that file.
+    Queries run against an immutable SectionView (see view()); like
+    ChunkIndex, rows are never rewritten in place and the live mask and
+    row refs are copied before the first change after a view() call.
+    """
+
+    def __init__(self, section_chunks=SECTION_CHUNKS):
+        self.section_chunks = section_chunks
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._files = {}        # path -> {"offset", "matrix", "texts", "rows": (first, end)}
+        self._sections = None   # (capacity, dim) summary matrix
+        self._rows = 0
+        self._live = np.zeros(0, dtype=bool)
+        self._section_refs = [] # row -> (path, start, end) into that file's tail, None once removed
+        self._dead_rows = 0
+        self._shared = False    # live mask / refs are referenced by a view
+        self._view = None
+
+    def rebuild(self, storage):
+        with self._lock:
+            self._reset()
+            for cluster_data in storage.values():
+                for file_path, chunks in cluster_data.get("tails", {}).items():
+                    offset = len(cluster_data["files"].get(file_path, ()))
+                    self.add_file(file_path, offset, chunks)
+
+    def add_file(self, file_path, offset, chunks):
+        """offset: position of the first tail chunk within the whole file."""
+        embs = [c["embedding"] for c in chunks if "embedding" in c]
+        if not embs:
+            return
+        matrix = _normalize_rows(np.asarray(embs, dtype=np.float32))
+        with self._lock:
+            self._remove(file_path)
+            self._unshare()
+            refs = self._refs(file_path, matrix.shape[0])
+            summaries = np.vstack([matrix[start:end].mean(axis=0) for _, start, end in refs])
+            first = self._append(_normalize_rows(summaries), refs)
+            self._files[file_path] = {
+                "offset": offset,
+                "matrix": matrix,
+                "texts": [c.get("text", "") for c in chunks if "embedding" in c],
+                "rows": (first, self._rows)
+            }
+            self._view = None
+
+    def remove_file(self, file_path):
+        with self._lock:
+            if self._remove(file_path):
+                self._maybe_compact()
+                self._view = None
+
+    def move_file(self, old_path, new_path):
+        with self._lock:
+            entry = self._files.pop(old_path, None)
+            if entry is None:
+                return
+            self._remove(new_path)
+            self._unshare()
+            self._files[new_path] = entry
+            first, end = entry["rows"]
+            for row in range(first, end):
+                _, start, stop = self._section_refs[row]
+                self._section_refs[row] = (new_path, start, stop)
+            self._view = None
+
+    def has_file(self, file_path):
+        return file_path in self._files
+
+    def view(self):
+        """Immutable snapshot for lock-free queries; a new one only after a change."""
+        with self._lock:
+            if self._view is None:
+                self._shared = True
+                sections = self._sections[:self._rows] if self._rows else None
+                self._view = SectionView(
+                    dict(self._files), sections, self._live, self._section_refs, self._rows - self._dead_rows
+                )
+            return self._view
+
+    def _append(self, summaries, refs):
+        n = summaries.shape[0]
+        if self._sections is None:
+            self._sections = np.empty((max(INITIAL_CAPACITY, n), summaries.shape[1]), dtype=np.float32)
+        if self._rows + n > self._sections.shape[0]:
+            grown = np.empty((max(self._rows + n, 2 * self._sections.shape[0]), self._sections.shape[1]),
+                             dtype=np.float32)
+            grown[:self._rows] = self._sections[:self._rows]
+            self._sections = grown
+        if self._rows + n > self._live.shape[0]:
+            live = np.zeros(self._sections.shape[0], dtype=bool)
+            live[:self._rows] = self._live[:self._rows]
+            self._live = live
+
+        first = self._rows
+        self._sections[first:first + n] = summaries
+        self._live[first:first + n] = True
+        self._section_refs.extend(refs)
+        self._rows += n
+        return first
+
+    def _unshare(self):
+        """Copy-on-write: detach the mask and refs a published view still reads."""
+        if self._shared:
+            self._live = self._live.copy()
+            self._section_refs = list(self._section_refs)
+            self._shared = False
+
+    def _remove(self, file_path):
+        entry = self._files.pop(file_path, None)
+        if entry is None:
+            return False
+        self._unshare()
+        first, end = entry["rows"]
+        self._live[first:end] = False
+        self._section_refs[first:end] = [None] * (end - first)
+        self._dead_rows += end - first
+        return True
+
+    def _maybe_compact(self):
+        """Repacks the live summary rows once enough of them belong to removed files."""
+        if self._dead_rows <= COMPACT_DEAD_RATIO * max(self._rows, 1):
+            return
+        sections, files = self._sections, self._files
+        self._reset()
+        for file_path, entry in files.items():
+            first, end = entry["rows"]
+            new_first = self._append(sections[first:end], self._refs(file_path, entry["matrix"].shape[0]))
+            self._files[file_path] = {**entry, "rows": (new_first, self._rows)}
+
+    def _refs(self, file_path, n_chunks):
+        return [
+            (file_path, start, min(start + self.section_chunks, n_chunks))
+            for start in range(0, n_chunks, self.section_chunks)
+        ]
+
+    def top_chunks(self, query_embedding, top_k=10, top_sections=TOP_SECTIONS):
+        return self.view().top_chunks(query_embedding, top_k, top_sections)
+
+    def search_files(self, query_embedding, top_k=5, top_sections=TOP_SECTIONS):
+        return self.view().search_files(query_embedding, top_k, top_sections)
+
+    def __len__(self):
+        return len(self._files)
+
+
+class SectionView:
+    """Read-only SectionIndex state at one point in time (see SectionIndex.view)."""
+
+    __slots__ = ("_files", "_sections", "_live", "_section_refs", "_n_live")
+
+    def __init__(self, files, sections, live, section_refs, n_live):
+        self._files = files
+        self._sections = sections
+        self._live = live
+        self._section_refs = section_refs
+        self._n_live = n_live
+
+    def has_file(self, file_path):
+        return file_path in self._files
+
+    def _candidates(self, query_embedding, top_sections):
+        """Yields (path, entry, start, chunk_scores) for the best-matching sections."""
+        if self._sections is None or not self._n_live:
+            return
+        q = np.asarray(query_embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(q)
+        if norm:
+            q = q / norm
+
+        section_scores = self._sections @ q
+        section_scores[~self._live[:len(section_scores)]] = -np.inf
+        k = min(top_sections, self._n_live)
+        top = np.argpartition(-section_scores, k - 1)[:k]
+        for row in top:
+            file_path, start, end = self._section_refs[row]
+            entry = self._files[file_path]
+            yield file_path, entry, start, entry["matrix"][start:end] @ q
+
+    def top_chunks(self, query_embedding, top_k=10, top_sections=TOP_SECTIONS):
+        """Same shape as ChunkIndex.top_chunks: [(file_path, position, similarity, text)]."""
+        results = []
+        for file_path, entry, start, scores in self._candidates(query_embedding, top_sections):
+            for i, score in enumerate(scores):
+                pos = start + i
+                results.append((file_path, entry["offset"] + pos, float(score), entry["texts"][pos]))
+        results.sort(key=lambda r: -r[2])
+        return results[:top_k]
+
+    def search_files(self, query_embedding, top_k=5, top_sections=TOP_SECTIONS):
+        """Same shape as ChunkIndex.search_files: [(file_path, similarity, best_chunk_text)]."""
+        best = {}
+        for file_path, _, similarity, text in self.top_chunks(query_embedding, top_k=None, top_sections=top_sections):
+            if file_path not in best:
+                best[file_path] = (file_path, similarity, text)
+        return list(best.values())[:top_k]
+
+    def __len__(self):
+        return len(self._files)
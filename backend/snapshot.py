@@ -0,0 +1,49 @@
+from types import MappingProxyType
+
+
+def cluster_view(cluster_data):
+    """
+    Read-only copy of one storage cluster. Only the mappings are copied: chunk
+    lists and metadata dicts are replaced, never edited, by the writer.
+    """
+    return MappingProxyType({
+        "label": cluster_data.get("label"),
+        "label_source": cluster_data.get("label_source"),
+        "centroid": cluster_data.get("centroid"),
+        "files": MappingProxyType(dict(cluster_data["files"])),
+        "metadata": MappingProxyType(dict(cluster_data.get("metadata", {}))),
+        "tails": MappingProxyType(dict(cluster_data.get("tails", {})))
+    })
+
+
+class IndexSnapshot:
+    """
+    Immutable, versioned read view of the index: the chunk matrix, the
+    section index and the clusters with their files and metadata.
+
+    The writer builds a new snapshot after each batch of mutations and swaps
+    it in with a single reference assignment. Readers grab the current one
+    once per request and use it without locks; a replaced snapshot is freed
+    as soon as the last request holding it drops its reference.
+    """
+
+    __slots__ = ("version", "chunks", "sections", "clusters")
+
+    def __init__(self, version, chunks, sections, clusters):
+        self.version = version
+        self.chunks = chunks        # ChunkView
+        self.sections = sections    # SectionView
+        self.clusters = clusters    # cluster id -> cluster_view()
+
+    def cluster_of(self, file_path):
+        for cluster_id, cluster_data in self.clusters.items():
+            if file_path in cluster_data["files"]:
+                return cluster_id
+        return None
+
+    def label_of(self, cluster_id):
+        cluster_data = self.clusters.get(cluster_id)
+        return cluster_data["label"] if cluster_data else "Unknown"
+
+    def file_count(self):
+        return sum(len(cluster_data["files"]) for cluster_data in self.clusters.values())
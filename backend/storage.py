@@ -1,17 +1,523 @@
+import base64
+import contextlib
 import json
 import os
+import threading
+import time
 
+import numpy as np
+
+# Legacy pretty-printed JSON store (migrated on first load)
 STORAGE_FILE = "embeddings.json"
 
+# Binary store: chunk embeddings live in a memory-mapped .npy block,
+# everything else (labels, centroids, chunk text, metadata) in a compact sidecar.
+META_FILE = "embeddings.meta.json"
+EMBEDDINGS_PREFIX = "embeddings-"
+EMBEDDING_DTYPE = np.dtype(os.getenv("SEFS_EMBEDDING_DTYPE", "float32"))
+
+STORAGE_VERSION = 1
+
+# Append-only operation log replayed on top of the last snapshot
+LOG_FILE = "embeddings.wal"
+COMPACTING_LOG_FILE = LOG_FILE + ".compacting"
+LOG_FSYNC_BATCH = 64          # fsync after this many records...
+LOG_FSYNC_INTERVAL = 0.5      # ...or after this many seconds
+COMPACT_INTERVAL = 60         # seconds between compaction checks
+COMPACT_MIN_RECORDS = 500     # fold the log into a snapshot past this size
+
+# Name of the embeddings block the sidecar currently points at
+_current_embeddings_file = None
+
 
 def load_storage():
-    if not os.path.exists(STORAGE_FILE):
+    """
+    Loads storage as {cluster_id: {"label", "centroid", "files", "tails", "metadata"}}.
+    Chunk embeddings are read-only views into the memory-mapped matrix, so
+    loading itself reads only the sidecar. Startup still walks every row
+    once (file means, the normalized ChunkIndex copy, the chunk cache);
+    those pages stay file-backed and can be dropped by the OS afterwards.
+    Any operations logged since that snapshot are replayed on top.
+    """
+    data = _load_snapshot()
+    replayed = _replay_log(COMPACTING_LOG_FILE, data)
+    op_log.records = _replay_log(LOG_FILE, data)
+    replayed += op_log.records
+    if replayed:
+        print(f"SEFS: Replayed {replayed} storage log records")
+    return data
+
+
+def _load_snapshot():
+    global _current_embeddings_file
+
+    if not os.path.exists(META_FILE):
+        if os.path.exists(STORAGE_FILE):
+            return migrate_json_storage(STORAGE_FILE)
         return {}
 
-    with open(STORAGE_FILE, "r") as f:
-        return json.load(f)
+    with open(META_FILE, "r") as f:
+        meta = json.load(f)
+
+    matrix = load_embedding_matrix(meta)
+    _current_embeddings_file = meta.get("embeddings_file")
+
+    def rows_to_chunks(entries):
+        return {
+            file_path: [
+                {"text": text, "embedding": matrix[entry["row"] + i]}
+                for i, text in enumerate(entry["texts"])
+            ]
+            for file_path, entry in entries.items()
+        }
+
+    data = {}
+    for cluster_id, cluster_meta in meta["clusters"].items():
+        data[cluster_id] = {
+            "label": cluster_meta["label"],
+            "label_source": cluster_meta.get("label_source"),
+            "centroid": cluster_meta["centroid"],
+            "files": rows_to_chunks(cluster_meta["files"]),
+            "tails": rows_to_chunks(cluster_meta.get("tails", {})),
+            "metadata": cluster_meta.get("metadata", {})
+        }
+    return data
+
+
+def load_embedding_matrix(meta=None):
+    """Returns the memory-mapped (rows, dim) embedding matrix, or None."""
+    if meta is None:
+        if not os.path.exists(META_FILE):
+            return None
+        with open(META_FILE, "r") as f:
+            meta = json.load(f)
+
+    name = meta.get("embeddings_file")
+    if not name or not meta.get("rows"):
+        return np.zeros((0, meta.get("dim") or 0), dtype=EMBEDDING_DTYPE)
+    return np.load(_storage_path(name), mmap_mode="r")
 
 
 def save_storage(data):
-    with open(STORAGE_FILE, "w") as f:
-        json.dump(data, f, indent=4)
+    """
+    Writes a full snapshot: a new embeddings block, then the sidecar that
+    points at it. The sidecar swap is atomic, so a crash mid-write leaves
+    the previous snapshot intact.
+    """
+    global _current_embeddings_file
+
+    total = 0
+    dim = 0
+    for cluster_data in data.values():
+        for chunks in _all_chunk_lists(cluster_data):
+            for chunk in chunks:
+                if "embedding" in chunk:
+                    total += 1
+                    if not dim:
+                        dim = len(chunk["embedding"])
+
+    previous = _current_embeddings_file
+    snapshot = _next_snapshot_id(previous)
+    embeddings_file = f"{EMBEDDINGS_PREFIX}{snapshot}.npy"
+
+    matrix = np.empty((total, dim), dtype=EMBEDDING_DTYPE)
+    clusters_meta = {}
+    row = 0
+
+    def write_rows(entries):
+        nonlocal row
+        entries_meta = {}
+        for file_path, chunks in entries.items():
+            chunks = [c for c in chunks if "embedding" in c]
+            for i, chunk in enumerate(chunks):
+                matrix[row + i] = chunk["embedding"]
+            entries_meta[file_path] = {
+                "row": row,
+                "texts": [c.get("text", "") for c in chunks]
+            }
+            row += len(chunks)
+        return entries_meta
+
+    for cluster_id, cluster_data in data.items():
+        centroid = cluster_data.get("centroid")
+        clusters_meta[cluster_id] = {
+            "label": cluster_data.get("label"),
+            "label_source": cluster_data.get("label_source"),
+            "centroid": centroid.tolist() if isinstance(centroid, np.ndarray) else centroid,
+            "files": write_rows(cluster_data["files"]),
+            "metadata": cluster_data.get("metadata", {})
+        }
+        if cluster_data.get("tails"):
+            clusters_meta[cluster_id]["tails"] = write_rows(cluster_data["tails"])
+
+    tmp = _storage_path(embeddings_file + ".tmp")
+    with open(tmp, "wb") as f:
+        np.save(f, matrix)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, _storage_path(embeddings_file))
+
+    meta = {
+        "version": STORAGE_VERSION,
+        "dim": dim,
+        "rows": total,
+        "embeddings_file": embeddings_file,
+        "clusters": clusters_meta
+    }
+    _atomic_write_json(META_FILE, meta)
+    _current_embeddings_file = embeddings_file
+
+    # Old block is unreferenced now; open memmaps keep their inode alive
+    if previous and previous != embeddings_file:
+        try:
+            os.remove(_storage_path(previous))
+        except OSError:
+            pass
+
+
+def _all_chunk_lists(cluster_data):
+    yield from cluster_data["files"].values()
+    yield from cluster_data.get("tails", {}).values()
+
+
+def migrate_json_storage(json_path=STORAGE_FILE):
+    """
+    One-shot migration from the legacy embeddings.json to the binary store.
+    The JSON file is left in place as a backup; it is ignored once the
+    sidecar exists.
+    """
+    print(f"SEFS: Migrating {json_path} to binary storage...")
+    with open(json_path, "r") as f:
+        data = json.load(f)
+    save_storage(data)
+    print(f"SEFS: Migration complete ({META_FILE})")
+    return _load_snapshot()
+
+
+# -----------------------------
+# OPERATION LOG
+# -----------------------------
+
+class OpLog:
+    """
+    Append-only JSON-lines log of storage mutations.
+    Records are written immediately and fsynced in batches, either once
+    LOG_FSYNC_BATCH records are pending or after LOG_FSYNC_INTERVAL seconds.
+    """
+
+    def __init__(self, path=LOG_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.records = 0
+        self.generation = 0     # bumped on every mutation; lets readers detect stale caches
+        self._pending = 0
+        self._file = None
+        self._flusher = None
+
+    def append(self, record):
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self.lock:
+            if self._file is None:
+                self._file = open(self.path, "a")
+            self._file.write(line)
+            self.records += 1
+            self.generation += 1
+            self._pending += 1
+            if self._pending >= LOG_FSYNC_BATCH:
+                self._sync()
+        self._ensure_flusher()
+
+    def sync(self):
+        with self.lock:
+            self._sync()
+
+    def _sync(self):
+        if self._file is not None and self._pending:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._pending = 0
+
+    def rotate(self, target):
+        """
+        Close the active log and move it aside; new records start a fresh file.
+        If target is left over from an interrupted compaction, the active log
+        is appended to it so no records are lost.
+        """
+        with self.lock:
+            self._sync()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if not os.path.exists(self.path):
+                return False
+            if os.path.exists(target):
+                with open(target, "a") as dst, open(self.path, "r") as src:
+                    dst.write(src.read())
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                os.remove(self.path)
+            else:
+                os.replace(self.path, target)
+            self.records = 0
+            return True
+
+    def _ensure_flusher(self):
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(LOG_FSYNC_INTERVAL)
+            self.sync()
+
+
+op_log = OpLog()
+
+
+def _encode_chunks(chunks):
+    chunks = [c for c in chunks if "embedding" in c]
+    embs = np.asarray([c["embedding"] for c in chunks], dtype=np.float32)
+    return {
+        "texts": [c.get("text", "") for c in chunks],
+        "dim": int(embs.shape[1]) if embs.ndim == 2 else 0,
+        "embeddings": base64.b64encode(embs.tobytes()).decode("ascii")
+    }
+
+
+def _decode_chunks(record):
+    raw = base64.b64decode(record["embeddings"])
+    embs = np.frombuffer(raw, dtype=np.float32).reshape(-1, record["dim"]) if record["dim"] else []
+    return [{"text": text, "embedding": emb} for text, emb in zip(record["texts"], embs)]
+
+
+def log_add_file(cluster_id, file_path, chunks, metadata):
+    op_log.append({
+        "op": "add_file",
+        "cluster": str(cluster_id),
+        "path": file_path,
+        **_encode_chunks(chunks),
+        "metadata": metadata or {}
+    })
+
+
+def log_add_tail(cluster_id, file_path, chunks):
+    op_log.append({
+        "op": "add_tail",
+        "cluster": str(cluster_id),
+        "path": file_path,
+        **_encode_chunks(chunks)
+    })
+
+
+def log_remove_file(file_path):
+    op_log.append({"op": "remove_file", "path": file_path})
+
+
+def log_move_path(old_path, new_path):
+    op_log.append({"op": "move_path", "old": old_path, "new": new_path})
+
+
+def log_relabel(cluster_id, label, source=None):
+    op_log.append({"op": "relabel", "cluster": str(cluster_id), "label": label, "source": source})
+
+
+def log_centroid(cluster_id, centroid):
+    centroid = centroid.tolist() if isinstance(centroid, np.ndarray) else centroid
+    op_log.append({"op": "centroid", "cluster": str(cluster_id), "centroid": centroid})
+
+
+def _replay_log(path, data):
+    if not os.path.exists(path):
+        return 0
+    count = 0
+    good_offset = 0
+    torn = False
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                if not line.endswith(b"\n"):
+                    raise ValueError("incomplete record")
+                record = json.loads(line)
+            except ValueError:
+                # Torn final write from a crash; everything before it is intact
+                torn = True
+                break
+            _apply_record(data, record)
+            good_offset += len(line)
+            count += 1
+
+    if torn:
+        print(f"SEFS: Dropping truncated record at the end of {path}")
+        with open(path, "r+b") as f:
+            f.truncate(good_offset)
+    return count
+
+
+def _new_cluster():
+    return {"label": None, "label_source": None, "centroid": None, "files": {}, "tails": {}, "metadata": {}}
+
+
+def _drop_path(data, file_path):
+    for cluster_data in data.values():
+        if file_path in cluster_data["files"]:
+            cluster_data["files"].pop(file_path)
+            cluster_data.get("tails", {}).pop(file_path, None)
+            cluster_data.get("metadata", {}).pop(file_path, None)
+
+
+def _apply_record(data, record):
+    op = record["op"]
+    if op == "add_file":
+        path = record["path"]
+        _drop_path(data, path)
+        cluster = data.setdefault(record["cluster"], _new_cluster())
+        cluster["files"][path] = _decode_chunks(record)
+        cluster.setdefault("metadata", {})[path] = record.get("metadata", {})
+    elif op == "add_tail":
+        cluster = data.get(record["cluster"])
+        if cluster is not None and record["path"] in cluster["files"]:
+            cluster.setdefault("tails", {})[record["path"]] = _decode_chunks(record)
+    elif op == "remove_file":
+        _drop_path(data, record["path"])
+    elif op == "move_path":
+        old, new = record["old"], record["new"]
+        for cluster_data in data.values():
+            if old in cluster_data["files"]:
+                cluster_data["files"][new] = cluster_data["files"].pop(old)
+                tails = cluster_data.get("tails", {})
+                if old in tails:
+                    tails[new] = tails.pop(old)
+                metadata = cluster_data.get("metadata", {})
+                if old in metadata:
+                    metadata[new] = metadata.pop(old)
+                break
+    elif op == "relabel":
+        cluster_data = data.setdefault(record["cluster"], _new_cluster())
+        cluster_data["label"] = record["label"]
+        cluster_data["label_source"] = record.get("source")
+    elif op == "centroid":
+        data.setdefault(record["cluster"], _new_cluster())["centroid"] = record["centroid"]
+
+
+# One compaction at a time: they share the .npy temp file, sidecar and moved-aside log
+_compaction_lock = threading.Lock()
+
+
+def _copy_storage(data):
+    """
+    Copy of storage deep enough to snapshot while writers keep going: the
+    per-cluster mappings are copied, chunk lists and metadata dicts are
+    shared (writers replace them, never edit them).
+    """
+    out = {}
+    for cluster_id, cluster_data in data.items():
+        cluster_copy = dict(cluster_data)
+        cluster_copy["files"] = dict(cluster_data["files"])
+        cluster_copy["metadata"] = dict(cluster_data.get("metadata", {}))
+        if "tails" in cluster_data:
+            cluster_copy["tails"] = dict(cluster_data["tails"])
+        out[cluster_id] = cluster_copy
+    return out
+
+
+def compact_storage(data, lock=None):
+    """
+    Folds the operation log into a fresh snapshot.
+    The active log is moved aside and storage is copied under lock (the
+    writers' storage lock), so the snapshot holds exactly the logged state
+    and writers keep appending to a new log while it is written. The
+    moved-aside log is dropped once the snapshot is durable; replaying it
+    over a newer snapshot is harmless because every record is idempotent.
+    Returns False without doing anything if another compaction is running.
+    """
+    if not _compaction_lock.acquire(blocking=False):
+        return False
+    try:
+        with lock or contextlib.nullcontext():
+            if not op_log.rotate(COMPACTING_LOG_FILE) and not os.path.exists(COMPACTING_LOG_FILE):
+                return False
+            snapshot = _copy_storage(data)
+
+        try:
+            save_storage(snapshot)
+        except Exception as e:
+            print(f"SEFS: Compaction failed, keeping log for replay: {e}")
+            return False
+
+        try:
+            os.remove(COMPACTING_LOG_FILE)
+        except FileNotFoundError:
+            pass
+        print("SEFS: Storage log compacted into snapshot")
+        return True
+    finally:
+        _compaction_lock.release()
+
+
+def start_compaction(data, lock=None):
+    """Starts the background thread that periodically compacts the log."""
+    def loop():
+        while True:
+            time.sleep(COMPACT_INTERVAL)
+            if op_log.records >= COMPACT_MIN_RECORDS or os.path.exists(COMPACTING_LOG_FILE):
+                try:
+                    compact_storage(data, lock)
+                except Exception as e:
+                    print(f"SEFS: Compaction error: {e}")
+
+    thread = threading.Thread(target=loop, daemon=True)
+    thread.start()
+    return thread
+
+
+def to_jsonable(data):
+    """
+    Copy of storage with numpy embeddings converted to lists (for API responses).
+    Background-embedded tail chunks are summarized as per-file counts.
+    """
+    out = {}
+    for cluster_id, cluster_data in data.items():
+        cluster_copy = dict(cluster_data)
+        cluster_copy["tails"] = {
+            file_path: len(chunks) for file_path, chunks in cluster_data.get("tails", {}).items()
+        }
+        cluster_copy["metadata"] = dict(cluster_data.get("metadata", {}))
+        centroid = cluster_copy.get("centroid")
+        if isinstance(centroid, np.ndarray):
+            cluster_copy["centroid"] = centroid.tolist()
+        cluster_copy["files"] = {
+            file_path: [
+                {**c, "embedding": np.asarray(c["embedding"]).tolist()} if "embedding" in c else c
+                for c in chunks
+            ]
+            for file_path, chunks in cluster_data["files"].items()
+        }
+        out[cluster_id] = cluster_copy
+    return out
+
+
+def _storage_path(name):
+    return os.path.join(os.path.dirname(META_FILE), name)
+
+
+def _next_snapshot_id(previous):
+    if not previous:
+        return 1
+    try:
+        return int(previous[len(EMBEDDINGS_PREFIX):-len(".npy")]) + 1
+    except ValueError:
+        return 1
+
+
+def _atomic_write_json(path, obj):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(obj, f, separators=(",", ":"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+if __name__ == "__main__":
+    migrate_json_storage()
@@ -0,0 +1,37 @@
+import os
+import sys
+import tempfile
+
+# The backend keeps its storage files in the working directory and starts
+# module-level singletons on import, so isolate it before any test imports it
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(tempfile.mkdtemp(prefix="sefs-tests-"))
+os.environ.setdefault("SEFS_WATCHER", "0")
+os.environ.setdefault("SEFS_LABEL_CLIENT", "none")
+
+import pytest
+
+
+@pytest.fixture(autouse=True, scope="module")
+def empty_index():
+    """Every test module starts from an empty index; cluster_engine state is process-wide."""
+    import cluster_engine as engine
+
+    with engine.storage_lock:
+        for state in (
+            engine.storage, engine.clusters, engine.file_embeddings,
+            engine.cluster_sums, engine.cluster_counts, engine._cluster_views, engine._stale_views
+        ):
+            state.clear()
+        with engine._sync_cond:
+            engine.dirty_clusters.clear()
+            engine.dirty_folders.clear()
+        engine.applied_folders.clear()
+        engine.chunk_index.rebuild(engine.storage)
+        engine.section_index.rebuild(engine.storage)
+        engine.path_catalog.rebuild(engine.storage)
+        engine.keyword_labeler.rebuild(engine.storage)
+        engine.centroid_index.rebuild({})
+        engine._publish()
+    yield
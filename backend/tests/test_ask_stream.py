@@ -0,0 +1,41 @@
+import pytest
+
+fastapi = pytest.importorskip("fastapi")
+from fastapi.testclient import TestClient
+
+import main
+
+CHUNKS = [{"file": "/sefs-test/notes.txt", "chunk_id": ("/sefs-test/notes.txt", 0),
+           "text": "the answer is in here", "similarity": 0.9}]
+
+
+def _events(body):
+    return [line[len("event: "):] for line in body.splitlines() if line.startswith("event: ")]
+
+
+def test_retrieval_failure_ends_the_stream_with_an_error(monkeypatch):
+    async def failing_retrieval(question):
+        raise RuntimeError("encoder crashed")
+    monkeypatch.setattr(main, "retrieve_for_question", failing_retrieval)
+
+    response = TestClient(main.app).post("/ask/stream", json={"query": "where?"})
+    assert response.status_code == 200
+    assert _events(response.text) == ["error"]
+    assert "encoder crashed" in response.text
+
+
+def test_generation_failure_midway_sends_an_error_event(monkeypatch):
+    async def retrieval(question):
+        return CHUNKS
+
+    class BrokenClient:
+        def stream(self, prompt):
+            yield "partial "
+            raise RuntimeError("429 quota")
+
+    monkeypatch.setattr(main, "retrieve_for_question", retrieval)
+    monkeypatch.setattr(main, "get_generation_client", BrokenClient)
+
+    response = TestClient(main.app).post("/ask/stream", json={"query": "where is it, midway?"})
+    assert _events(response.text) == ["sources", "token", "error"]
+    assert "API Rate limit exceeded." in response.text
@@ -0,0 +1,31 @@
+import os
+
+import numpy as np
+
+import cluster_engine
+
+DIM = 8
+
+
+def _add(path, axis):
+    embedding = np.zeros(DIM)
+    embedding[axis] = -1.0
+    cluster_engine.add_file(path, [{"text": os.path.basename(path), "embedding": embedding.tolist()}],
+                            {"type": "txt"}, skip_naming=True)
+    return cluster_engine.find_cluster_id(path)
+
+
+def test_emptied_cluster_leaves_the_centroid_index(tmp_path):
+    path = str(tmp_path / "centroid-only.txt")
+    cluster_id = _add(path, DIM - 1)
+    assert int(cluster_id) in cluster_engine.centroid_index.cluster_ids
+
+    cluster_engine.remove_file(path)
+    assert int(cluster_id) not in cluster_engine.centroid_index.cluster_ids
+
+    # A file just like the removed one no longer lands in the empty cluster
+    again_path = str(tmp_path / "centroid-again.txt")
+    again = _add(again_path, DIM - 1)
+    assert again != cluster_id
+    assert int(again) in cluster_engine.centroid_index.cluster_ids
+    cluster_engine.remove_file(again_path)
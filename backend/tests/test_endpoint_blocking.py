@@ -0,0 +1,54 @@
+import threading
+
+import numpy as np
+import pytest
+
+fastapi = pytest.importorskip("fastapi")
+from fastapi.testclient import TestClient
+
+import cluster_engine
+import main
+
+
+def test_delete_waiting_for_storage_lock_does_not_block_the_loop(tmp_path):
+    path = tmp_path / "blocking-delete.txt"
+    path.write_text("to be deleted")
+    embedding = np.ones(8).tolist()
+    cluster_engine.add_file(str(path), [{"text": "to be deleted", "embedding": embedding}],
+                            {"type": "txt"}, skip_naming=True)
+
+    held, release = threading.Event(), threading.Event()
+
+    def long_writer():
+        with cluster_engine.storage_lock:
+            held.set()
+            release.wait(10)
+
+    writer = threading.Thread(target=long_writer)
+    writer.start()
+    held.wait()
+    try:
+        with TestClient(main.app) as client:
+            responses = []
+            deleter = threading.Thread(target=lambda: responses.append(
+                client.delete(f"/files/{path.name}", params={"path": str(path)})
+            ))
+            deleter.start()
+            deleter.join(0.5)
+            assert deleter.is_alive()   # waiting for the writer
+
+            # Other requests are still served while the delete waits
+            pinger = threading.Thread(target=lambda: responses.append(client.get("/")))
+            pinger.start()
+            pinger.join(5)
+            assert not pinger.is_alive()
+
+            release.set()
+            deleter.join(5)
+    finally:
+        release.set()
+        writer.join()
+
+    assert sorted(r.status_code for r in responses) == [200, 200]
+    assert not path.exists()
+    assert cluster_engine.find_cluster_id(str(path)) is None
@@ -0,0 +1,22 @@
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+from extractor import extract_document
+
+
+def test_blank_pages_count_as_read(tmp_path):
+    path = str(tmp_path / "blank-first.pdf")
+    doc = fitz.open()
+    doc.new_page()                       # blank page, no text
+    page = doc.new_page()
+    page.insert_text((72, 72), "alpha beta gamma delta")
+    doc.save(path)
+    doc.close()
+
+    # The budget runs out on the last page: every page was read, nothing is estimated
+    text, metadata = extract_document(path, char_budget=5)
+    assert "alpha" in text
+    assert metadata["pages"] == 2
+    assert metadata["words"] == 4
+    assert "words_estimated" not in metadata
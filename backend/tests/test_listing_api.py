@@ -0,0 +1,115 @@
+import numpy as np
+import pytest
+
+fastapi = pytest.importorskip("fastapi")
+from fastapi.testclient import TestClient
+
+import cluster_engine
+import listing
+import main
+
+DIM = 8
+
+
+def _add(path, seed, file_type):
+    rng = np.random.default_rng(seed)
+    chunks = [{"text": f"chunk {i} of {path}", "embedding": rng.normal(size=DIM).tolist()} for i in range(2)]
+    cluster_engine.add_file(path, chunks, {"type": file_type, "filename": path.rsplit("/", 1)[-1]}, skip_naming=True)
+
+
+@pytest.fixture(scope="module")
+def client():
+    for i in range(12):
+        _add(f"/sefs-test/doc{i:02d}.{'pdf' if i % 3 == 0 else 'txt'}", i, "pdf" if i % 3 == 0 else "txt")
+    return TestClient(main.app)
+
+
+def test_clusters_default_is_full_storage_layout(client):
+    response = client.get("/clusters")
+    assert response.status_code == 200
+    clusters = response.json()
+    files = [f for cluster in clusters.values() for f in cluster["files"]]
+    assert len(files) == 12
+    first = next(iter(clusters.values()))
+    chunk = next(iter(first["files"].values()))[0]
+    assert "embedding" in chunk and "text" in chunk
+
+
+def test_clusters_projections(client):
+    summary = client.get("/clusters", params={"fields": "summary"}).json()
+    for cluster in summary.values():
+        assert set(cluster) == {"label", "label_source", "file_count", "files"}
+        assert all(isinstance(count, int) for count in cluster["files"].values())
+    labels = client.get("/clusters", params={"fields": "labels"}).json()
+    assert sum(cluster["file_count"] for cluster in labels.values()) == 12
+    assert client.get("/clusters", params={"fields": "bogus"}).status_code == 400
+
+
+def test_files_default_and_names(client):
+    files = client.get("/files").json()
+    assert len(files) == 12
+    assert all("metadata" in entry for entry in files)
+    names = client.get("/files", params={"fields": "names"}).json()
+    assert all(set(entry) == {"file", "cluster_id", "cluster_label"} for entry in names)
+
+
+def test_files_type_filter_and_cursor_pagination(client):
+    seen, cursor = [], None
+    while True:
+        params = {"fields": "names", "type": "pdf", "limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        page = client.get("/files", params=params).json()
+        seen += [entry["file"] for entry in page["items"]]
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert len(seen) == len(set(seen)) == 4
+    assert all(path.endswith(".pdf") for path in seen)
+    assert client.get("/files", params={"cursor": "not-a-cursor"}).status_code == 400
+
+
+def test_clusters_cursor_pagination(client):
+    all_ids = set(client.get("/clusters", params={"fields": "labels"}).json())
+    seen, cursor = [], None
+    while True:
+        params = {"fields": "labels", "limit": 1}
+        if cursor:
+            params["cursor"] = cursor
+        page = client.get("/clusters", params=params).json()
+        seen += list(page["items"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert set(seen) == all_ids and len(seen) == len(all_ids)
+
+
+@pytest.mark.parametrize("path", ["/clusters", "/files"])
+def test_invalid_params_are_rejected_before_revalidation(client, path):
+    etag = client.get(path).headers["etag"]
+    for params in ({"fields": "bogus"}, {"cursor": "not-a-cursor"}, {"cursor": listing.encode_cursor("x")},
+                   {"limit": -1}):
+        response = client.get(path, params=params, headers={"If-None-Match": etag})
+        assert response.status_code == 400, params
+
+
+@pytest.mark.parametrize("path", ["/clusters", "/files"])
+def test_etag_revalidation_returns_304(client, path):
+    first = client.get(path, params={"fields": "names" if path == "/files" else "summary"})
+    etag = first.headers["etag"]
+    again = client.get(path, params={"fields": "names" if path == "/files" else "summary"},
+                       headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.content == b""
+
+    _add(f"/sefs-test/new-for{path.replace('/', '-')}.txt", 99, "txt")
+    changed = client.get(path, headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+
+
+def test_large_listing_is_gzipped(client):
+    response = client.get("/clusters", headers={"Accept-Encoding": "gzip"})
+    assert response.headers.get("content-encoding") == "gzip"
+    # TestClient decodes transparently; the body is still the JSON listing
+    assert isinstance(response.json(), dict)
@@ -0,0 +1,51 @@
+import json
+import threading
+
+from manifest import Manifest
+
+
+def test_concurrent_writers_flush_and_find_moved(tmp_path):
+    manifest = Manifest(str(tmp_path / "manifest.json"))
+    errors = []
+    stop = threading.Event()
+
+    def writer(prefix):
+        try:
+            for i in range(2000):
+                path = str(tmp_path / f"{prefix}-{i % 50}.txt")
+                manifest.record(path, {"size": i, "mtime": 0.0, "inode": i, "hash": "same"})
+                if i % 3 == 0:
+                    manifest.forget(path)
+        except Exception as e:
+            errors.append(e)
+
+    def reader():
+        try:
+            while not stop.is_set():
+                manifest.find_moved("same")
+        except Exception as e:
+            errors.append(e)
+
+    def flusher():
+        try:
+            while not stop.is_set():
+                manifest._dirty = True
+                manifest.flush()
+        except Exception as e:
+            errors.append(e)
+
+    background = [threading.Thread(target=reader), threading.Thread(target=flusher), threading.Thread(target=flusher)]
+    writers = [threading.Thread(target=writer, args=(p,)) for p in ("a", "b")]
+    for thread in background + writers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    stop.set()
+    for thread in background:
+        thread.join()
+
+    assert errors == []
+    manifest._dirty = True
+    manifest.flush()
+    with open(manifest.path) as f:
+        assert json.load(f) == manifest.entries
@@ -0,0 +1,29 @@
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("watchdog")
+
+import cluster_engine
+import manifest as manifest_module
+import watcher
+
+
+def test_startup_scan_compares_stat_fields_without_hashing(tmp_path, monkeypatch):
+    monkeypatch.setattr(watcher, "ROOT_FOLDER", str(tmp_path))
+    indexed = tmp_path / "indexed.txt"
+    indexed.write_text("already indexed")
+    fresh = tmp_path / "fresh.txt"
+    fresh.write_text("never seen")
+    (tmp_path / ".hidden").write_text("skipped")
+
+    cluster_engine.add_file(str(indexed), [{"text": "already indexed", "embedding": np.ones(8).tolist()}],
+                            {"type": "txt"}, skip_naming=True)
+    watcher.manifest.record(str(indexed), manifest_module.fingerprint(str(indexed)))
+
+    def no_hashing(path):
+        raise AssertionError(f"hashed {path} during the scan")
+    monkeypatch.setattr(manifest_module, "content_hash", no_hashing)
+
+    assert watcher._pending_index_paths() == [os.path.abspath(fresh)]
@@ -0,0 +1,46 @@
+import numpy as np
+
+import cluster_engine
+from event_bus import FILE_UPDATED
+from manifest import manifest
+
+DIM = 8
+
+
+def _chunks(text, axis):
+    embedding = np.zeros(DIM)
+    embedding[axis] = 1.0
+    embedding[3] = 0.5
+    return [{"text": text, "embedding": embedding.tolist()}]
+
+
+def test_reindex_is_a_single_write(tmp_path, monkeypatch):
+    path = str(tmp_path / "replaced.txt")
+    cluster_engine.add_file(path, _chunks("old text", 4), {"type": "txt"}, skip_naming=True)
+    old_cluster_id = cluster_engine.find_cluster_id(path)
+    manifest.record(path, {"hash": "old", "size": 8, "mtime": 1.0})
+
+    snapshots, published = [], []
+    real_publish = cluster_engine._publish
+
+    def publish():
+        real_publish()
+        snapshots.append(cluster_engine.current_snapshot())
+    monkeypatch.setattr(cluster_engine, "_publish", publish)
+    monkeypatch.setattr(cluster_engine.event_bus, "publish", lambda events, version=None: published.extend(events))
+    forgotten = []
+    monkeypatch.setattr(manifest, "forget", forgotten.append)
+
+    cluster_engine.replace_file(path, _chunks("new text", 5), {"type": "txt"},
+                                fingerprint={"hash": "new", "size": 8, "mtime": 2.0})
+
+    assert len(snapshots) == 1
+    assert path in {f for view in snapshots[0].clusters.values() for f in view["files"]}
+    file_events = [(event_type, data) for event_type, data in published if data.get("file") == path]
+    assert [event_type for event_type, _ in file_events] == [FILE_UPDATED]
+    assert file_events[0][1]["old_cluster_id"] == old_cluster_id
+    assert forgotten == []
+    assert manifest.get(path)["hash"] == "new"
+
+    monkeypatch.undo()
+    cluster_engine.remove_file(path)
@@ -0,0 +1,73 @@
+import numpy as np
+
+from section_index import SectionIndex
+
+
+def _chunks(rng, n, dim=8):
+    return [{"text": f"tail {i}", "embedding": rng.normal(size=dim).tolist()} for i in range(n)]
+
+
+def _brute_force_top(files, query, k):
+    """Best individual tail chunks over every file, as (path, position)."""
+    q = query / np.linalg.norm(query)
+    scored = []
+    for path, (offset, chunks) in files.items():
+        for i, chunk in enumerate(chunks):
+            emb = np.asarray(chunk["embedding"])
+            scored.append((float(emb @ q / np.linalg.norm(emb)), path, offset + i))
+    scored.sort(reverse=True)
+    return [(path, pos) for _, path, pos in scored[:k]]
+
+
+def test_changes_only_touch_their_file_and_views_stay_valid():
+    rng = np.random.default_rng(3)
+    index = SectionIndex(section_chunks=4)
+    files = {f"/doc{i}.pdf": (20, _chunks(rng, 10)) for i in range(6)}
+    for path, (offset, chunks) in files.items():
+        index.add_file(path, offset, chunks)
+
+    before = index.view()
+    query = rng.normal(size=8)
+    expected_before = before.top_chunks(query, top_k=3, top_sections=100)
+
+    # Remove one, move one, replace one
+    index.remove_file("/doc0.pdf")
+    files.pop("/doc0.pdf")
+    index.move_file("/doc1.pdf", "/moved/doc1.pdf")
+    files["/moved/doc1.pdf"] = files.pop("/doc1.pdf")
+    files["/doc2.pdf"] = (20, _chunks(rng, 6))
+    index.add_file("/doc2.pdf", *files["/doc2.pdf"])
+
+    after = index.view()
+    assert index.view() is after    # no change, no new view
+    got = [(path, pos) for path, pos, _, _ in after.top_chunks(query, top_k=5, top_sections=100)]
+    assert got == _brute_force_top(files, query, 5)
+    expected_after = after.top_chunks(query, top_k=5, top_sections=100)
+    assert not after.has_file("/doc0.pdf") and after.has_file("/moved/doc1.pdf")
+
+    # Enough removals repack the summary matrix
+    for path in ("/doc3.pdf", "/doc4.pdf"):
+        index.remove_file(path)
+        files.pop(path)
+    assert index._dead_rows == 0
+    got = [(path, pos) for path, pos, _, _ in index.view().top_chunks(query, top_k=5, top_sections=100)]
+    assert got == _brute_force_top(files, query, 5)
+
+    # The earlier views still answer from their own state
+    assert after.top_chunks(query, top_k=5, top_sections=100) == expected_after
+    assert before.top_chunks(query, top_k=3, top_sections=100) == expected_before
+    assert before.has_file("/doc0.pdf") and not before.has_file("/moved/doc1.pdf")
+
+
+def test_move_does_not_recompute_summaries(monkeypatch):
+    rng = np.random.default_rng(4)
+    index = SectionIndex(section_chunks=4)
+    index.add_file("/long.pdf", 20, _chunks(rng, 12))
+    sections = index._sections
+
+    import section_index
+    monkeypatch.setattr(section_index, "_normalize_rows", lambda mat: (_ for _ in ()).throw(AssertionError))
+    index.move_file("/long.pdf", "/folder/long.pdf")
+    view = index.view()
+    assert index._sections is sections
+    assert [path for path, _, _, _ in view.top_chunks(rng.normal(size=8), top_k=3)] == ["/folder/long.pdf"] * 3
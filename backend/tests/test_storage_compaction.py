@@ -0,0 +1,72 @@
+import threading
+
+import numpy as np
+
+import cluster_engine
+import storage
+
+DIM = 8
+
+
+def _add(path, seed):
+    rng = np.random.default_rng(seed)
+    chunks = [{"text": f"{path} {i}", "embedding": rng.normal(size=DIM).tolist()} for i in range(3)]
+    cluster_engine.add_file(path, chunks, {"type": "txt"}, skip_naming=True)
+
+
+def _reload():
+    """Storage as a restart would see it: snapshot plus both logs replayed."""
+    storage.op_log.sync()   # records are flushed in batches
+    data = storage._load_snapshot()
+    storage._replay_log(storage.COMPACTING_LOG_FILE, data)
+    storage._replay_log(storage.LOG_FILE, data)
+    return data
+
+
+def _files(data):
+    return {f for cluster_data in data.values() for f in cluster_data["files"]}
+
+
+def test_concurrent_compactions_and_writes_keep_every_file():
+    for i in range(20):
+        _add(f"/sefs-compact/a{i}.txt", i)
+
+    errors = []
+    start = threading.Barrier(4)
+
+    def compact():
+        start.wait()
+        try:
+            for _ in range(5):
+                cluster_engine.compact_now()
+        except Exception as e:
+            errors.append(e)
+
+    def write():
+        start.wait()
+        try:
+            for i in range(40):
+                _add(f"/sefs-compact/b{i}.txt", 100 + i)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=compact) for _ in range(3)] + [threading.Thread(target=write)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert _files(_reload()) == _files(cluster_engine.storage)
+
+    _add("/sefs-compact/last.txt", 999)
+    assert cluster_engine.compact_now()
+    assert _files(_reload()) == _files(cluster_engine.storage)
+
+
+def test_compaction_is_skipped_while_another_runs():
+    storage._compaction_lock.acquire()
+    try:
+        assert cluster_engine.compact_now() is False
+    finally:
+        storage._compaction_lock.release()
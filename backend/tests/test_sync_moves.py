@@ -0,0 +1,141 @@
+import os
+
+import numpy as np
+
+import cluster_engine
+
+DIM = 8
+
+
+def test_manually_moved_file_is_reconciled(tmp_path, monkeypatch):
+    root = tmp_path / "root"
+    root.mkdir()
+    monkeypatch.setattr(cluster_engine.path_catalog, "root_path", str(root))
+
+    rng = np.random.default_rng(7)
+    base = rng.normal(size=DIM)
+    for i in range(2):
+        path = str(root / f"moved-doc{i}.txt")
+        with open(path, "w") as f:
+            f.write(f"document {i}")
+        chunks = [{"text": f"document {i}", "embedding": (base + 0.01 * rng.normal(size=DIM)).tolist()}]
+        cluster_engine.add_file(path, chunks, {"type": "txt"}, skip_naming=True)
+
+    cluster_engine.sync_folders(str(root))
+    organized = cluster_engine.path_catalog.lookup("moved-doc0.txt")[0]
+    cluster_id = cluster_engine.find_cluster_id(organized)
+    folder = os.path.dirname(organized)
+    assert cluster_id is not None and folder != str(root)
+
+    # The user drags the file back out of its cluster folder
+    dragged = str(root / "moved-doc0.txt")
+    os.rename(organized, dragged)
+    assert cluster_engine.rename_file(organized, dragged)
+    assert cluster_id in cluster_engine.dirty_clusters
+
+    cluster_engine.sync_folders(str(root))
+    assert os.path.exists(organized)
+    assert not os.path.exists(dragged)
+    assert cluster_engine.find_cluster_id(organized) == cluster_id
+
+
+def test_folder_rename_rekeys_every_file_inside(tmp_path, monkeypatch):
+    root = tmp_path / "root"
+    root.mkdir()
+    monkeypatch.setattr(cluster_engine.path_catalog, "root_path", str(root))
+
+    for i, axis in enumerate((0, 1)):
+        path = str(root / f"relabel-doc{i}.txt")
+        with open(path, "w") as f:
+            f.write(f"document {i}")
+        embedding = np.zeros(DIM)
+        embedding[axis] = 1.0
+        cluster_engine.add_file(path, [{"text": f"document {i}", "embedding": embedding.tolist()}],
+                                {"type": "txt"}, skip_naming=True)
+    cluster_engine.sync_folders(str(root))
+    own = cluster_engine.path_catalog.lookup("relabel-doc0.txt")[0]
+    other = cluster_engine.path_catalog.lookup("relabel-doc1.txt")[0]
+    cluster_id, other_id = cluster_engine.find_cluster_id(own), cluster_engine.find_cluster_id(other)
+    assert cluster_id != other_id
+
+    with cluster_engine.storage_lock:
+        # A file of another cluster sits in this cluster's folder when it is relabeled
+        stray = os.path.join(os.path.dirname(own), "relabel-doc1.txt")
+        os.rename(other, stray)
+        cluster_engine._move_path(cluster_engine.storage[other_id], other, stray)
+        cluster_engine._set_label(cluster_id, "Renamed Relabel Folder", "llm")
+
+        new_folder = os.path.join(str(root), cluster_engine._folder_names()[cluster_id])
+        assert cluster_engine.path_catalog.lookup("relabel-doc0.txt") == [os.path.join(new_folder, "relabel-doc0.txt")]
+        moved_stray = os.path.join(new_folder, "relabel-doc1.txt")
+        assert os.path.exists(moved_stray)
+        assert cluster_engine.find_cluster_id(moved_stray) == other_id
+        assert other_id in cluster_engine.dirty_clusters
+
+
+def test_same_basename_in_one_cluster_is_not_overwritten(tmp_path, monkeypatch):
+    root = tmp_path / "root"
+    (root / "sub").mkdir(parents=True)
+    monkeypatch.setattr(cluster_engine.path_catalog, "root_path", str(root))
+
+    embedding = np.zeros(DIM)
+    embedding[2] = 1.0
+    paths = [str(root / "notes.txt"), str(root / "sub" / "notes.txt")]
+    for text, path in zip(("first copy", "second copy"), paths):
+        with open(path, "w") as f:
+            f.write(text)
+        cluster_engine.add_file(path, [{"text": text, "embedding": embedding.tolist()}],
+                                {"type": "txt"}, skip_naming=True)
+    cluster_id = cluster_engine.find_cluster_id(paths[0])
+    assert cluster_engine.find_cluster_id(paths[1]) == cluster_id
+
+    cluster_engine.sync_folders(str(root), full=True)
+    indexed = sorted(p for p in cluster_engine.storage[cluster_id]["files"] if "notes" in os.path.basename(p))
+    assert len(indexed) == 2
+    contents = set()
+    for path in indexed:
+        with open(path) as f:
+            contents.add(f.read())
+    assert contents == {"first copy", "second copy"}
+    assert sorted(map(os.path.basename, indexed)) == ["notes (2).txt", "notes.txt"]
+    assert len(cluster_engine.clusters[int(cluster_id)]) == len(set(cluster_engine.clusters[int(cluster_id)]))
+
+    # A second pass leaves the numbered copy where it is
+    cluster_engine.sync_folders(str(root), full=True)
+    assert sorted(p for p in cluster_engine.storage[cluster_id]["files"] if "notes" in os.path.basename(p)) == indexed
+
+
+def test_skipped_folder_rename_is_not_taken_for_a_manual_one(tmp_path, monkeypatch):
+    root = tmp_path / "root"
+    root.mkdir()
+    monkeypatch.setattr(cluster_engine.path_catalog, "root_path", str(root))
+
+    path = str(root / "pinned-doc.txt")
+    with open(path, "w") as f:
+        f.write("pinned")
+    embedding = np.zeros(DIM)
+    embedding[5] = 1.0
+    cluster_engine.add_file(path, [{"text": "pinned", "embedding": embedding.tolist()}],
+                            {"type": "txt"}, skip_naming=True)
+    cluster_engine.sync_folders(str(root))
+    organized = cluster_engine.path_catalog.lookup("pinned-doc.txt")[0]
+    cluster_id = cluster_engine.find_cluster_id(organized)
+
+    # The new folder name is taken, so the rename is skipped and the file stays put
+    (root / "Blocked Name").mkdir()
+    with cluster_engine.storage_lock:
+        cluster_engine._set_label(cluster_id, "Blocked Name", "llm")
+    assert os.path.exists(organized)
+
+    cluster_engine.sync_folders(str(root))
+    assert cluster_engine.storage[cluster_id]["label"] == "Blocked Name"
+    assert cluster_engine.storage[cluster_id]["label_source"] == "llm"
+    moved = cluster_engine.path_catalog.lookup("pinned-doc.txt")[0]
+    assert os.path.dirname(moved) == str(root / "Blocked Name")
+
+    # A folder the user renames is still adopted as the label
+    os.rename(root / "Blocked Name", root / "My Own Name")
+    cluster_engine.mark_dirty(cluster_id)
+    cluster_engine.sync_folders(str(root))
+    assert cluster_engine.storage[cluster_id]["label"] == "My Own Name"
+    assert cluster_engine.storage[cluster_id]["label_source"] == "manual"
@@ -0,0 +1,132 @@
+import os
+import threading
+import zlib
+from collections import OrderedDict
+
+from extractor import extract_text
+from manifest import manifest, content_hash
+
+# Extracted text kept in memory (approximate, in characters) before spilling
+TEXT_CACHE_MAX_CHARS = int(os.getenv("SEFS_TEXT_CACHE_MB", "64")) * 1024 * 1024
+# Evicted texts are written here when set; empty disables the disk tier
+TEXT_CACHE_DIR = os.getenv("SEFS_TEXT_CACHE_DIR", "")
+
+
+class TextCache:
+    """
+    Extracted document text keyed by content hash.
+
+    An LRU bounded by total text size; entries pushed out of memory are
+    written to spill_dir (compressed) if one is configured and read back on
+    a later miss. Keying by content means a renamed or copied file hits the
+    same entry, and an edited file can never return stale text.
+    """
+
+    def __init__(self, max_chars=TEXT_CACHE_MAX_CHARS, spill_dir=TEXT_CACHE_DIR):
+        self.max_chars = max_chars
+        self.spill_dir = spill_dir or None
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if self.spill_dir:
+            os.makedirs(self.spill_dir, exist_ok=True)
+
+    def get(self, file_hash):
+        with self._lock:
+            text = self._entries.get(file_hash)
+            if text is not None:
+                self._entries.move_to_end(file_hash)
+                self.hits += 1
+                return text
+        text = self._read_spill(file_hash)
+        if text is None:
+            self.misses += 1
+            return None
+        self.disk_hits += 1
+        self.put(file_hash, text, spill=False)
+        return text
+
+    def put(self, file_hash, text, spill=True):
+        if text is None:
+            return
+        if len(text) > self.max_chars:
+            if spill:
+                self._write_spill(file_hash, text)
+            return
+        evicted = []
+        with self._lock:
+            old = self._entries.pop(file_hash, None)
+            if old is not None:
+                self._size -= len(old)
+            self._entries[file_hash] = text
+            self._size += len(text)
+            while self._size > self.max_chars:
+                key, value = self._entries.popitem(last=False)
+                self._size -= len(value)
+                evicted.append((key, value))
+        for key, value in evicted:
+            self._write_spill(key, value)
+
+    def get_text(self, file_path, file_hash=None):
+        """
+        Full extracted text of a file, extracting only on a cache miss.
+        The hash comes from the manifest when the file is unchanged since it
+        was indexed, otherwise the file is hashed.
+        """
+        try:
+            if file_hash is None:
+                st = os.stat(file_path)
+                entry = manifest.get(file_path)
+                if entry and entry.get("hash") and manifest.is_unchanged(file_path, st):
+                    file_hash = entry["hash"]
+                else:
+                    file_hash = content_hash(file_path)
+        except OSError:
+            return ""
+
+        text = self.get(file_hash)
+        if text is None:
+            text = extract_text(file_path)
+            self.put(file_hash, text)
+        return text
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "chars": self._size,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses
+        }
+
+    def _spill_path(self, file_hash):
+        return os.path.join(self.spill_dir, f"{file_hash}.txt.z")
+
+    def _write_spill(self, file_hash, text):
+        if not self.spill_dir:
+            return
+        path = self._spill_path(file_hash)
+        if os.path.exists(path):
+            return
+        tmp = path + ".tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(zlib.compress(text.encode("utf-8", "ignore")))
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"SEFS: Text cache spill failed: {e}")
+
+    def _read_spill(self, file_hash):
+        if not self.spill_dir:
+            return None
+        try:
+            with open(self._spill_path(file_hash), "rb") as f:
+                return zlib.decompress(f.read()).decode("utf-8")
+        except (OSError, zlib.error):
+            return None
+
+
+text_cache = TextCache()
@@ -1,15 +1,23 @@
 import time
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-from sentence_transformers import SentenceTransformer
 from sklearn.metrics.pairwise import cosine_similarity
-from cluster_engine import storage, sync_folders
+from cluster_engine import storage, sync_folders, request_sync, path_catalog
 from cluster_sync import sync_clusters_to_disk # Keep if used else rely on sync_folders
-from extractor import extract_text
+from extractor import prepare_file
+from embed_queue import EmbeddingQueue, ChunkEmbeddingCache, encode_cached
+from manifest import manifest, fingerprint, prepare_with_fingerprint
+from text_cache import text_cache
+from coverage import CoverageWorker
+from ingest_pool import IngestPool
+import cluster_engine
+import multiprocessing
 import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-model = SentenceTransformer("all-MiniLM-L6-v2")
 ROOT_FOLDER = os.path.join(os.path.dirname(__file__), "root_files")
+path_catalog.root_path = ROOT_FOLDER
 
 SIMILARITY_THRESHOLD = 0.3
 
@@ -18,72 +26,146 @@ SIMILARITY_THRESHOLD = 0.3
 # format: {abs_path: last_mtime}
 file_mtime_cache = {}
 
+# Files clustered since the last folder sync
+_needs_organize = threading.Event()
+
+# Paths owned by the upload pool while they are written and indexed;
+# watchdog events for them are ignored so each upload is processed once
+_claimed_paths = set()
+_claims_lock = threading.Lock()
+
+
+def claim_path(abs_path):
+    with _claims_lock:
+        _claimed_paths.add(abs_path)
+
+
+def release_path(abs_path):
+    with _claims_lock:
+        _claimed_paths.discard(abs_path)
+
+
+def _is_claimed(file_path):
+    return os.path.abspath(file_path) in _claimed_paths
+
+
+def _organize_after_batch():
+    """Runs once per embedding batch so a burst of files costs one folder sync."""
+    if _needs_organize.is_set():
+        _needs_organize.clear()
+        request_sync(ROOT_FOLDER)
+
+
+# Chunk embeddings by content hash, so edits only re-encode new chunks
+chunk_cache = ChunkEmbeddingCache()
+chunk_cache.seed(storage)
+
+# Cross-file micro-batching between extraction and clustering
+embedding_queue = EmbeddingQueue(after_batch=_organize_after_batch, cache=chunk_cache)
+
+# Remainder of long documents, embedded only while ingest is idle
+coverage_worker = CoverageWorker(
+    is_busy=lambda: embedding_queue.pending() > 0 or indexing_progress["state"] != "idle",
+    cache=chunk_cache
+)
+
+
 class FileHandler(FileSystemEventHandler):
 
     def on_created(self, event):
-        if not event.is_directory:
-            self.process_file(event.src_path)
+        if not event.is_directory and not _is_claimed(event.src_path):
+            self.submit_file(event.src_path)
 
     def on_modified(self, event):
+        if not event.is_directory and not _is_claimed(event.src_path):
+            self.submit_file(event.src_path)
+
+    def on_moved(self, event):
         if not event.is_directory:
-            self.process_file(event.src_path)
+            # Keep the index keyed by the new path; unknown files are indexed fresh
+            from cluster_engine import rename_file
+            src_path = os.path.abspath(event.src_path)
+            dest_path = os.path.abspath(event.dest_path)
+            if not rename_file(src_path, dest_path):
+                self.submit_file(dest_path)
 
     def on_deleted(self, event):
         if not event.is_directory:
             file_path = os.path.abspath(event.src_path)
-            removed = False
-            for cluster_data in storage.values():
-                if file_path in cluster_data["files"]:
-                    cluster_data["files"].pop(file_path)
-                    if "metadata" in cluster_data and file_path in cluster_data["metadata"]:
-                        cluster_data["metadata"].pop(file_path)
-                    removed = True
-                    break
-            
-            if removed:
+            from cluster_engine import remove_file
+            if remove_file(file_path) is not None:
                 print(f"SEFS: Removed deleted file from index: {file_path}")
-                from cluster_engine import save_storage, sync_folders
-                save_storage(storage)
-                sync_folders(ROOT_FOLDER)
+                request_sync(ROOT_FOLDER)
 
     def process_file(self, file_path):
-        if not os.path.exists(file_path):
+        """Extract, embed, cluster and organize one file, blocking until it is clustered."""
+        future = self.submit_file(file_path)
+        if future is None:
             return
+        try:
+            future.result()
+        except Exception:
+            pass  # already reported by _finish_file
+
+    def submit_file(self, file_path, progress=None):
+        """
+        Extracts and chunks a file, then hands its chunks to the embedding queue.
+        Returns a Future that resolves once the file is clustered, or None if
+        there was nothing to do.
+        progress(stage) is called as the file enters extracting, embedding,
+        clustering and organizing (or failed).
+        """
+        progress = progress or _no_progress
+        if not os.path.exists(file_path):
+            return None
 
         abs_path = os.path.abspath(file_path)
         
-        # Check mtime to skip unchanged files (Feature 6)
+        # Check mtime to skip duplicate events for a file already in flight (Feature 6)
         try:
             mtime = os.path.getmtime(abs_path)
             if file_mtime_cache.get(abs_path) == mtime:
-                return
+                return None
             file_mtime_cache[abs_path] = mtime
         except Exception:
             pass
 
         try:
-            from extractor import extract_text, chunk_text, extract_metadata
-            
-            content = extract_text(abs_path)
-            if not content:
+            # Skip files whose content is already indexed (persistent manifest)
+            fp = _check_fingerprint(abs_path)
+            if fp is None:
+                return None
+
+            # Reuse cached text for this content; otherwise stream only the chunk budget
+            progress("extracting")
+            content = text_cache.get(fp["hash"])
+            chunks, metadata = prepare_file(abs_path, content=content)
+            if not chunks:
                 print(f"SEFS: Skipping empty or unreadable file: {file_path}")
-                return
+                return None
 
-            # Feature 1: Semantic Chunking
-            chunks = chunk_text(content, chunk_size=500, overlap=100)
-            
-            # Feature 6: Limit chunks per file (max 20)
-            if len(chunks) > 20:
-                print(f"SEFS: Truncating {file_path} to 20 chunks")
-                chunks = chunks[:20]
+            # Feature 6: Batch embedding (chunks from many files share one encode call)
+            print(f"SEFS: Queued {len(chunks)} chunks for {os.path.basename(file_path)}")
+            progress("embedding")
+            return embedding_queue.submit(
+                chunks,
+                callback=lambda embeddings: self._finish_file(abs_path, chunks, embeddings, metadata, fp, progress)
+            )
 
-            if not chunks:
-                return
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            import traceback
+            print("Processing error:", e)
+            traceback.print_exc()
+            progress("failed")
+            return None
 
-            # Feature 6: Batch embedding (using model.encode(list))
-            print(f"SEFS: Embedding {len(chunks)} chunks for {os.path.basename(file_path)}...")
-            embeddings = model.encode(chunks)
-            
+    def _finish_file(self, abs_path, chunks, embeddings, metadata, fp=None, progress=None):
+        """Runs on the embedding worker once this file's vectors are ready."""
+        progress = progress or _no_progress
+        try:
+            progress("clustering")
             chunks_data = []
             for text, emb in zip(chunks, embeddings):
                 chunks_data.append({
@@ -91,30 +173,77 @@ class FileHandler(FileSystemEventHandler):
                     "embedding": emb.tolist()
                 })
 
-            # Feature 3: Metadata extraction
-            metadata = extract_metadata(abs_path)
-
-            # Re-clustering: Remove from old cluster if it exists
-            for cluster_data in storage.values():
-                if abs_path in cluster_data["files"]:
-                    cluster_data["files"].pop(abs_path)
-                    if "metadata" in cluster_data and abs_path in cluster_data["metadata"]:
-                        cluster_data["metadata"].pop(abs_path)
-                    break
-
-            from cluster_engine import add_file
-            add_file(abs_path, chunks_data, metadata)
+            # Re-clustering: the old entry (if any) is swapped out in the same write
+            from cluster_engine import replace_file
+            replace_file(abs_path, chunks_data, metadata, fingerprint=fp)
+            if metadata.get("truncated"):
+                coverage_worker.submit(abs_path)
 
-            # Organize folders
-            sync_folders(ROOT_FOLDER)
-            print("File processed & organized:", file_path)
+            # Organize folders once the current batch is done
+            progress("organizing")
+            _needs_organize.set()
+            print("File processed:", abs_path)
 
-        except FileNotFoundError:
-            pass
         except Exception as e:
             import traceback
             print("Processing error:", e)
             traceback.print_exc()
+            progress("failed")
+            raise
+
+
+def _no_progress(stage):
+    pass
+
+
+# Uploads: bounded queue and worker pool instead of a thread per request
+ingest_pool = IngestPool(
+    FileHandler(),
+    sync_passes=lambda: cluster_engine.sync_passes,
+    release=release_path
+)
+
+
+def _check_fingerprint(abs_path):
+    """
+    Compares a file against the persistent manifest.
+    Returns None when nothing needs to be done (unchanged, or a known file
+    that was moved), otherwise the fresh fingerprint to record once the file
+    has been indexed.
+    """
+    from cluster_engine import find_cluster_id
+
+    st = os.stat(abs_path)
+    indexed = find_cluster_id(abs_path) is not None
+    if indexed and manifest.is_unchanged(abs_path, st):
+        return None
+
+    return _settle_fingerprint(abs_path, fingerprint(abs_path, st), indexed)
+
+
+def _settle_fingerprint(abs_path, fp, indexed=None):
+    """
+    The hashing half of _check_fingerprint, for a fingerprint that is
+    already computed (the bulk indexer gets it from its extraction pool).
+    """
+    from cluster_engine import find_cluster_id, rename_file
+
+    if indexed is None:
+        indexed = find_cluster_id(abs_path) is not None
+    entry = manifest.get(abs_path)
+    if indexed and entry and entry.get("hash") == fp["hash"]:
+        # Touched but identical content: refresh the stat fields only
+        manifest.record(abs_path, fp)
+        return None
+
+    if not indexed:
+        old_path = manifest.find_moved(fp["hash"])
+        if old_path and rename_file(old_path, abs_path):
+            print(f"SEFS: Recognized moved file {os.path.basename(old_path)} -> {abs_path}")
+            manifest.record(abs_path, fp)
+            return None
+
+    return fp
 
 
 def start_watching(path):
@@ -132,16 +261,165 @@ def start_watching(path):
 
     observer.join()
 
-def index_existing_files():
-    print("Indexing existing files...")
-    handler = FileHandler()
+# Bulk indexing: extraction runs in a process pool, embedding in large batches
+INDEX_WORKERS = int(os.getenv("SEFS_INDEX_WORKERS", "0")) or max(1, (os.cpu_count() or 2) - 1)
+BULK_EMBED_BATCH = 256          # chunks per encode call during bulk indexing
+BULK_INDEX_MIN_FILES = 8        # smaller backlogs go through the regular pipeline
+PROGRESS_EVERY = 25             # files between progress lines
+
+indexing_progress = {
+    "state": "idle",
+    "total": 0,
+    "done": 0,
+    "chunks": 0,
+    "files_per_sec": 0.0,
+    "chunks_per_sec": 0.0
+}
+
+
+def _pending_index_paths():
+    """
+    Files under ROOT_FOLDER that may need indexing. Only stat fields are
+    compared here; content hashing (touched-but-identical and moved files)
+    happens once, on whichever worker reads the file.
+    """
+    from cluster_engine import find_cluster_id
+
+    paths = []
     for root, _, files in os.walk(ROOT_FOLDER):
         for file in files:
             if file.startswith("."):
                 continue
-                
-            path = os.path.join(root, file)
-            handler.process_file(path)
+            path = os.path.abspath(os.path.join(root, file))
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if file_mtime_cache.get(path) == st.st_mtime:
+                continue
+            if find_cluster_id(path) is not None and manifest.is_unchanged(path, st):
+                file_mtime_cache[path] = st.st_mtime
+                continue
+            paths.append(path)
+    return paths
+
+
+def _report_progress(start):
+    elapsed = max(time.monotonic() - start, 1e-6)
+    indexing_progress["files_per_sec"] = round(indexing_progress["done"] / elapsed, 2)
+    indexing_progress["chunks_per_sec"] = round(indexing_progress["chunks"] / elapsed, 2)
+    print(
+        f"SEFS: Indexed {indexing_progress['done']}/{indexing_progress['total']} files "
+        f"({indexing_progress['files_per_sec']} files/s, {indexing_progress['chunks_per_sec']} chunks/s)"
+    )
+
+
+def _bulk_index(paths):
+    """
+    Extracts files in a process pool (PyMuPDF parsing is CPU-bound), embeds
+    their chunks in large batches and clusters them without naming. Storage
+    is snapshotted once at the end instead of per file.
+    """
+    from cluster_engine import add_files_bulk, remove_file, compact_now
+
+    start = time.monotonic()
+    indexing_progress.update(state="indexing", total=len(paths), done=0, chunks=0)
+    pending = []            # (path, chunks, metadata, fingerprint) waiting for embeddings
+    pending_chunks = 0
+
+    def flush():
+        nonlocal pending, pending_chunks
+        if not pending:
+            return
+        texts = [t for _, chunks, _, _ in pending for t in chunks]
+        embeddings = encode_cached(texts, chunk_cache, batch_size=64)
+
+        items = []
+        offset = 0
+        for path, chunks, metadata, _ in pending:
+            file_embs = embeddings[offset:offset + len(chunks)]
+            offset += len(chunks)
+            chunks_data = [
+                {"text": text, "embedding": emb.tolist()}
+                for text, emb in zip(chunks, file_embs)
+            ]
+            remove_file(path)
+            items.append((path, chunks_data, metadata))
+
+        # One matrix multiply places the whole batch against existing clusters
+        add_files_bulk(items, skip_naming=True)
+        for path, _, _, fp in pending:
+            manifest.record(path, fp)
+
+        done_before = indexing_progress["done"]
+        indexing_progress["done"] += len(pending)
+        indexing_progress["chunks"] += len(texts)
+        if indexing_progress["done"] // PROGRESS_EVERY > done_before // PROGRESS_EVERY:
+            _report_progress(start)
+
+        pending, pending_chunks = [], 0
+
+    print(f"SEFS: Bulk indexing {len(paths)} files with {INDEX_WORKERS} extraction workers...")
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=INDEX_WORKERS, mp_context=ctx) as pool:
+        futures = {pool.submit(prepare_with_fingerprint, path): path for path in paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                chunks, metadata, fp = future.result()
+                file_mtime_cache[path] = os.path.getmtime(path)
+            except Exception as e:
+                print(f"SEFS: Extraction failed for {path}: {e}")
+                chunks = []
+
+            # Unchanged content or a moved file: settled without re-embedding
+            if chunks and _settle_fingerprint(path, fp) is None:
+                chunks = []
+            if not chunks:
+                indexing_progress["done"] += 1
+                continue
+
+            pending.append((path, chunks, metadata, fp))
+            pending_chunks += len(chunks)
+            if pending_chunks >= BULK_EMBED_BATCH:
+                flush()
+    flush()
+
+    # Persist once: fold everything logged during the bulk pass into a snapshot
+    compact_now()
+    manifest.flush()
+    _report_progress(start)
+    indexing_progress["state"] = "idle"
+
+
+def index_existing_files(bulk=True):
+    print("Indexing existing files...")
+    paths = _pending_index_paths()
+
+    if bulk and len(paths) >= BULK_INDEX_MIN_FILES:
+        _bulk_index(paths)
+    else:
+        handler = FileHandler()
+        futures = []
+        for path in paths:
+            future = handler.submit_file(path)
+            if future is not None:
+                futures.append(future)
+
+        # Let the embedding queue batch across files, then wait for all of them
+        for future in futures:
+            try:
+                future.result()
+            except Exception:
+                pass
+
+    # Catch drift between the running centroid sums and the stored chunks
+    from cluster_engine import verify_centroids
+    verify_centroids()
+
+    # Organize folders once for the whole pass
+    sync_folders(ROOT_FOLDER, full=True)
 
-    sync_folders(ROOT_FOLDER)
+    # Long documents get the rest of their chunks once ingest settles
+    coverage_worker.submit_pending(storage)
     print("Initial indexing complete.")
@@ -11,7 +11,7 @@ const api = axios.create({
 });
 
 export const getStatus = () => api.get('/status');
-export const getClusters = () => api.get('/clusters');
+export const getClusters = () => api.get('/clusters', { params: { fields: 'summary' } });
 export const semanticSearch = (query) => api.post('/search', { query });
 export const askAI = (query) => api.post('/ask', { query });
 